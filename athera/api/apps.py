@@ -1,5 +1,7 @@
-import requests
-from athera.api.common import headers, api_debug
+import logging
+import re
+import threading
+from athera.api.common import headers, api_debug, request
 
 route_app_families = "/families"
 route_app          = "/apps/{app_id}"
@@ -9,9 +11,11 @@ def get_app_families(base_url, group_id, token):
     """
     App Families represent high-level products, eg Nuke. This endpoint only returns app families for which the authenticated user has an active Entitlement.
     Response: [403 Forbidden] Incorrect or inaccessible group_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_app_families
-    response = requests.get(url, headers=headers(group_id, token))
+    response = request("GET", url, route_app_families, headers=headers(group_id, token))
     return response
 
 @api_debug
@@ -20,9 +24,160 @@ def get_app(base_url, group_id, token, app_id):
     Apps are children of App Families and are either 'interactive' or 'compute'. They normally have a minor version like 11.2v3.
     Response: [403 Forbidden] Incorrect or inaccessible group_id
     Response: [404 Not Found] Incorrect app_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_app.format(app_id=app_id)
-    response = requests.get(url, headers=headers(group_id, token))
+    response = request("GET", url, route_app, headers=headers(group_id, token))
     return response
 
 
+# CATALOG
+APP_TYPES = ("interactive", "compute")
+NGRAM_SIZE = 3
+
+
+def version_key(version):
+    """
+    Sort key ordering version strings naturally, eg '11.2v3' < '11.2v10' < '12.0v1'
+    """
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part.lower()) for part in re.findall(r"\d+|[^\d.\s]+", version)]
+
+
+def ngrams(text):
+    """
+    All substrings of text up to NGRAM_SIZE characters long
+    """
+    grams = set()
+    for size in range(1, NGRAM_SIZE + 1):
+        for i in range(len(text) - size + 1):
+            grams.add(text[i:i + size])
+    return grams
+
+
+class AppCatalog(object):
+    """
+    A local, indexed copy of the App Families available to a group, so searches and app lookups need no request.
+
+    Family names are indexed by n-gram, so a search intersects a few small sets rather than scanning every name.
+    The catalog can refresh itself in the background; searches keep using the previous indexes until the new ones
+    are complete.
+
+    Usage:
+        catalog = AppCatalog(base_url, group_id, token, refresh_interval=600)
+        families = catalog.search("nuke")
+        app = catalog.get_app(app_id)
+    """
+    def __init__(self, base_url, group_id, token, refresh_interval=None, load=True):
+        self.logger = logging.getLogger("athera.api.apps")
+        self.base_url = base_url
+        self.group_id = group_id
+        self.token = token
+        self.refresh_interval = refresh_interval
+        self.families = {}
+        self.apps = {}
+        self.index = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+        if load:
+            self.refresh()
+        if refresh_interval:
+            self.start()
+
+    def refresh(self):
+        """
+        Fetch the families and rebuild the indexes. Raises requests.HTTPError on failure.
+        """
+        response = get_app_families(self.base_url, self.group_id, self.token)
+        response.raise_for_status()
+        self.load(response.json().get("families", []))
+
+    def load(self, families):
+        """
+        Build the indexes from a list of family json objects, as returned by get_app_families
+        """
+        by_id = {}
+        apps = {}
+        index = {}
+        for family in families:
+            by_id[family["id"]] = family
+            for gram in ngrams(family.get("name", "").lower()):
+                index.setdefault(gram, set()).add(family["id"])
+            for app_type in APP_TYPES:
+                for version, app_id in (family.get("apps") or {}).get(app_type, {}).items():
+                    apps[app_id] = {
+                        "id": app_id,
+                        "type": app_type,
+                        "version": version,
+                        "family_id": family["id"],
+                        "family_name": family.get("name"),
+                    }
+        # Swap all at once so concurrent searches see a consistent catalog
+        self.families, self.apps, self.index = by_id, apps, index
+
+    def search(self, target):
+        """
+        Families whose name contains target, case-insensitive, sorted by name
+        """
+        target = target.lower()
+        families, index = self.families, self.index
+        if not target:
+            candidates = set(families)
+        else:
+            grams = sorted((target[i:i + NGRAM_SIZE] for i in range(max(len(target) - NGRAM_SIZE + 1, 1))),
+                           key=lambda g: len(index.get(g, ())))
+            candidates = set(index.get(grams[0], ()))
+            for gram in grams[1:]:
+                candidates &= index.get(gram, set())
+                if not candidates:
+                    break
+        matches = [families[f] for f in candidates if target in families[f].get("name", "").lower()]
+        return sorted(matches, key=lambda f: f.get("name", "").lower())
+
+    def get_app(self, app_id):
+        """
+        Local equivalent of get_app: a dict of id, type, version, family_id and family_name, or None
+        """
+        return self.apps.get(app_id)
+
+    def get_family(self, family_id):
+        return self.families.get(family_id)
+
+    def versions(self, family_id, app_type):
+        """
+        [(version, app_id)] of one type of a family, newest first
+        """
+        family = self.families.get(family_id) or {}
+        versions = (family.get("apps") or {}).get(app_type, {})
+        return sorted(versions.items(), key=lambda v: version_key(v[0]), reverse=True)
+
+    def latest(self, family_id, app_type):
+        """
+        app_id of the newest version, or None
+        """
+        versions = self.versions(family_id, app_type)
+        return versions[0][1] if versions else None
+
+    def start(self):
+        """
+        Refresh every refresh_interval seconds on a daemon thread
+        """
+        if self.thread:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="AppCatalogRefresh")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        while not self.stop_event.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                self.logger.warning("App catalog refresh failed, keeping previous catalog: %s", e)
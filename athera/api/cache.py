@@ -0,0 +1,261 @@
+"""
+An opt-in HTTP cache for GET requests made by athera.api.
+
+Responses are kept in an in-memory LRU, and optionally in a directory so they survive between processes. Entries are
+keyed by the url (with query parameters), the active group and the token, so users and contexts never share responses.
+Files in the directory are only readable by their owner, and the oldest are removed beyond max_disk_entries. The
+directory may be shared with other files: the cache only touches the files it named.
+
+Freshness follows the Cache-Control header of the response (max-age, no-cache, no-store). When the server sends no
+Cache-Control, the per-endpoint ttl from default_ttls is used, and endpoints missing from it are not cached unless
+the response carries an ETag. Stale entries with an ETag are revalidated with If-None-Match, so a [304 Not Modified]
+avoids downloading the body again.
+
+Usage:
+    from athera.api import cache
+    cache.enable(directory="~/.cache/athera")
+"""
+import base64
+import collections
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import requests
+
+# Seconds to cache responses of endpoints which do not send Cache-Control. Keyed by route.
+default_ttls = {
+    "/families": 3600,
+    "/apps/{app_id}": 3600,
+    "/machine_profiles": 3600,
+    "/groups/{group_id}": 300,
+    "/storage/drivers": 60,
+}
+
+# Names of the files written by HttpCache: the key, or a temporary file named after it
+file_name_pattern = re.compile(r"[0-9a-f]{64}(\..*\.tmp)?$")
+
+CacheEntry = collections.namedtuple("CacheEntry", ["expires", "etag", "status_code", "headers", "content", "url"])
+
+
+def parse_cache_control(value):
+    """
+    Returns (store, max_age) for a Cache-Control header value. max_age is None if absent.
+    """
+    store = True
+    max_age = None
+    for directive in (value or "").lower().split(","):
+        directive = directive.strip()
+        if directive == "no-store":
+            store = False
+        elif directive == "no-cache":
+            max_age = 0
+        else:
+            match = re.match(r"(?:s-)?max-age\s*=\s*(\d+)", directive)
+            if match and max_age is None:
+                max_age = int(match.group(1))
+    return store, max_age
+
+
+class HttpCache(object):
+    """
+    'max_entries':      Size of the in-memory LRU.
+    'directory':        Optional directory for a persistent copy of the entries.
+    'ttls':             {route: seconds} used when responses carry no Cache-Control. Defaults to default_ttls.
+    'max_disk_entries': Number of files kept in 'directory', the least recently written being removed first.
+    """
+    def __init__(self, max_entries=256, directory=None, ttls=None, max_disk_entries=1024):
+        self.logger = logging.getLogger("athera.api.cache")
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.directory = os.path.expanduser(directory) if directory else None
+        self.ttls = default_ttls if ttls is None else ttls
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        if self.directory and not os.path.isdir(self.directory):
+            os.makedirs(self.directory, 0o700)
+
+    @staticmethod
+    def key(url, headers, params=None):
+        parts = [url, json.dumps(params or {}, sort_keys=True)]
+        for name in ("active-group", "Authorization"):
+            parts.append((headers or {}).get(name) or "")
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    # Storage
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                self.entries.move_to_end(key)
+                return entry
+        if self.directory:
+            entry = self.read_file(key)
+            if entry:
+                self.store(key, entry, persist=False)
+            return entry
+        return None
+
+    def store(self, key, entry, persist=True):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        if persist and self.directory:
+            self.write_file(key, entry)
+
+    def read_file(self, key):
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            data["content"] = base64.b64decode(data["content"])
+            return CacheEntry(**data)
+        except (IOError, OSError, ValueError, TypeError, KeyError):
+            return None
+
+    def write_file(self, key, entry):
+        path = os.path.join(self.directory, key)
+        data = entry._asdict()
+        data["content"] = base64.b64encode(entry.content).decode("ascii")
+        try:
+            # Write then rename, so concurrent readers never see a partial file. mkstemp makes the file private to
+            # its owner, with a name unique to this writer.
+            fd, tmp_path = tempfile.mkstemp(prefix=key + ".", suffix=".tmp", dir=self.directory)
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        except (IOError, OSError) as e:
+            self.logger.warning("Could not write cache file %s: %s", path, e)
+            return
+        self.evict_files()
+
+    def cache_files(self):
+        """
+        Paths of the files of the directory written by the cache
+        """
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if file_name_pattern.match(name)]
+
+    def evict_files(self):
+        """
+        Remove the least recently written entries beyond max_disk_entries
+        """
+        paths = [path for path in self.cache_files() if not path.endswith(".tmp")]
+        if len(paths) <= self.max_disk_entries:
+            return
+        def mtime(path):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0
+        for path in sorted(paths, key=mtime)[:len(paths) - self.max_disk_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        if self.directory:
+            for path in self.cache_files():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    # Requests
+    def ttl(self, route, response):
+        """
+        Seconds the response stays fresh, or None if it must not be cached
+        """
+        store, max_age = parse_cache_control(response.headers.get("Cache-Control"))
+        if not store:
+            return None
+        if max_age is not None:
+            return max_age
+        ttl = self.ttls.get(route)
+        if ttl is None and response.headers.get("ETag"):
+            return 0  # Always revalidate, but still avoid downloading unchanged bodies
+        return ttl
+
+    def make_response(self, entry, request):
+        response = requests.Response()
+        response.status_code = entry.status_code
+        response.headers = requests.structures.CaseInsensitiveDict(entry.headers)
+        response._content = entry.content
+        response.url = entry.url
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.request = request
+        response.from_cache = True
+        return response
+
+    def get(self, send, url, route, headers=None, params=None, **kwargs):
+        """
+        Perform a GET through the cache. send(method, url, headers=..., params=..., **kwargs) makes the real request.
+        """
+        key = self.key(url, headers, params)
+        entry = self.lookup(key)
+        now = time.time()
+        if entry and entry.expires > now:
+            with self.lock:
+                self.hits += 1
+            return self.make_response(entry, requests.Request("GET", url, headers=headers, params=params).prepare())
+
+        request_headers = dict(headers or {})
+        if entry and entry.etag:
+            request_headers["If-None-Match"] = entry.etag
+        response = send("GET", url, headers=request_headers, params=params, **kwargs)
+
+        if entry and response.status_code == requests.codes.not_modified:
+            with self.lock:
+                self.revalidations += 1
+            ttl = self.ttl(route, response) or 0
+            entry = entry._replace(expires=time.time() + ttl)
+            self.store(key, entry)
+            return self.make_response(entry, response.request)
+
+        with self.lock:
+            self.misses += 1
+        if response.status_code == requests.codes.ok:
+            ttl = self.ttl(route, response)
+            if ttl is not None:
+                self.store(key, CacheEntry(
+                    time.time() + ttl, response.headers.get("ETag"), response.status_code,
+                    dict(response.headers), response.content, response.url,
+                ))
+        return response
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "revalidations": self.revalidations,
+                "entries": len(self.entries)}
+
+
+def enable(max_entries=256, directory=None, ttls=None, max_disk_entries=1024):
+    """
+    Start caching GET requests made through athera.api. Returns the HttpCache.
+    """
+    from athera.api import common
+    common.http_cache = HttpCache(max_entries, directory, ttls, max_disk_entries)
+    return common.http_cache
+
+
+def disable():
+    from athera.api import common
+    common.http_cache = None
@@ -1,7 +1,17 @@
 """
 Helpers for the Athera API
 """
+import collections
 import os
+import math
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from athera import retry
+from athera.api import rate_limit
+
+# Query parameters used to request a page of a listing. Pages are numbered from 1.
+page_param      = "page"
+page_size_param = "limit"
 
 def headers(group_id, token):
     """
@@ -13,6 +23,84 @@ def headers(group_id, token):
     }
 
 
+# Set by cache.enable() to cache GET requests
+http_cache = None
+# Set by rate_limit.enable() to rate limit requests
+rate_limiter = None
+# Set by single_flight.enable() to coalesce identical concurrent GET requests
+single_flight = None
+
+
+def send(method, url, **kwargs):
+    """
+    Make the actual HTTP request
+    """
+    return requests.request(method, url, **kwargs)
+
+
+# Methods, and (method, route) pairs, which can be repeated without changing the outcome
+idempotent_methods = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+idempotent_routes  = set([
+    ("POST", "/compute/jobs/{job_id}/stop"),
+    ("POST", "/sessions/{session_id}/stop"),
+])
+
+
+def is_idempotent(method, route):
+    return method in idempotent_methods or (method, route) in idempotent_routes
+
+
+def send_limited(method, url, route=None, **kwargs):
+    """
+    send(), waiting for the rate limiter first if one is enabled
+    """
+    limiter = rate_limiter
+    if limiter is None:
+        return send(method, url, **kwargs)
+    group_id = (kwargs.get("headers") or {}).get("active-group")
+    limiter.acquire(route, group_id)
+    response = send(method, url, **kwargs)
+    limiter.feedback(route, group_id, response)
+    return response
+
+
+def send_with_retry(method, url, route=None, **kwargs):
+    """
+    send_limited(), retried according to athera.retry, and circuit broken per route and active group if enabled
+    """
+    return retry.call(
+        lambda: send_limited(method, url, route, **kwargs),
+        route or url,
+        is_idempotent(method, route),
+        retry.classify_http,
+        scope=(kwargs.get("headers") or {}).get("active-group"),
+    )
+
+
+def request(method, url, route=None, **kwargs):
+    """
+    All api calls are made through here, so behaviour shared by every endpoint lives in one place.
+    'route' is the route_* template the url was made from, used to look up per-endpoint settings.
+    Raises retry.CircuitOpenError while the circuit of the route and group is open, if circuit breaking is enabled,
+    and rate_limit.RateLimitTimeout if the rate limiter has a timeout and no token is available within it.
+    """
+    cache, flights = http_cache, single_flight
+
+    def send_route(method, url, **kwargs):
+        return send_with_retry(method, url, route, **kwargs)
+
+    def send_cached(method, url, **kwargs):
+        if cache is None:
+            return send_route(method, url, **kwargs)
+        return cache.get(send_route, url, route, **kwargs)
+
+    if method != "GET":
+        return send_route(method, url, **kwargs)
+    if flights is not None:
+        return flights.get(send_cached, url, route, **kwargs)
+    return send_cached(method, url, **kwargs)
+
+
 def api_debug(func):
     if os.getenv("ATHERA_API_DEBUG"):
         def wrapper(*args, **kwargs):
@@ -23,4 +111,132 @@ def api_debug(func):
         return wrapper
     else:
         return func
-    
\ No newline at end of file
+
+
+# Keys of the 'pagination' object of a listing understood by next_page
+pagination_keys = ("nextPage", "next", "page", "totalPages", "pages", "total", "count", "limit", "pageSize")
+
+
+def next_page(pagination, page, item_count, page_size):
+    """
+    Number of the page after 'page', or None if it was the last one.
+
+    Uses whichever of these the 'pagination' object of a listing provides: an explicit next page, a total page count,
+    or a total item count. Failing those, a short or empty page is the last one. A 'pagination' object with none of
+    the keys below, when no page_size was asked for, gives no way to tell: the listing is taken to be a single page.
+    """
+    if not isinstance(pagination, dict):
+        return None
+    if not page_size and not any(key in pagination for key in pagination_keys):
+        return None
+    for key in ("nextPage", "next"):
+        if key in pagination:
+            value = pagination[key]
+            if not value:
+                return None
+            return value if isinstance(value, int) and not isinstance(value, bool) else page + 1
+
+    page = pagination.get("page", page)
+    total_pages = pagination.get("totalPages", pagination.get("pages"))
+    if total_pages is None:
+        total = pagination.get("total", pagination.get("count"))
+        size = pagination.get("limit", pagination.get("pageSize", page_size))
+        if total is not None and size:
+            total_pages = int(math.ceil(float(total) / size))
+    if total_pages is not None:
+        return page + 1 if page < total_pages else None
+
+    if item_count == 0 or (page_size and item_count < page_size):
+        return None
+    return page + 1
+
+
+def paginate(fetch, key, page_size=None, prefetch=True):
+    """
+    Generator over the items of a paginated listing, fetching pages lazily.
+
+    'fetch': fetch(params) -> Response for the page described by the query params.
+    'key':   Name of the list in the response json, eg 'jobs'.
+    'prefetch': Request the next page in the background while the current one is consumed.
+
+    Stopping iteration early does not fetch the remaining pages. Raises requests.HTTPError if a page fails,
+    retry.CircuitOpenError if its circuit is open, or rate_limit.RateLimitTimeout if it waited too long for a token.
+    """
+    def get(page):
+        params = {page_param: page}
+        if page_size:
+            params[page_size_param] = page_size
+        response = fetch(params)
+        response.raise_for_status()
+        data = response.json()
+        return data.get(key, []), data.get("pagination")
+
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        page = 1
+        items, pagination = get(page)
+        previous_first = None
+        while True:
+            # Servers ignoring the page parameter would otherwise return the first page forever
+            first = items[0].get("id") if items and isinstance(items[0], dict) else None
+            if first is not None and first == previous_first:
+                return
+            previous_first = first
+
+            following = next_page(pagination, page, len(items), page_size)
+            future = executor.submit(get, following) if executor and following else None
+            for item in items:
+                yield item
+            if not following:
+                return
+            page = following
+            items, pagination = future.result() if future else get(page)
+    finally:
+        if executor:
+            executor.shutdown(wait=False)
+
+
+StopResult = collections.namedtuple("StopResult", ["id", "status_code", "error", "status"])
+StopResult.__doc__ = """
+Outcome of stopping one Job or Session with compute.stop_jobs or sessions.stop_sessions.
+'error' is None if the stop request was accepted, otherwise it describes why not. 'status' is the last status seen
+while waiting, or None if not waited for.
+"""
+
+
+def batch_limiter(rate):
+    """
+    TokenBucket starting at most 'rate' requests of a batch per second, or None if 'rate' is None. None as well when
+    rate_limit.enable() is in effect: every request already waits for its shared buckets, which would otherwise be
+    stacked on this one.
+    """
+    if not rate or rate_limiter is not None:
+        return None
+    return rate_limit.TokenBucket(rate, burst=1)
+
+
+def bulk_stop(stop, ids, max_workers=8, rate=10):
+    """
+    Call stop(id) -> Response for each of 'ids' concurrently, returning a StopResult per id, in the same order.
+
+    'max_workers': Maximum number of requests in flight.
+    'rate':        Maximum number of requests started per second. None for no limit. See batch_limiter.
+
+    Each request is retried as configured in athera.retry, stop requests being idempotent. Connection errors, open
+    circuits and rate limit timeouts are reported as the error of their StopResult.
+    """
+    limiter = batch_limiter(rate)
+
+    def call(item_id):
+        if limiter:
+            limiter.acquire()
+        try:
+            response = stop(item_id)
+        except (requests.RequestException, retry.CircuitOpenError, rate_limit.RateLimitTimeout) as e:
+            return StopResult(item_id, None, str(e), None)
+        if response.status_code != requests.codes.ok:
+            return StopResult(item_id, response.status_code, response.text or "Stop failed", None)
+        return StopResult(item_id, response.status_code, None, None)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(call, ids))
@@ -1,5 +1,9 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from athera.api.common import headers, api_debug
+from athera import retry
+from athera.api import rate_limit
+from athera.api.common import headers, api_debug, request, paginate, bulk_stop, batch_limiter
 
 route_jobs     = "/compute/jobs"
 route_job      = "/compute/jobs/{job_id}"
@@ -7,6 +11,16 @@ route_job_stop = "/compute/jobs/{job_id}/stop"
 route_parts    = "/compute/jobs/{job_id}/parts"
 route_part     = "/compute/jobs/{job_id}/parts/{part_id}"
 
+# Job and Part statuses. Other statuses are not known to be final, see watch.Watcher.
+pending_status   = ["CREATED"]
+active_status    = ["ACTIVE", "READY"]
+completed_status = ["COMPLETE"]
+failed_status    = ["FAILED"]
+canceled_status  = ["CANCELED"]
+
+# Statuses after which nothing more will happen
+terminal_status = completed_status + failed_status + canceled_status
+
 def make_job_request(user_id, group_id, app_id, file_path, name, 
                      frame_start, frame_finish, frame_increment, region, arguments,
                      profile_id="", part_count=1, node_count=1):
@@ -31,24 +45,35 @@ def make_job_request(user_id, group_id, app_id, file_path, name,
     }
 
 @api_debug
-def get_jobs(base_url, group_id, token):
+def get_jobs(base_url, group_id, token, params=None):
     """
     Get all Compute Jobs for the provided Group
+    'params': Optional query parameters, eg a page (see iter_jobs)
     Response: [403 Forbidden] Incorrect or inaccessible group_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_jobs
-    response = requests.get(url, headers=headers(group_id, token))
+    response = request("GET", url, route_jobs, headers=headers(group_id, token), params=params)
     return response
 
+def iter_jobs(base_url, group_id, token, page_size=None, prefetch=True):
+    """
+    Generator over all Compute Jobs of the provided Group, following pagination. See common.paginate.
+    """
+    return paginate(lambda params: get_jobs(base_url, group_id, token, params=params), "jobs", page_size, prefetch)
+
 @api_debug
 def get_job(base_url, group_id, token, job_id):
     """
     Get a single Compute Job, which must belong to the provided Group
     Response: [403 Forbidden] Incorrect or inaccessible group_id
     Response: [404 Not Found] Incorrect job_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_job.format(job_id=job_id)
-    response = requests.get(url, headers=headers(group_id, token))
+    response = request("GET", url, route_job, headers=headers(group_id, token))
     return response
 
 @api_debug
@@ -57,9 +82,11 @@ def create_job(base_url, group_id, token, payload):
     Start a compute Job with the provided payload description
     Response: [403 Forbidden] Incorrect or inaccessible group_id
     Response: [400 Bad Request] Malformed payload
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_jobs
-    response = requests.post(url, headers=headers(group_id, token), json=payload, allow_redirects=False)
+    response = request("POST", url, route_jobs, headers=headers(group_id, token), json=payload, allow_redirects=False)
     return response
 
 @api_debug
@@ -68,9 +95,11 @@ def stop_job(base_url, group_id, token, job_id):
     Stop a job in the ACTIVE/READY state
     Response: [403 Forbidden] Incorrect or inaccessible group_id
     Response: [404 Not Found] Incorrect job_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_job_stop.format(job_id=job_id)
-    response = requests.post(url, headers=headers(group_id, token))
+    response = request("POST", url, route_job_stop, headers=headers(group_id, token))
     return response
 
 @api_debug
@@ -79,9 +108,11 @@ def get_parts(base_url, group_id, token, job_id):
     Get all Compute Parts for the provided Job, which must belong to the provided Group
     Response: [403 Forbidden] Incorrect or inaccessible group_id
     Response: [404 Not Found] Incorrect job_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_parts.format(job_id=job_id)
-    response = requests.get(url, headers=headers(group_id, token))
+    response = request("GET", url, route_parts, headers=headers(group_id, token))
     return response
 
 @api_debug
@@ -90,9 +121,171 @@ def get_part(base_url, group_id, token, job_id, part_id):
     Get a single Compute Part for the provided Job, which must belong to the provided Group
     Response: [403 Forbidden] Incorrect or inaccessible group_id
     Response: [404 Not Found] Incorrect job_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_part.format(job_id=job_id, part_id=part_id)
-    response = requests.get(url, headers=headers(group_id, token))
+    response = request("GET", url, route_part, headers=headers(group_id, token))
     return response
 
 
+# BATCH SUBMISSION
+JobSubmissionResult = collections.namedtuple("JobSubmissionResult", ["index", "name", "job_id", "status_code", "error"])
+JobSubmissionResult.__doc__ = """
+Outcome of one payload passed to submit_jobs. 'index' is its position in the input list.
+'job_id' is None if the job was not created, in which case 'error' describes why.
+"""
+
+
+def count_frames(frame_start, frame_finish, frame_increment):
+    """
+    Number of frames rendered for the (inclusive) frame range
+    """
+    if frame_increment < 1 or frame_finish < frame_start:
+        return 0
+    return (frame_finish - frame_start) // frame_increment + 1
+
+
+def split_frame_range(frame_start, frame_finish, frame_increment, frames_per_part):
+    """
+    Split an inclusive frame range into consecutive (start, finish) ranges of at most frames_per_part frames each.
+    Every range starts on a frame of the original sequence, so the increment is preserved.
+    """
+    if frames_per_part < 1:
+        raise ValueError("frames_per_part must be at least 1")
+    frame_count = count_frames(frame_start, frame_finish, frame_increment)
+    ranges = []
+    for first in range(0, frame_count, frames_per_part):
+        last = min(first + frames_per_part, frame_count) - 1
+        ranges.append((frame_start + first * frame_increment, frame_start + last * frame_increment))
+    return ranges
+
+
+def split_job_request(payload, frames_per_part, max_parts_per_job=None):
+    """
+    Set the part count of a payload made by make_job_request so that each part renders around frames_per_part frames.
+
+    If that needs more than max_parts_per_job parts, the frame range is divided into several payloads instead,
+    named '<name>_<n>'. Returns a list of payloads.
+    """
+    compute_data = payload["computeData"]
+    frame_range = compute_data["frameRange"]
+    increment = frame_range["increment"]
+    frames_per_job = None
+    if max_parts_per_job:
+        frames_per_job = frames_per_part * max_parts_per_job
+
+    job_ranges = [(frame_range["start"], frame_range["finish"])]
+    if frames_per_job and count_frames(frame_range["start"], frame_range["finish"], increment) > frames_per_job:
+        job_ranges = split_frame_range(frame_range["start"], frame_range["finish"], increment, frames_per_job)
+
+    payloads = []
+    for i, (start, finish) in enumerate(job_ranges):
+        part_count = len(split_frame_range(start, finish, increment, frames_per_part))
+        name = compute_data["name"] if len(job_ranges) == 1 else "{}_{}".format(compute_data["name"], i + 1)
+        payloads.append(make_job_request(
+            compute_data["userID"], compute_data["groupID"], compute_data["appID"], compute_data["filePath"], name,
+            start, finish, increment, compute_data["region"], compute_data["arguments"],
+            profile_id=compute_data["profileID"],
+            part_count=max(part_count, 1),
+            node_count=min(payload["nodeCount"], max(part_count, 1)),
+        ))
+    return payloads
+
+
+def validate_job_request(payload):
+    """
+    Check a payload made by make_job_request before sending it, to avoid round trips which can only fail with
+    [400 Bad Request]. Returns a list of problems, empty if the payload looks valid.
+    """
+    errors = []
+    compute_data = payload.get("computeData")
+    if not compute_data:
+        return ["computeData is missing"]
+
+    for key in ("userID", "groupID", "appID", "filePath", "name", "region"):
+        if not compute_data.get(key):
+            errors.append("computeData.{} is missing".format(key))
+
+    frame_range = compute_data.get("frameRange") or {}
+    try:
+        frame_count = count_frames(frame_range["start"], frame_range["finish"], frame_range["increment"])
+        if frame_count == 0:
+            errors.append("frameRange {start}-{finish}x{increment} contains no frames".format(**frame_range))
+    except (KeyError, TypeError):
+        errors.append("frameRange must have integer start, finish and increment")
+        frame_count = None
+
+    part_count = payload.get("partCount")
+    node_count = payload.get("nodeCount")
+    if not isinstance(part_count, int) or part_count < 1:
+        errors.append("partCount must be a positive integer")
+    elif frame_count and part_count > frame_count:
+        errors.append("partCount {} is greater than the number of frames {}".format(part_count, frame_count))
+    if not isinstance(node_count, int) or node_count < 1:
+        errors.append("nodeCount must be a positive integer")
+    return errors
+
+
+def submit_jobs(base_url, group_id, token, payloads, max_workers=8, rate=10):
+    """
+    Validate and create many compute Jobs concurrently.
+
+    'payloads':    A list of payloads made by make_job_request (or split_job_request).
+    'max_workers': Maximum number of create_job requests in flight.
+    'rate':        Maximum number of create_job requests started per second. None for no limit. Ignored while
+                   rate_limit.enable() is in effect, see common.batch_limiter.
+
+    Invalid payloads are not sent. Connection errors, open circuits and rate limit timeouts are reported as the error
+    of their JobSubmissionResult. Returns a list of JobSubmissionResult, in the same order as 'payloads'.
+    """
+    limiter = batch_limiter(rate)
+
+    def submit(index, payload):
+        name = payload.get("computeData", {}).get("name")
+        errors = validate_job_request(payload)
+        if errors:
+            return JobSubmissionResult(index, name, None, None, "; ".join(errors))
+
+        if limiter:
+            limiter.acquire()
+        try:
+            response = create_job(base_url, group_id, token, payload)
+        except (requests.RequestException, retry.CircuitOpenError, rate_limit.RateLimitTimeout) as e:
+            return JobSubmissionResult(index, name, None, None, str(e))
+
+        if response.status_code != requests.codes.ok:
+            return JobSubmissionResult(index, name, None, response.status_code, response.text)
+        try:
+            job_id = response.json()["id"]
+        except (ValueError, KeyError) as e:
+            return JobSubmissionResult(index, name, None, response.status_code, "Unexpected response: {}".format(e))
+        return JobSubmissionResult(index, name, job_id, response.status_code, None)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(submit, i, payload) for i, payload in enumerate(payloads)]
+        return [f.result() for f in futures]
+
+
+def stop_jobs(base_url, group_id, token, job_ids, max_workers=8, rate=10, wait=False, timeout=600, **kwargs):
+    """
+    Stop many compute Jobs concurrently, eg to abort a broken submit_jobs.
+
+    'max_workers', 'rate': Bounds on the stop requests, see common.bulk_stop.
+    'wait':    Then wait, up to 'timeout' seconds, for the stopped Jobs to reach a terminal_status. All of them are
+               followed by a single watch.Watcher, created with any other keyword arguments.
+
+    Returns a list of common.StopResult, in the same order as 'job_ids'. A 'status' not in terminal_status means the
+    timeout expired first.
+    """
+    results = bulk_stop(lambda job_id: stop_job(base_url, group_id, token, job_id), job_ids, max_workers, rate)
+    if not wait:
+        return results
+
+    from athera.api import watch  # watch depends on this module
+    watcher = watch.Watcher(base_url, group_id, token, max_workers=max_workers, **kwargs)
+    for result in results:
+        if result.error is None:
+            watcher.watch_job(result.id)
+    watcher.wait(timeout)
+    return [r._replace(status=watcher.status(watch.KIND_JOB, r.id)) if r.error is None else r for r in results]
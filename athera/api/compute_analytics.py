@@ -0,0 +1,256 @@
+"""
+Render cost and duration analytics over the Part history of compute Jobs.
+
+PartHistory fetches the Parts of many Jobs concurrently and keeps one row per finished Part in columns (NumPy arrays
+when NumPy is installed, array.array otherwise). Summaries group the rows by app and/or machine profile, giving
+throughput, percentile Part durations and failure rates. Only completed Parts are timed; canceled Parts are counted
+apart, as neither completed nor failed.
+
+Updates are incremental: a Job whose Parts were fetched once it had reached a terminal status is never fetched again,
+so re-running an update only costs requests for new and still running Jobs. The history can be saved to a JSON file
+between runs.
+
+Usage:
+    history = PartHistory.load("parts.json")
+    history.update(base_url, group_id, token)
+    history.save("parts.json")
+    for (app_id, profile_id), stats in history.summary().items():
+        print(app_id, profile_id, stats.seconds_per_frame, stats.p90_seconds, stats.failure_rate)
+"""
+import array
+import collections
+import json
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from athera.lazy import lazy_import, MissingModule
+from athera.api import compute, compute_planner
+
+numpy = lazy_import("numpy")
+
+# Columns of the history. Strings are stored as indices into PartHistory.labels.
+COLUMNS = ("app", "profile", "frames", "seconds", "failed", "canceled")
+GROUP_KEYS = {"app": "app", "app_id": "app", "profile": "profile", "profile_id": "profile"}
+
+GroupStats = collections.namedtuple("GroupStats", [
+    "parts", "failed_parts", "canceled_parts", "failure_rate", "frames", "seconds",
+    "frames_per_hour", "seconds_per_frame", "p50_seconds", "p90_seconds", "p99_seconds",
+])
+GroupStats.__doc__ = """
+Statistics of the Parts of one group. 'failure_rate' is failed_parts over the Parts which were not canceled.
+Durations and throughput only count Parts which completed with a known duration; they are None when there are none.
+"""
+
+
+def use_numpy():
+    return not isinstance(numpy, MissingModule)
+
+
+def part_row(part):
+    """
+    (frames, seconds, failed, canceled) for a Part in a terminal status, or None if it is still running.
+    Unknown frame counts and durations are given as 0 and None. Only completed Parts have a duration.
+    """
+    status = part.get("status")
+    if status not in compute.terminal_status:
+        return None
+    frames = compute_planner.get_part_frames(part) or 0
+    seconds = compute_planner.get_part_seconds(part) if status in compute.completed_status else None
+    return frames, seconds, status in compute.failed_status, status in compute.canceled_status
+
+
+class PartHistory(object):
+    """
+    Finished Parts of compute Jobs, in columns.
+
+    'jobs':   {job_id: {"status", "app", "profile", "rows": [(frames, seconds, failed, canceled), ...]}}
+    'labels': Strings of the app and profile columns, indexed by their value.
+    """
+    def __init__(self, jobs=None):
+        self.logger = logging.getLogger("athera.api.compute_analytics")
+        self.jobs = jobs or {}
+        self.labels = []
+        self._columns = None
+
+    @classmethod
+    def load(cls, path):
+        """
+        A PartHistory saved with save(), or an empty one if 'path' does not exist yet
+        """
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r") as f:
+            jobs = json.load(f)
+        for job in jobs.values():
+            job["rows"] = [tuple(row) for row in job["rows"]]
+        return cls(jobs)
+
+    def save(self, path):
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(self.jobs, f)
+        os.replace(tmp_path, path)
+
+    def needs_fetch(self, job):
+        """
+        True if the Parts of this job (as listed by get_jobs) may have changed since they were last fetched
+        """
+        known = self.jobs.get(job["id"])
+        return known is None or known["status"] not in compute.terminal_status or known["status"] != job.get("status")
+
+    def update(self, base_url, group_id, token, jobs=None, max_workers=8):
+        """
+        Fetch the Parts of new and changed Jobs concurrently.
+
+        'jobs': The Jobs to consider, as returned by get_jobs. Defaults to every Job of the group (compute.iter_jobs).
+
+        Returns the number of Jobs fetched. Jobs whose Parts cannot be fetched are left as they were, to be retried by
+        the next update.
+        """
+        if jobs is None:
+            jobs = compute.iter_jobs(base_url, group_id, token)
+        jobs = [job for job in jobs if job.get("id") and self.needs_fetch(job)]
+
+        def fetch(job):
+            try:
+                response = compute.get_parts(base_url, group_id, token, job["id"])
+            except Exception as e:
+                self.logger.warning("Could not fetch parts of %s: %s", job["id"], e)
+                return None
+            if response.status_code != 200:
+                self.logger.warning("Could not fetch parts of %s: [%s]", job["id"], response.status_code)
+                return None
+            return response.json().get("parts", [])
+
+        fetched = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for job, parts in zip(jobs, executor.map(fetch, jobs)):
+                if parts is None:
+                    continue
+                compute_data = job.get("computeData") or {}
+                self.jobs[job["id"]] = {
+                    "status": job.get("status"),
+                    "app": compute_data.get("appID") or "",
+                    "profile": compute_data.get("profileID") or "",
+                    "rows": [row for row in map(part_row, parts) if row],
+                }
+                fetched += 1
+        if fetched:
+            self._columns = None
+        return fetched
+
+    # Columns
+    def columns(self):
+        """
+        {column: array} over every row, see COLUMNS. Built on first use after each update.
+        """
+        if self._columns is not None:
+            return self._columns
+        label_index = {}
+        self.labels = []
+
+        def label(value):
+            if value not in label_index:
+                label_index[value] = len(self.labels)
+                self.labels.append(value)
+            return label_index[value]
+
+        columns = dict((name, array.array("d" if name == "seconds" else "l")) for name in COLUMNS)
+        for job in self.jobs.values():
+            rows = job["rows"]
+            if not rows:
+                continue
+            app, profile = label(job["app"]), label(job["profile"])
+            columns["app"].extend([app] * len(rows))
+            columns["profile"].extend([profile] * len(rows))
+            for frames, seconds, failed, canceled in rows:
+                columns["frames"].append(int(frames))
+                columns["seconds"].append(float("nan") if seconds is None else seconds)
+                columns["failed"].append(1 if failed else 0)
+                columns["canceled"].append(1 if canceled else 0)
+
+        if use_numpy():
+            columns = dict((name, numpy.asarray(values)) for name, values in columns.items())
+        self._columns = columns
+        return columns
+
+    def __len__(self):
+        return len(self.columns()["frames"])
+
+    # Statistics
+    def summary(self, by=("app", "profile")):
+        """
+        {group: GroupStats}, grouping rows by the columns in 'by' ("app" and/or "profile"). Groups are tuples of app_id
+        and/or profile_id, in the order of 'by'. by=() gives a single group, ().
+        """
+        keys = [GROUP_KEYS[k] for k in by]
+        columns = self.columns()
+        if use_numpy():
+            return self._summary_numpy(columns, keys)
+
+        groups = collections.defaultdict(list)
+        for i in range(len(columns["frames"])):
+            groups[tuple(columns[k][i] for k in keys)].append(i)
+        result = {}
+        for group, rows in groups.items():
+            done = [i for i in rows if not columns["failed"][i] and not math.isnan(columns["seconds"][i])]
+            result[self._label(group)] = make_stats(
+                len(rows),
+                sum(columns["failed"][i] for i in rows),
+                sum(columns["canceled"][i] for i in rows),
+                [columns["frames"][i] for i in done],
+                [columns["seconds"][i] for i in done],
+            )
+        return result
+
+    def _summary_numpy(self, columns, keys):
+        result = {}
+        if not len(columns["frames"]):
+            return result
+        if keys:
+            stacked = numpy.stack([columns[k] for k in keys], axis=1)
+            groups, inverse = numpy.unique(stacked, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+        else:
+            groups, inverse = numpy.zeros((1, 0), dtype=numpy.int_), numpy.zeros(len(columns["frames"]), dtype=numpy.int_)
+        done = (columns["failed"] == 0) & ~numpy.isnan(columns["seconds"])
+        for index, group in enumerate(groups):
+            rows = inverse == index
+            selected = rows & done
+            result[self._label(tuple(int(g) for g in group))] = make_stats(
+                int(rows.sum()),
+                int(columns["failed"][rows].sum()),
+                int(columns["canceled"][rows].sum()),
+                columns["frames"][selected],
+                columns["seconds"][selected],
+            )
+        return result
+
+    def _label(self, group):
+        return tuple(self.labels[value] for value in group)
+
+
+def make_stats(parts, failed_parts, canceled_parts, frames, seconds):
+    """
+    GroupStats from the counts of a group and the frames and seconds of its completed Parts
+    """
+    if use_numpy():
+        total_frames, total_seconds = int(numpy.sum(frames)), float(numpy.sum(seconds))
+        p50, p90, p99 = [float(p) for p in numpy.percentile(seconds, [50, 90, 99])] if len(seconds) else (None, None, None)
+    else:
+        total_frames, total_seconds = int(sum(frames)), float(sum(seconds))
+        p50, p90, p99 = [compute_planner.percentile(seconds, f) if seconds else None for f in (0.5, 0.9, 0.99)]
+    return GroupStats(
+        parts=parts,
+        failed_parts=failed_parts,
+        canceled_parts=canceled_parts,
+        failure_rate=float(failed_parts) / (parts - canceled_parts) if parts > canceled_parts else None,
+        frames=total_frames,
+        seconds=total_seconds,
+        frames_per_hour=total_frames * 3600.0 / total_seconds if total_seconds else None,
+        seconds_per_frame=total_seconds / total_frames if total_frames else None,
+        p50_seconds=p50,
+        p90_seconds=p90,
+        p99_seconds=p99,
+    )
@@ -0,0 +1,205 @@
+"""
+Helpers to choose the part_count, node_count and profile_id given to compute.make_job_request.
+
+The frame range of a Job is divided server-side between its Parts (see the placeholders in compute_arguments), and the
+Parts are shared between its nodes. Too few parts leaves nodes idle, too many wastes time starting the app for each part.
+
+Estimates are made from the timings of the Parts of previous, similar Jobs (compute.get_parts).
+"""
+import collections
+import math
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from athera.api import compute
+
+# Part fields holding the start and end of its execution. The first one present is used.
+PART_START_KEYS = ("startedAt", "startTime", "started")
+PART_END_KEYS   = ("completedAt", "finishedAt", "endTime", "finished")
+
+# Parts longer than this are hard to retry and give poor progress feedback
+DEFAULT_MAX_PART_SECONDS = 3600
+# Time for a node to start the app and load the scene before the first frame renders
+DEFAULT_PART_OVERHEAD_SECONDS = 60
+
+PartTiming = collections.namedtuple("PartTiming", ["frames", "seconds"])
+
+ProfileOption = collections.namedtuple("ProfileOption", ["profile_id", "speed", "cost_per_hour"])
+ProfileOption.__doc__ = """
+A machine profile to consider. 'speed' is relative to the profile the part timings were measured on (2.0 renders a
+frame in half the time). 'cost_per_hour' is per node and only used to rank profiles.
+"""
+
+JobPlan = collections.namedtuple("JobPlan", [
+    "part_count", "node_count", "profile_id", "frames_per_part",
+    "part_seconds", "duration_seconds", "node_seconds", "meets_deadline",
+])
+
+
+def parse_timestamp(value):
+    """
+    Seconds since the epoch for an ISO 8601 string ('2019-01-01T12:00:00.123Z') or a number. None if unparseable.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        text = value.replace("Z", "+00:00")
+        # fromisoformat only accepts 3 or 6 digit fractions before Python 3.11
+        if "." in text:
+            head, tail = text.split(".", 1)
+            digits = len(tail) - len(tail.lstrip("0123456789"))
+            text = "{}.{:0<6.6}{}".format(head, tail[:digits], tail[digits:])
+        return datetime.fromisoformat(text).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_part_frames(part):
+    """
+    Number of frames rendered by a part, from its frameRange. None if unknown.
+    """
+    frame_range = part.get("frameRange")
+    if not frame_range:
+        return None
+    try:
+        return compute.count_frames(frame_range["start"], frame_range["finish"], frame_range.get("increment", 1))
+    except (KeyError, TypeError):
+        return None
+
+
+def get_part_seconds(part):
+    """
+    Wall clock duration of a finished part. None if it has not finished.
+    """
+    start = next((parse_timestamp(part[k]) for k in PART_START_KEYS if part.get(k)), None)
+    end = next((parse_timestamp(part[k]) for k in PART_END_KEYS if part.get(k)), None)
+    if start is None or end is None or end < start:
+        return None
+    return end - start
+
+
+def get_part_timing(part):
+    """
+    PartTiming for a finished part, or None. The status of the part is not checked.
+    """
+    frames = get_part_frames(part)
+    seconds = get_part_seconds(part)
+    if not frames or seconds is None:
+        return None
+    return PartTiming(frames, seconds)
+
+
+def fetch_part_timings(base_url, group_id, token, job_ids, max_workers=8):
+    """
+    Fetch the parts of previous jobs concurrently, returning the PartTiming of each completed part (see
+    compute.completed_status). Failed and canceled parts did not render their frames and are left out.
+    Jobs which cannot be fetched are skipped.
+    """
+    def fetch(job_id):
+        response = compute.get_parts(base_url, group_id, token, job_id)
+        if response.status_code != 200:
+            return []
+        return response.json().get("parts", [])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        parts = [p for job_parts in executor.map(fetch, job_ids) for p in job_parts
+                 if p.get("status") in compute.completed_status]
+    return [t for t in map(get_part_timing, parts) if t]
+
+
+def percentile(values, fraction):
+    """
+    Linear interpolated percentile of a list of numbers, fraction in [0, 1]
+    """
+    ordered = sorted(values)
+    if not ordered:
+        raise ValueError("percentile of an empty list")
+    position = (len(ordered) - 1) * fraction
+    low = int(math.floor(position))
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def estimate_frame_cost(timings, overhead_seconds=DEFAULT_PART_OVERHEAD_SECONDS, fraction=0.75):
+    """
+    Estimate (seconds_per_frame, overhead_seconds) from part timings.
+
+    When the parts rendered different numbers of frames, the fixed per-part overhead is fitted with a least squares
+    line. Otherwise 'overhead_seconds' is assumed. The per-frame cost is taken at the given percentile of the parts,
+    rather than the mean, so that a plan is not ruined by a few slow frames.
+    """
+    if not timings:
+        raise ValueError("No part timings to estimate from")
+
+    frames = [float(t.frames) for t in timings]
+    seconds = [float(t.seconds) for t in timings]
+    if len(set(frames)) > 1:
+        mean_f = sum(frames) / len(frames)
+        mean_s = sum(seconds) / len(seconds)
+        covariance = sum((f - mean_f) * (s - mean_s) for f, s in zip(frames, seconds))
+        variance = sum((f - mean_f) ** 2 for f in frames)
+        slope = covariance / variance
+        intercept = mean_s - slope * mean_f
+        if slope > 0 and intercept >= 0:
+            overhead_seconds = intercept
+
+    per_frame = [max(s - overhead_seconds, 0) / f for f, s in zip(frames, seconds)]
+    return percentile(per_frame, fraction), overhead_seconds
+
+
+def plan_for_profile(frame_count, seconds_per_frame, overhead_seconds, deadline_seconds,
+                     profile=None, max_nodes=100, max_part_seconds=DEFAULT_MAX_PART_SECONDS):
+    """
+    Cheapest plan (fewest nodes) for one profile which finishes within deadline_seconds.
+    If no plan can, the fastest plan is returned with meets_deadline False.
+    """
+    speed = profile.speed if profile else 1.0
+    frame_seconds = seconds_per_frame / speed
+    usable_seconds = max(max_part_seconds - overhead_seconds, frame_seconds)
+    # Fewest parts keeping each one under max_part_seconds
+    min_parts = min(frame_count, max(1, int(math.ceil(frame_count * frame_seconds / usable_seconds))))
+
+    best = None
+    for node_count in range(1, min(max_nodes, frame_count) + 1):
+        # Give every node the same number of parts, so none sit idle at the end
+        waves = int(math.ceil(float(min_parts) / node_count))
+        part_count = min(frame_count, node_count * waves)
+        frames_per_part = int(math.ceil(float(frame_count) / part_count))
+        part_seconds = overhead_seconds + frames_per_part * frame_seconds
+        duration = int(math.ceil(float(part_count) / node_count)) * part_seconds
+        plan = JobPlan(
+            part_count, node_count, profile.profile_id if profile else "", frames_per_part,
+            part_seconds, duration, part_count * part_seconds, duration <= deadline_seconds,
+        )
+        if plan.meets_deadline:
+            return plan
+        if best is None or plan.duration_seconds < best.duration_seconds:
+            best = plan
+    return best
+
+
+def plan_job(frame_start, frame_finish, frame_increment, timings, deadline_seconds, profiles=None,
+             max_nodes=100, max_part_seconds=DEFAULT_MAX_PART_SECONDS, overhead_seconds=DEFAULT_PART_OVERHEAD_SECONDS):
+    """
+    Recommend part_count, node_count and profile_id for a frame range.
+
+    'timings':          PartTimings of similar previous jobs, see fetch_part_timings.
+    'deadline_seconds': Wall clock time the job should finish within, once nodes are running.
+    'profiles':         Optional list of ProfileOption to choose from. The cheapest meeting the deadline is chosen,
+                        or the fastest if none can.
+
+    Returns a JobPlan.
+    """
+    frame_count = compute.count_frames(frame_start, frame_finish, frame_increment)
+    if frame_count == 0:
+        raise ValueError("Frame range {}-{}x{} contains no frames".format(frame_start, frame_finish, frame_increment))
+
+    seconds_per_frame, overhead_seconds = estimate_frame_cost(timings, overhead_seconds)
+    plans = []
+    for profile in profiles or [None]:
+        plan = plan_for_profile(frame_count, seconds_per_frame, overhead_seconds, deadline_seconds,
+                                profile, max_nodes, max_part_seconds)
+        cost = plan.node_seconds * (profile.cost_per_hour if profile and profile.cost_per_hour else 1)
+        plans.append((not plan.meets_deadline, cost if plan.meets_deadline else plan.duration_seconds, plan))
+    return min(plans, key=lambda p: p[:2])[2]
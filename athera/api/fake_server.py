@@ -0,0 +1,416 @@
+"""
+An in-process stand-in for the Athera REST API, serving the routes of athera.api from memory.
+
+It is meant for tests and load tests of the client: pagination, caching, retries, rate limiting and concurrency can be
+exercised offline. Latency, page sizes and errors can be configured, and every request is counted per route.
+
+Jobs, Parts, Sessions, groups, storage drivers, app families and machine profiles are held in plain dicts shaped like
+the api responses, and can be added directly or through the api itself (create_job, start_session...).
+
+Usage:
+    with FakeApiServer(latency=0.01, page_size=50) as server:
+        server.api.add_job({"status": "ACTIVE"}, part_count=4)
+        response = compute.get_jobs(server.base_url, "group", "token")
+"""
+import collections
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from athera.api import apps, compute, groups, machine_profiles, sessions, storage
+from athera.api.common import page_param, page_size_param
+
+
+def route_pattern(route):
+    """
+    '/compute/jobs/{job_id}' -> regex matching '/compute/jobs/abc' with the group job_id
+    """
+    return re.compile("^" + re.sub(r"\\\{(\w+)\\\}", r"(?P<\1>[^/]+)", re.escape(route)) + "$")
+
+
+class FakeApi(object):
+    """
+    State and request handling of the fake api.
+
+    'latency':      Seconds added before each response.
+    'page_size':    Page size of listings when the client does not ask for one. None returns everything at once.
+    'error_rate':   Fraction of requests answered with 'error_status' without doing anything.
+    'error_status': HTTP status of injected errors, [503 Service Unavailable] by default so they are retried.
+    'retry_after':  Optional Retry-After header of injected errors, in seconds.
+    'indexing_seconds': Time a rescan of a storage driver stays in progress.
+    'seed':         Seed of the random error injection, for reproducible runs.
+    """
+    def __init__(self, latency=0.0, page_size=None, error_rate=0.0, error_status=503, retry_after=None,
+                 indexing_seconds=0.0, seed=None):
+        self.logger = logging.getLogger("athera.api.fake_server")
+        self.latency = latency
+        self.page_size = page_size
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.indexing_seconds = indexing_seconds
+        self.random = random.Random(seed)
+        # Reentrant, as handlers run with it held and may call the add_* methods
+        self.lock = threading.RLock()
+        self.ids = itertools.count(1)
+        self.forced_errors = collections.deque()
+        self.requests = collections.Counter()  # (method, route) -> count
+
+        self.jobs = collections.OrderedDict()
+        self.parts = {}  # job_id -> OrderedDict of parts
+        self.sessions = collections.OrderedDict()
+        self.groups = collections.OrderedDict()
+        self.children = collections.defaultdict(list)  # group_id -> child group ids
+        self.users = collections.defaultdict(list)  # group_id -> users
+        self.drivers = collections.OrderedDict()
+        self.indexing = {}  # driver_id -> (path, finished at)
+        self.families = collections.OrderedDict()
+        self.apps = {}
+        self.machine_profiles = []
+
+        self.routes = [(method, route, route_pattern(route), handler) for method, route, handler in [
+            ("GET", compute.route_jobs, self.get_jobs),
+            ("POST", compute.route_jobs, self.create_job),
+            ("GET", compute.route_job, self.get_job),
+            ("POST", compute.route_job_stop, self.stop_job),
+            ("GET", compute.route_parts, self.get_parts),
+            ("GET", compute.route_part, self.get_part),
+            ("GET", sessions.route_user_sessions, self.get_user_sessions),
+            ("GET", sessions.route_session, self.get_session),
+            ("POST", sessions.route_sessions, self.start_session),
+            ("POST", sessions.route_session_stop, self.stop_session),
+            ("GET", groups.route_orgs, self.get_orgs),
+            ("GET", groups.route_group, self.get_group),
+            ("GET", groups.route_group_children, self.get_group_children),
+            ("GET", groups.route_group_users, self.get_group_users),
+            ("GET", storage.route_drivers, self.get_drivers),
+            ("POST", storage.route_driver, self.create_driver),
+            ("GET", storage.route_driver_id, self.get_driver),
+            ("POST", storage.route_driver_id, self.driver_action),
+            ("DELETE", storage.route_driver_id, self.delete_driver),
+            ("GET", apps.route_app_families, self.get_app_families),
+            ("GET", apps.route_app, self.get_app),
+            ("GET", machine_profiles.route_machine_profiles, self.get_machine_profiles),
+        ]]
+
+    def new_id(self, prefix):
+        return "{}-{}".format(prefix, next(self.ids))
+
+    def fail_next(self, count=1, status=None):
+        """
+        Answer the next 'count' requests with 'status' (error_status by default)
+        """
+        with self.lock:
+            self.forced_errors.extend([status or self.error_status] * count)
+
+    # Data
+    def add_job(self, job=None, part_count=0, part_status=None):
+        """
+        Add a Job, with 'part_count' Parts. Returns the job dict, which can be changed in place.
+        """
+        job = dict(job or {})
+        with self.lock:
+            job.setdefault("id", self.new_id("job"))
+            job.setdefault("status", "CREATED")
+            self.jobs[job["id"]] = job
+            self.parts[job["id"]] = collections.OrderedDict()
+            for _ in range(part_count):
+                part_id = self.new_id("part")
+                self.parts[job["id"]][part_id] = {"id": part_id, "status": part_status or job["status"]}
+        return job
+
+    def add_session(self, session=None):
+        session = dict(session or {})
+        with self.lock:
+            session.setdefault("id", self.new_id("session"))
+            session.setdefault("status", "CREATED")
+            self.sessions[session["id"]] = session
+        return session
+
+    def add_group(self, group=None, parent_id=None, users=()):
+        group = dict(group or {})
+        with self.lock:
+            group.setdefault("id", self.new_id("group"))
+            self.groups[group["id"]] = group
+            if parent_id:
+                self.children[parent_id].append(group["id"])
+            self.users[group["id"]].extend(users)
+        return group
+
+    def add_driver(self, driver=None):
+        driver = dict(driver or {})
+        with self.lock:
+            driver.setdefault("id", self.new_id("driver"))
+            driver.setdefault("type", "GCS")
+            driver.setdefault("mounts", [])
+            self.drivers[driver["id"]] = driver
+        return driver
+
+    def add_family(self, family):
+        """
+        Add an app family, shaped as in get_app_families. Its apps can then be fetched with get_app.
+        """
+        with self.lock:
+            self.families[family["id"]] = family
+            for kind, versions in (family.get("apps") or {}).items():
+                for version, app_id in versions.items():
+                    self.apps[app_id] = {"id": app_id, "version": version, "type": kind, "family": family["id"]}
+        return family
+
+    # Listings
+    def page(self, key, items, query):
+        """
+        A page of 'items' following the page and limit query parameters, or page_size if no limit is given
+        """
+        items = list(items)
+        try:
+            page = int(query.get(page_param, 1))
+            limit = int(query.get(page_size_param, self.page_size or 0)) or None
+        except ValueError:
+            return 400, {"message": "Bad pagination parameters"}
+        if limit:
+            items_page = items[(page - 1) * limit:page * limit]
+        else:
+            items_page = items if page == 1 else []
+        pagination = {"page": page, "total": len(items)}
+        if limit:
+            pagination["limit"] = limit
+        return 200, {key: items_page, "pagination": pagination}
+
+    # Compute
+    def get_jobs(self, request):
+        return self.page("jobs", self.jobs.values(), request["query"])
+
+    def get_job(self, request, job_id):
+        job = self.jobs.get(job_id)
+        return (200, job) if job else (404, {"message": "Job not found"})
+
+    def create_job(self, request):
+        payload = request["json"]
+        if not isinstance(payload, dict) or compute.validate_job_request(payload):
+            return 400, {"message": "; ".join(compute.validate_job_request(payload or {})) or "Bad request"}
+        compute_data = dict(payload["computeData"])
+        job = self.add_job({"name": compute_data.get("name"), "computeData": compute_data,
+                            "partCount": payload["partCount"], "nodeCount": payload["nodeCount"]},
+                           part_count=payload["partCount"])
+        return 200, {"id": job["id"]}
+
+    def stop_job(self, request, job_id):
+        job = self.jobs.get(job_id)
+        if not job:
+            return 404, {"message": "Job not found"}
+        with self.lock:
+            if job["status"] not in compute.terminal_status:
+                job["status"] = "CANCELED"
+            for part in self.parts[job_id].values():
+                if part["status"] not in compute.terminal_status:
+                    part["status"] = "CANCELED"
+        return 200, {}
+
+    def get_parts(self, request, job_id):
+        if job_id not in self.parts:
+            return 404, {"message": "Job not found"}
+        return self.page("parts", self.parts[job_id].values(), request["query"])
+
+    def get_part(self, request, job_id, part_id):
+        part = self.parts.get(job_id, {}).get(part_id)
+        return (200, part) if part else (404, {"message": "Part not found"})
+
+    # Sessions
+    def get_user_sessions(self, request, user_id):
+        owned = [s for s in self.sessions.values() if s.get("user_id", user_id) == user_id]
+        return self.page("sessions", owned, request["query"])
+
+    def get_session(self, request, session_id):
+        session = self.sessions.get(session_id)
+        return (200, session) if session else (404, {"message": "Session not found"})
+
+    def start_session(self, request):
+        payload = request["json"]
+        if not isinstance(payload, dict) or not payload.get("app_id"):
+            return 400, {"message": "app_id is required"}
+        session = self.add_session(dict(payload, status="CREATED"))
+        return 201, session
+
+    def stop_session(self, request, session_id):
+        session = self.sessions.get(session_id)
+        if not session:
+            return 404, {"message": "Session not found"}
+        with self.lock:
+            if session["status"] not in sessions.failed_status:
+                session["status"] = "TERMINATED"
+        return 200, {}
+
+    # Groups
+    def get_orgs(self, request):
+        orgs = [g for g in self.groups.values() if not any(g["id"] in c for c in self.children.values())]
+        return self.page("groups", orgs, request["query"])
+
+    def get_group(self, request, group_id):
+        group = self.groups.get(group_id)
+        return (200, group) if group else (404, {"message": "Group not found"})
+
+    def get_group_children(self, request, group_id):
+        if group_id not in self.groups:
+            return 404, {"message": "Group not found"}
+        return self.page("groups", [self.groups[c] for c in self.children[group_id]], request["query"])
+
+    def get_group_users(self, request, group_id):
+        if group_id not in self.groups:
+            return 404, {"message": "Group not found"}
+        return self.page("users", self.users[group_id], request["query"])
+
+    # Storage
+    def driver_with_status(self, driver):
+        path, finished_at = self.indexing.get(driver["id"], ("/", 0))
+        return dict(driver, statuses=[{"path": path, "indexingInProgress": time.time() < finished_at}])
+
+    def get_drivers(self, request):
+        return 200, {"drivers": [self.driver_with_status(d) for d in self.drivers.values()]}
+
+    def get_driver(self, request, driver_id):
+        driver = self.drivers.get(driver_id)
+        return (200, self.driver_with_status(driver)) if driver else (404, {"message": "Driver not found"})
+
+    def create_driver(self, request):
+        payload = request["json"]
+        if not isinstance(payload, dict) or not payload.get("name"):
+            return 400, {"message": "name is required"}
+        driver = self.add_driver({"name": payload["name"]})
+        if (payload.get("option") or {}).get("create_default_mount"):
+            driver["mounts"].append({"id": self.new_id("mount"), "name": payload["name"],
+                                     "type": "MountTypeGroupCustom", "mountLocation": "/data/" + payload["name"]})
+        return 200, driver
+
+    def driver_action(self, request, driver_id):
+        if driver_id not in self.drivers:
+            return 404, {"message": "Driver not found"}
+        payload = request["json"] or {}
+        if payload.get("type") == "RESCAN":
+            path = payload.get("path") or ""
+            if not path.startswith("/"):
+                return 400, {"message": "path must start with /"}
+            with self.lock:
+                self.indexing[driver_id] = (path, time.time() + self.indexing_seconds)
+            return 200, {}
+        if payload.get("type") == "DROP":
+            return 200, {}
+        return 400, {"message": "Unknown action"}
+
+    def delete_driver(self, request, driver_id):
+        with self.lock:
+            found = self.drivers.pop(driver_id, None)
+        return (200, {}) if found else (404, {"message": "Driver not found"})
+
+    # Apps
+    def get_app_families(self, request):
+        return 200, {"families": list(self.families.values())}
+
+    def get_app(self, request, app_id):
+        app = self.apps.get(app_id)
+        return (200, app) if app else (404, {"message": "App not found"})
+
+    def get_machine_profiles(self, request):
+        return 200, {"machineProfiles": list(self.machine_profiles)}
+
+    # Requests
+    def handle(self, method, path, query, headers, body):
+        """
+        Returns (status, headers, body as a json string) for a request. The response is serialized while the lock is
+        held, since it may be changed by other requests afterwards.
+        """
+        for route_method, route, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if match and route_method == method:
+                break
+        else:
+            return 404, {}, json.dumps({"message": "Unknown route {} {}".format(method, path)})
+
+        with self.lock:
+            self.requests[(method, route)] += 1
+            status = self.forced_errors.popleft() if self.forced_errors else None
+            if status is None and self.error_rate and self.random.random() < self.error_rate:
+                status = self.error_status
+        if self.latency:
+            time.sleep(self.latency)
+        if status is not None:
+            response_headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+            return status, response_headers, json.dumps({"message": "Injected error"})
+        if not headers.get("Authorization"):
+            return 401, {}, json.dumps({"message": "Missing token"})
+        if route != groups.route_orgs and not headers.get("active-group"):
+            return 403, {}, json.dumps({"message": "Missing active-group"})
+
+        try:
+            data = json.loads(body.decode("utf-8")) if body else None
+        except ValueError:
+            return 400, {}, json.dumps({"message": "Malformed json"})
+        request = {"query": query, "headers": headers, "json": data}
+        with self.lock:
+            status, response = handler(request, **match.groupdict())
+            return status, {}, json.dumps(response)
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately: with Nagle's algorithm, kept alive connections would wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def respond(self):
+        parsed = urlparse(self.path)
+        query = dict((k, v[-1]) for k, v in parse_qs(parsed.query).items())
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        status, headers, data = self.server.api.handle(self.command, parsed.path, query, self.headers, body)
+        content = data.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_DELETE = respond
+
+    def log_message(self, format, *args):
+        self.server.api.logger.debug(format, *args)
+
+
+class FakeApiServer(object):
+    """
+    Serves a FakeApi on a local port from a background thread. Keyword arguments are passed to FakeApi.
+    """
+    def __init__(self, **kwargs):
+        self.api = FakeApi(**kwargs)
+        self.server = None
+        self.thread = None
+        self.base_url = None
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeApiHandler)
+        self.server.daemon_threads = True
+        self.server.api = self.api
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-athera-api")
+        self.thread.daemon = True
+        self.thread.start()
+        self.base_url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
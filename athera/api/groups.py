@@ -1,5 +1,7 @@
-import requests
-from athera.api.common import headers, api_debug
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from athera.api.common import headers, api_debug, request, paginate
 
 route_orgs           = "/orgs"
 route_group          = "/groups/{group_id}"
@@ -8,15 +10,18 @@ route_group_users    = "/groups/{group_id}/users"
 
 
 @api_debug
-def get_orgs(base_url, token):
+def get_orgs(base_url, token, params=None):
     """
     Get all Orgs (top level groups) belonging to the authenticated user. 
     This endpoint does not require the 'active-group' header to be set.
+    'params': Optional query parameters, eg a page (see iter_groups)
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_orgs
-    response = requests.get(url, headers={ 
+    response = request("GET", url, route_orgs, headers={ 
         "Authorization" : "Bearer: {}".format(token) 
-    })
+    }, params=params)
     return response
 
 @api_debug
@@ -25,34 +30,259 @@ def get_group(base_url, group_id, token, target_group_id=None):
     Get a single Group, which must be within the context of the main group.
     Response: [403 Forbidden] Incorrect or inaccessible group_id
     Response: [404 Not Found] Incorrect target group
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     # If target_group_id is supplied use that, otherwise use the base group
     target = target_group_id if target_group_id else group_id
     url = base_url + route_group.format(group_id=target)
-    response = requests.get(url, headers=headers(group_id, token))
+    response = request("GET", url, route_group, headers=headers(group_id, token))
     return response
 
 @api_debug
-def get_group_children(base_url, group_id, token, target_group_id=None):
+def get_group_children(base_url, group_id, token, target_group_id=None, params=None):
     """
     Get the child groups of a single Group, which must be within the context of the main group.
+    'params': Optional query parameters, eg a page (see iter_groups)
     Response: [403 Forbidden] Incorrect or inaccessible group_id
     Response: [404 Not Found] Incorrect target group
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     # If target_group_id is supplied use that, otherwise use the base group
     target = target_group_id if target_group_id else group_id
     url = base_url + route_group_children.format(group_id=target)
-    response = requests.get(url, headers=headers(group_id, token))
+    response = request("GET", url, route_group_children, headers=headers(group_id, token), params=params)
     return response
 
 @api_debug
-def get_group_users(base_url, group_id, token, target_group_id=None):
+def get_group_users(base_url, group_id, token, target_group_id=None, params=None):
     """
     Get users who belong to a single Group, which must be within the context of the main group.
+    'params': Optional query parameters, eg a page (see iter_group_users)
     Response: [403 Forbidden] Incorrect or inaccessible group_id
     Response: [404 Not Found] Incorrect target group
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     target = target_group_id if target_group_id else group_id
     url = base_url + route_group_users.format(group_id=target)
-    response = requests.get(url, headers=headers(group_id, token))
+    response = request("GET", url, route_group_users, headers=headers(group_id, token), params=params)
     return response
+
+def iter_groups(base_url, group_id, token, target_group_id=None, page_size=None, prefetch=True):
+    """
+    Generator over groups, following pagination. See common.paginate.
+    With group_id None, these are the Orgs of the authenticated user. Otherwise they are the children of
+    target_group_id (or group_id itself), as for get_group_children.
+    """
+    if group_id is None:
+        fetch = lambda params: get_orgs(base_url, token, params=params)
+    else:
+        fetch = lambda params: get_group_children(base_url, group_id, token, target_group_id, params=params)
+    return paginate(fetch, "groups", page_size, prefetch)
+
+def iter_group_users(base_url, group_id, token, target_group_id=None, page_size=None, prefetch=True):
+    """
+    Generator over the users of a Group, following pagination. See common.paginate.
+    """
+    fetch = lambda params: get_group_users(base_url, group_id, token, target_group_id, params=params)
+    return paginate(fetch, "users", page_size, prefetch)
+
+
+# GROUP TREE
+class GroupTree(object):
+    """
+    In-memory copy of the group hierarchy below an Org, as crawled by load_tree.
+
+    'groups':   group id -> group json
+    'parents':  group id -> parent group id (None for the root)
+    'children': group id -> list of child group ids
+    'names':    lowercase group name -> list of group ids (names are not unique)
+    """
+    def __init__(self, root_id):
+        self.root_id = root_id
+        self.groups = {}
+        self.parents = {}
+        self.children = {}
+        self.names = {}
+        self.loaded_at = time.time()
+        self.lock = threading.Lock()
+
+    def add(self, group, parent_id):
+        with self.lock:
+            group_id = group["id"]
+            self.groups[group_id] = group
+            self.parents[group_id] = parent_id
+            self.children.setdefault(group_id, [])
+            if parent_id is not None and group_id not in self.children.setdefault(parent_id, []):
+                self.children[parent_id].append(group_id)
+            self.names.setdefault(group.get("name", "").lower(), []).append(group_id)
+
+    def remove_descendants(self, group_id):
+        """
+        Drop everything below group_id, keeping group_id itself
+        """
+        with self.lock:
+            self._remove_descendants(group_id)
+
+    def replace_descendants(self, group_id, subtree):
+        """
+        Swap everything below group_id for what is below it in 'subtree', eg a fresh crawl
+        """
+        ids = subtree.descendants(group_id)
+        with self.lock:
+            self._remove_descendants(group_id)
+            for child_id in ids:
+                child = subtree.groups[child_id]
+                self.groups[child_id] = child
+                self.parents[child_id] = subtree.parents[child_id]
+                self.children[child_id] = list(subtree.children.get(child_id, []))
+                self.names.setdefault(child.get("name", "").lower(), []).append(child_id)
+            self.children[group_id] = list(subtree.children.get(group_id, []))
+
+    def _remove_descendants(self, group_id):
+        stack = list(self.children.get(group_id, []))
+        self.children[group_id] = []
+        while stack:
+            child_id = stack.pop()
+            stack.extend(self.children.pop(child_id, []))
+            self.parents.pop(child_id, None)
+            child = self.groups.pop(child_id, None)
+            if child:
+                ids = self.names.get(child.get("name", "").lower(), [])
+                if child_id in ids:
+                    ids.remove(child_id)
+
+    def get(self, group_id):
+        return self.groups.get(group_id)
+
+    def get_children(self, group_id):
+        return [self.groups[c] for c in self.children.get(group_id, [])]
+
+    def get_parent(self, group_id):
+        parent_id = self.parents.get(group_id)
+        return self.groups.get(parent_id) if parent_id else None
+
+    def find(self, name):
+        """
+        All groups with this name, case-insensitive
+        """
+        return [self.groups[g] for g in self.names.get(name.lower(), [])]
+
+    def path(self, group_id):
+        """
+        Ids from the root down to group_id
+        """
+        ids = []
+        while group_id is not None:
+            ids.append(group_id)
+            group_id = self.parents.get(group_id)
+        return list(reversed(ids))
+
+    def descendants(self, group_id):
+        ids = []
+        stack = list(self.children.get(group_id, []))
+        while stack:
+            child_id = stack.pop(0)
+            ids.append(child_id)
+            stack.extend(self.children.get(child_id, []))
+        return ids
+
+    def leaves(self):
+        return [self.groups[g] for g, children in self.children.items() if not children and g in self.groups]
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __contains__(self, group_id):
+        return group_id in self.groups
+
+
+def _crawl(base_url, token, tree, start_ids, max_workers, active_group_id=None, skip_ids=()):
+    """
+    Fetch the children of start_ids breadth-first, a whole level of the tree at a time.
+    Requests are made in the context of 'active_group_id', by default the root of the tree. Groups already in the
+    tree or in 'skip_ids' are not added again.
+    """
+    active_group_id = active_group_id or tree.root_id
+
+    def fetch_children(group_id):
+        return list(iter_groups(base_url, active_group_id, token, group_id, prefetch=False))
+
+    frontier = list(start_ids)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while frontier:
+            next_frontier = []
+            for parent_id, children in zip(frontier, executor.map(fetch_children, frontier)):
+                for child in children:
+                    if child["id"] in tree or child["id"] in skip_ids:
+                        continue  # Guard against cycles
+                    tree.add(child, parent_id)
+                    next_frontier.append(child["id"])
+            frontier = next_frontier
+
+
+tree_cache_ttl = 300
+_tree_cache = {}
+# One lock per cache key, so concurrent loads of the same tree make a single crawl
+_tree_locks = {}
+_tree_cache_lock = threading.Lock()
+
+
+def load_tree(base_url, org_id, token, max_workers=8, ttl=None, refresh=False):
+    """
+    Crawl the whole group hierarchy below an Org with concurrent get_group_children requests, returning a GroupTree.
+    Raises requests.HTTPError if a group cannot be fetched.
+
+    Trees are cached per (base_url, org_id, token) for 'ttl' seconds (default tree_cache_ttl). Pass refresh=True to
+    force a new crawl, or use refresh_subtree to update part of a cached tree. Callers loading a tree which is being
+    crawled wait for that crawl rather than starting another.
+    """
+    ttl = tree_cache_ttl if ttl is None else ttl
+    key = (base_url, org_id, token)
+    requested_at = time.time()
+    with _tree_cache_lock:
+        lock = _tree_locks.setdefault(key, threading.Lock())
+
+    with lock:
+        with _tree_cache_lock:
+            tree = _tree_cache.get(key)
+        if tree:
+            if not refresh and time.time() - tree.loaded_at < ttl:
+                return tree
+            if refresh and tree.loaded_at >= requested_at:
+                return tree  # Crawled by another caller since this one asked
+
+        response = get_group(base_url, org_id, token)
+        response.raise_for_status()
+
+        tree = GroupTree(org_id)
+        tree.add(response.json(), None)
+        _crawl(base_url, token, tree, [org_id], max_workers)
+        with _tree_cache_lock:
+            _tree_cache[key] = tree
+        return tree
+
+
+def refresh_subtree(base_url, group_id, token, tree, max_workers=8):
+    """
+    Re-crawl the groups below group_id in an existing GroupTree, eg after creating a project.
+    The crawl is made into a new tree and swapped in once complete, so readers never see a partial subtree, and the
+    tree is left as it was if a group cannot be fetched (requests.HTTPError).
+    """
+    group = tree.get(group_id)
+    if group is None:
+        raise KeyError("Group {} is not in the tree".format(group_id))
+    subtree = GroupTree(group_id)
+    subtree.add(group, None)
+    _crawl(base_url, token, subtree, [group_id], max_workers, active_group_id=tree.root_id,
+           skip_ids=set(tree.path(group_id)))
+    tree.replace_descendants(group_id, subtree)
+    return tree
+
+
+def clear_tree_cache():
+    with _tree_cache_lock:
+        _tree_cache.clear()
+        _tree_locks.clear()
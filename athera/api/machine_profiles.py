@@ -1,5 +1,4 @@
-import requests
-from athera.api.common import headers, api_debug
+from athera.api.common import headers, api_debug, request
 
 route_machine_profiles = "/machine_profiles"
 
@@ -7,7 +6,9 @@ route_machine_profiles = "/machine_profiles"
 def get_machine_profiles(base_url, group_id, token):
     """
     Get all the Machine Profiles available on Athera
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_machine_profiles
-    response = requests.get(url, headers=headers(group_id, token))
+    response = request("GET", url, route_machine_profiles, headers=headers(group_id, token))
     return response
\ No newline at end of file
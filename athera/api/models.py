@@ -0,0 +1,279 @@
+"""
+Typed views of api responses, instead of response.json() followed by dict lookups.
+
+A model wraps the decoded dict and converts a field only when it is first read, caching the result. Listings are
+wrapped lazily too, so a Job is only created for the items actually looked at and a listing of 10k jobs costs little
+more than decoding it. The raw dict stays available as model.data, model[key] and model.get(key).
+
+What is deferred is the creation of models and the conversion of their fields, not the decoding: the whole body is
+decoded up front into dicts and lists, nested ones included. Decoding uses orjson when it is installed, which is
+several times faster than json on large listings.
+
+Usage:
+    from athera.api import compute, models
+    jobs = models.Job.list_from_response(compute.get_jobs(base_url, group_id, token))
+    failed = [job.id for job in jobs if job.status == "FAILED"]
+"""
+import json
+from athera.lazy import lazy_import, MissingModule
+from athera.api import compute, compute_planner
+
+orjson = lazy_import("orjson")
+
+# Decode with orjson when available. Set to False to always use json.
+use_orjson = not isinstance(orjson, MissingModule)
+
+
+def loads(content):
+    """
+    Decode a JSON document given as bytes or str
+    """
+    if use_orjson:
+        return orjson.loads(content)
+    if isinstance(content, bytes):
+        content = content.decode("utf-8")
+    return json.loads(content)
+
+
+def decode(response):
+    """
+    The decoded body of a requests.Response, like response.json() but using the fastest decoder available
+    """
+    return loads(response.content)
+
+
+class Field(object):
+    """
+    A model attribute read from 'key' of the raw dict, which may be a tuple of keys for nested dicts, or None for
+    the whole dict. 'convert' is applied on first access and its result cached. Missing and null values give
+    'default' without calling convert.
+    """
+    __slots__ = ("key", "convert", "default")
+
+    def __init__(self, key, convert=None, default=None):
+        self.key = key
+        self.convert = convert
+        self.default = default
+
+    def lookup(self, data):
+        key = self.key
+        if key is None:
+            return data
+        if not isinstance(key, tuple):
+            return data.get(key)
+        for k in key:
+            if not isinstance(data, dict):
+                return None
+            data = data.get(k)
+        return data
+
+    def __get__(self, model, owner):
+        if model is None:
+            return self
+        if self.convert is None:
+            value = self.lookup(model.data)
+            return self.default if value is None else value
+        cache = model._cache
+        if cache is None:
+            cache = model._cache = {}
+        elif self in cache:
+            return cache[self]
+        value = self.lookup(model.data)
+        value = self.default if value is None else self.convert(value)
+        cache[self] = value
+        return value
+
+
+class Model(object):
+    """
+    Base of the typed responses. Subclasses declare Fields, and 'list_key' for the key holding their listing.
+    """
+    __slots__ = ("data", "_cache")
+    list_key = None
+
+    def __init__(self, data):
+        self.data = data
+        self._cache = None
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.data == other.data
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "<{} {}>".format(type(self).__name__, self.data.get("id", ""))
+
+    @classmethod
+    def from_response(cls, response):
+        """
+        The model of a single item response, eg compute.get_job
+        """
+        return cls(decode(response))
+
+    @classmethod
+    def list_from_response(cls, response, key=None):
+        """
+        A ModelList of a listing response, eg compute.get_jobs. The whole body is decoded, only models are deferred.
+        """
+        return ModelList(decode(response)[key or cls.list_key], cls)
+
+
+class ModelList(object):
+    """
+    A read-only sequence of models over a list of raw dicts, each model created when its item is first accessed
+    """
+    __slots__ = ("items", "model", "_models")
+
+    def __init__(self, items, model):
+        self.items = items
+        self.model = model
+        self._models = [None] * len(items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.items)))]
+        model = self._models[index]
+        if model is None:
+            model = self._models[index] = self.model(self.items[index])
+        return model
+
+    def __iter__(self):
+        for i in range(len(self.items)):
+            yield self[i]
+
+    def __repr__(self):
+        return "<ModelList of {} {}>".format(len(self.items), self.model.__name__)
+
+
+def model_of(cls):
+    """
+    Field converter for a nested dict
+    """
+    return cls
+
+
+def list_of(cls):
+    """
+    Field converter for a nested list of dicts
+    """
+    return lambda items: ModelList(items, cls)
+
+
+def timestamp_of(keys):
+    """
+    Field converter, used with the whole dict, for the first of 'keys' holding a timestamp
+    """
+    return lambda data: next((compute_planner.parse_timestamp(data[k]) for k in keys if data.get(k)), None)
+
+
+class FrameRange(Model):
+    __slots__ = ()
+    start = Field("start")
+    finish = Field("finish")
+    increment = Field("increment", default=1)
+
+
+class Job(Model):
+    __slots__ = ()
+    list_key = "jobs"
+    id = Field("id")
+    name = Field("name")
+    status = Field("status")
+    part_count = Field("partCount")
+    node_count = Field("nodeCount")
+    user_id = Field(("computeData", "userID"))
+    app_id = Field(("computeData", "appID"))
+    profile_id = Field(("computeData", "profileID"))
+    file_path = Field(("computeData", "filePath"))
+    region = Field(("computeData", "region"))
+    frame_range = Field(("computeData", "frameRange"), model_of(FrameRange))
+
+    @property
+    def is_terminal(self):
+        return self.status in compute.terminal_status
+
+
+class Part(Model):
+    __slots__ = ()
+    list_key = "parts"
+    id = Field("id")
+    status = Field("status")
+    frame_range = Field("frameRange", model_of(FrameRange))
+    started = Field(None, timestamp_of(compute_planner.PART_START_KEYS))
+    finished = Field(None, timestamp_of(compute_planner.PART_END_KEYS))
+    # Derived from the raw part, see compute_planner
+    frames = Field(None, compute_planner.get_part_frames)
+    seconds = Field(None, compute_planner.get_part_seconds)
+
+
+class Session(Model):
+    __slots__ = ()
+    list_key = "sessions"
+    id = Field("id")
+    name = Field("name")
+    status = Field("status")
+    user_id = Field("user_id")
+    app_id = Field("app_id")
+    region = Field("region")
+
+
+class Group(Model):
+    __slots__ = ()
+    list_key = "groups"
+    id = Field("id")
+    name = Field("name")
+    type = Field("type")
+
+
+class Mount(Model):
+    __slots__ = ()
+    list_key = "mounts"
+    id = Field("id")
+    name = Field("name")
+    type = Field("type")
+    mount_location = Field("mountLocation")
+
+
+class DriverStatus(Model):
+    __slots__ = ()
+    path = Field("path")
+    indexing_in_progress = Field("indexingInProgress", bool, False)
+
+
+class Driver(Model):
+    __slots__ = ()
+    list_key = "drivers"
+    id = Field("id")
+    name = Field("name")
+    type = Field("type")
+    mounts = Field("mounts", list_of(Mount), ModelList([], Mount))
+    statuses = Field("statuses", list_of(DriverStatus), ModelList([], DriverStatus))
+
+    @property
+    def indexing_in_progress(self):
+        return any(status.indexing_in_progress for status in self.statuses)
+
+
+class AppFamily(Model):
+    __slots__ = ()
+    list_key = "families"
+    id = Field("id")
+    name = Field("name")
+    # {version: app_id}
+    interactive = Field(("apps", "interactive"))
+    compute = Field(("apps", "compute"))
@@ -0,0 +1,275 @@
+"""
+Client-side rate limiting for athera.api, so that fanning out many requests is smoothed rather than throttled.
+
+Requests wait for a token from a bucket per endpoint family (the first part of the route, eg 'compute' or 'sessions')
+and active group. Buckets are shared by all threads, and optionally by all processes on the machine through a state
+file in a local directory.
+
+Buckets adapt to the server: a [429 Too Many Requests] halves the rate and pauses the bucket for any Retry-After,
+rate limit headers announcing an exhausted quota pause it until the reset, and each success slowly raises the rate
+back towards its configured value.
+
+Usage:
+    from athera.api import rate_limit
+    rate_limit.enable(rates={"compute": 5}, directory="/tmp/athera-rate-limit")
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from athera import retry
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# Requests per second allowed per endpoint family and group, unless configured otherwise
+default_rate = 10.0
+# Tokens a bucket can accumulate, allowing short bursts at full speed
+default_burst = 10
+# Each success adds this fraction of the configured rate back after a 429
+recovery_fraction = 0.05
+# Rate is never reduced below this fraction of the configured rate
+min_rate_fraction = 0.05
+
+REMAINING_HEADERS = ("X-RateLimit-Remaining", "RateLimit-Remaining")
+RESET_HEADERS = ("X-RateLimit-Reset", "RateLimit-Reset")
+
+
+class RateLimitTimeout(RuntimeError):
+    """
+    Raised when no token becomes available within the timeout of the rate limiter
+    """
+
+
+def endpoint_family(route):
+    """
+    '/compute/jobs/{job_id}' -> 'compute'
+    """
+    parts = [p for p in (route or "").split("/") if p]
+    return parts[0] if parts else ""
+
+
+def parse_reset(value, now):
+    """
+    Seconds until a rate limit reset, given either as seconds or as an epoch timestamp
+    """
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if value > 1e9:
+        value -= now
+    return max(0.0, value)
+
+
+class BucketState(object):
+    __slots__ = ("tokens", "updated", "rate", "paused_until")
+
+    def __init__(self, tokens, updated, rate, paused_until=0.0):
+        self.tokens = tokens
+        self.updated = updated
+        self.rate = rate
+        self.paused_until = paused_until
+
+
+class TokenBucket(object):
+    """
+    'rate':  Tokens added per second, ie sustained requests per second.
+    'burst': Maximum tokens held.
+
+    acquire() blocks until a token is available, so callers are delayed rather than rejected.
+    """
+    def __init__(self, rate, burst=None):
+        self.max_rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.lock = threading.Lock()
+        self.state = BucketState(self.burst, time.time(), self.max_rate)
+
+    # State access, replaced for buckets shared between processes
+    def transaction(self, update):
+        """
+        Apply update(state, now) atomically, returning its result
+        """
+        with self.lock:
+            return update(self.state, time.time())
+
+    def refill(self, state, now):
+        if now > state.updated:
+            state.tokens = min(self.burst, state.tokens + (now - state.updated) * state.rate)
+            state.updated = now
+
+    def try_acquire(self, state, now):
+        """
+        Take a token if possible. Returns the seconds to wait before trying again, 0 if a token was taken.
+        """
+        if now < state.paused_until:
+            return state.paused_until - now
+        self.refill(state, now)
+        if state.tokens >= 1:
+            state.tokens -= 1
+            return 0
+        return (1 - state.tokens) / state.rate
+
+    def acquire(self, timeout=None):
+        """
+        Wait for a token. Returns the seconds spent waiting, raises RateLimitTimeout if the timeout expires first.
+        """
+        start = time.time()
+        while True:
+            wait = self.transaction(self.try_acquire)
+            if wait <= 0:
+                return time.time() - start
+            if timeout is not None and time.time() - start + wait > timeout:
+                raise RateLimitTimeout("Rate limit: no token available within {}s".format(timeout))
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for a while, eg for a Retry-After
+        """
+        def update(state, now):
+            state.paused_until = max(state.paused_until, now + seconds)
+            state.tokens = 0
+        self.transaction(update)
+
+    def throttled(self):
+        """
+        The server rejected a request: halve the rate
+        """
+        def update(state, now):
+            state.rate = max(self.max_rate * min_rate_fraction, state.rate / 2)
+        self.transaction(update)
+
+    def succeeded(self):
+        """
+        Recover the rate gradually after being throttled
+        """
+        def update(state, now):
+            if state.rate < self.max_rate:
+                state.rate = min(self.max_rate, state.rate + self.max_rate * recovery_fraction)
+        self.transaction(update)
+
+    @property
+    def rate(self):
+        return self.transaction(lambda state, now: state.rate)
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    A TokenBucket whose state lives in a file, locked with flock, so every process using the same path shares it.
+    Falls back to a process-local bucket where flock is not available.
+    """
+    def __init__(self, path, rate, burst=None):
+        super(FileTokenBucket, self).__init__(rate, burst)
+        self.path = path
+
+    def transaction(self, update):
+        if fcntl is None:
+            return super(FileTokenBucket, self).transaction(update)
+        with self.lock:
+            with open(self.path, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    now = time.time()
+                    try:
+                        state = BucketState(**json.loads(f.read()))
+                    except (ValueError, TypeError):
+                        state = BucketState(self.burst, now, self.max_rate)
+                    result = update(state, now)
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(dict((k, getattr(state, k)) for k in BucketState.__slots__)))
+                    f.flush()
+                    return result
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RateLimiter(object):
+    """
+    Token buckets per (endpoint family, active group).
+
+    'rates':     {family: requests per second}, falling back to default_rate.
+    'burst':     Tokens each bucket can accumulate.
+    'directory': Share buckets with other processes through state files in this directory.
+    'timeout':   Longest a request waits for a token before RateLimitTimeout is raised. None waits forever.
+    """
+    def __init__(self, rates=None, burst=default_burst, directory=None, timeout=None):
+        self.logger = logging.getLogger("athera.api.rate_limit")
+        self.rates = rates or {}
+        self.burst = burst
+        self.directory = directory
+        self.timeout = timeout
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.waited = 0.0
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def bucket(self, route, group_id):
+        family = endpoint_family(route)
+        key = (family, group_id or "")
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                rate = self.rates.get(family, default_rate)
+                if self.directory:
+                    name = hashlib.sha256("{}\n{}".format(*key).encode("utf-8")).hexdigest()
+                    bucket = FileTokenBucket(os.path.join(self.directory, name), rate, self.burst)
+                else:
+                    bucket = TokenBucket(rate, self.burst)
+                self.buckets[key] = bucket
+            return bucket
+
+    def acquire(self, route, group_id):
+        waited = self.bucket(route, group_id).acquire(self.timeout)
+        if waited:
+            with self.lock:
+                self.waited += waited
+
+    def feedback(self, route, group_id, response):
+        """
+        Adapt the bucket to the rate limiting information of a response
+        """
+        bucket = self.bucket(route, group_id)
+        now = time.time()
+        headers = response.headers
+        if response.status_code == 429:
+            bucket.throttled()
+            retry_after = retry.parse_retry_after(headers.get("Retry-After"))
+            if retry_after:
+                bucket.pause(retry_after)
+            self.logger.info("Throttled on %s, rate now %.2f/s", endpoint_family(route), bucket.rate)
+            return
+
+        remaining = next((headers[h] for h in REMAINING_HEADERS if h in headers), None)
+        reset = next((headers[h] for h in RESET_HEADERS if h in headers), None)
+        if remaining is not None and reset is not None:
+            try:
+                exhausted = int(float(remaining)) <= 0
+            except (TypeError, ValueError):
+                exhausted = False
+            seconds = parse_reset(reset, now)
+            if exhausted and seconds:
+                bucket.pause(seconds)
+        if response.status_code < 400:
+            bucket.succeeded()
+
+
+def enable(rates=None, burst=default_burst, directory=None, timeout=None):
+    """
+    Start rate limiting requests made through athera.api. Returns the RateLimiter.
+    """
+    from athera.api import common
+    common.rate_limiter = RateLimiter(rates, burst, directory, timeout)
+    return common.rate_limiter
+
+
+def disable():
+    from athera.api import common
+    common.rate_limiter = None
@@ -0,0 +1,214 @@
+"""
+Batched rescans of storage drivers, eg after uploads touching many directories.
+
+Rather than rescanning a whole driver, or posting one rescan per changed directory, a RescanScheduler collects the
+changed paths, collapses them into a small set of common ancestor directories, and submits the rescans once no new
+path has been added for 'debounce' seconds, with bounded concurrency. wait() then polls the drivers until their
+indexing has finished.
+
+Usage:
+    scheduler = RescanScheduler(base_url, group_id, token)
+    for path in uploaded_files:
+        scheduler.add_file(driver_id, path)
+    scheduler.wait(timeout=600)
+"""
+import collections
+import logging
+import posixpath
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from athera import retry
+from athera.api import rate_limit, storage
+
+RescanResult = collections.namedtuple("RescanResult", ["driver_id", "path", "status_code", "error"])
+RescanResult.__doc__ = """
+Outcome of one rescan request. 'error' is None if it was accepted.
+"""
+
+
+def normalize_path(path):
+    """
+    'data//shots/' -> '/data/shots'
+    """
+    return posixpath.normpath("/" + (path or "").lstrip("/"))
+
+
+def path_depth(path):
+    return 0 if path == "/" else path.count("/")
+
+
+def truncate_path(path, depth):
+    """
+    The ancestor of 'path' at 'depth', eg ('/a/b/c', 1) -> '/a'
+    """
+    if path_depth(path) <= depth:
+        return path
+    return "/" + "/".join(path.strip("/").split("/")[:depth]) if depth else "/"
+
+
+def collapse_paths(paths, max_paths=None):
+    """
+    The smallest set of directories covering every path: any path inside another one is dropped.
+
+    If more than 'max_paths' remain, the deepest paths are replaced by their parents until they fit, trading
+    rescanning a little more for far fewer requests. Returns a sorted list.
+    """
+    collapsed = []
+    for path in sorted(set(normalize_path(p) for p in paths)):
+        if collapsed and (collapsed[-1] == "/" or path.startswith(collapsed[-1] + "/")):
+            continue
+        collapsed.append(path)
+
+    if max_paths is not None:
+        max_paths = max(1, max_paths)
+        while len(collapsed) > max_paths:
+            depth = max(path_depth(p) for p in collapsed) - 1
+            collapsed = collapse_paths([truncate_path(p, depth) for p in collapsed])
+    return collapsed
+
+
+def indexing_in_progress(driver):
+    """
+    True if any region of the driver (as returned by get_driver) is still indexing
+    """
+    return any(status.get("indexingInProgress") for status in driver.get("statuses") or [])
+
+
+def wait_for_indexing(base_url, group_id, token, driver_ids, poll_interval=2.0, timeout=600, max_workers=4):
+    """
+    Poll the drivers until none of them is indexing. The first poll is made after 'poll_interval', giving a rescan
+    just submitted the time to start.
+
+    Returns True once every driver has finished, False if the timeout expired first.
+    """
+    def indexing(driver_id):
+        try:
+            response = storage.get_driver(base_url, group_id, token, driver_id)
+        except (requests.RequestException, retry.CircuitOpenError, rate_limit.RateLimitTimeout) as e:
+            logging.getLogger("athera.api.rescan").warning("Could not get driver %s: %s", driver_id, e)
+            return True
+        if response.status_code != requests.codes.ok:
+            return True
+        return indexing_in_progress(response.json())
+
+    remaining = list(driver_ids)
+    deadline = time.time() + timeout if timeout is not None else None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while remaining:
+            if deadline is not None and time.time() + poll_interval > deadline:
+                return False
+            time.sleep(poll_interval)
+            remaining = [d for d, busy in zip(remaining, executor.map(indexing, remaining)) if busy]
+    return True
+
+
+class RescanScheduler(object):
+    """
+    Collects changed paths per driver and rescans them in batches.
+
+    'debounce':    Seconds without a new path before the pending paths are submitted. None only submits on flush()
+                   or wait().
+    'max_paths':   Most rescans submitted per driver in a batch, see collapse_paths.
+    'max_workers': Maximum number of rescan (and polling) requests in flight.
+    'poll_interval': Seconds between indexing status polls in wait().
+    """
+    def __init__(self, base_url, group_id, token, debounce=2.0, max_paths=20, max_workers=4, poll_interval=2.0):
+        self.logger = logging.getLogger("athera.api.rescan")
+        self.base_url = base_url
+        self.group_id = group_id
+        self.token = token
+        self.debounce = debounce
+        self.max_paths = max_paths
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.condition = threading.Condition()
+        self.pending = collections.defaultdict(set)
+        self.last_added = 0
+        self.thread = None
+        self.results = []
+        self.rescanned = set()  # Driver ids to poll in wait()
+
+    def add(self, driver_id, path):
+        """
+        Schedule a rescan of the directory 'path' of the driver
+        """
+        with self.condition:
+            self.pending[driver_id].add(normalize_path(path))
+            self.last_added = time.time()
+            if self.debounce is not None and self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="athera-rescan")
+                self.thread.daemon = True
+                self.thread.start()
+            self.condition.notify()
+
+    def add_file(self, driver_id, path):
+        """
+        Schedule a rescan of the directory containing the file 'path', eg one just uploaded
+        """
+        self.add(driver_id, posixpath.dirname(normalize_path(path)))
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending:
+                    remaining = self.last_added + self.debounce - time.time()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if not self.pending:
+                    self.thread = None
+                    return
+            self.flush()
+
+    def _rescan(self, request):
+        driver_id, path = request
+        try:
+            response = storage.rescan_driver(self.base_url, self.group_id, self.token, driver_id, path)
+        except (requests.RequestException, retry.CircuitOpenError, rate_limit.RateLimitTimeout) as e:
+            return RescanResult(driver_id, path, None, str(e))
+        if response.status_code != requests.codes.ok:
+            return RescanResult(driver_id, path, response.status_code, response.text or "Rescan failed")
+        return RescanResult(driver_id, path, response.status_code, None)
+
+    def flush(self):
+        """
+        Submit the pending paths now. Returns the list of RescanResult.
+        """
+        with self.condition:
+            batch, self.pending = self.pending, collections.defaultdict(set)
+            self.condition.notify()
+        rescans = [(driver_id, path) for driver_id, paths in batch.items()
+                   for path in collapse_paths(paths, self.max_paths)]
+        if not rescans:
+            return []
+        self.logger.debug("Rescanning %d paths of %d drivers", len(rescans), len(batch))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self._rescan, rescans))
+        with self.condition:
+            self.results.extend(results)
+            self.rescanned.update(r.driver_id for r in results if r.error is None)
+        for r in results:
+            if r.error is not None:
+                self.logger.warning("Rescan of %s on %s failed: %s", r.path, r.driver_id, r.error)
+        return results
+
+    def wait(self, timeout=600):
+        """
+        Submit any pending paths, then wait for the rescanned drivers to finish indexing.
+        Returns True once done, False if the timeout expired first. Failed rescans are listed in 'results'.
+        """
+        start = time.time()
+        self.flush()
+        # Let a batch being submitted by the debounce thread complete
+        with self.condition:
+            thread = self.thread
+        if thread is not None:
+            thread.join()
+        with self.condition:
+            driver_ids, self.rescanned = self.rescanned, set()
+        if timeout is not None:
+            timeout = max(0, timeout - (time.time() - start))
+        return wait_for_indexing(self.base_url, self.group_id, self.token, driver_ids,
+                                 self.poll_interval, timeout, self.max_workers)
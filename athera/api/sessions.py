@@ -1,5 +1,5 @@
-import requests
-from athera.api.common import headers, api_debug
+import logging
+from athera.api.common import headers, api_debug, request, paginate, bulk_stop
 
 route_user_sessions = "/users/{user_id}/sessions"
 route_session       = "/sessions/{session_id}"
@@ -11,6 +11,18 @@ failed_status    = ["FAILURE", "QUEUE_FAILURE", "HOST_FAILURE", "CONTAINER_FAILU
 ready_status     = ["READY"]
 completed_status = ["TERMINATING", "TERMINATED"]
 
+# Order in which a Session moves through the pending statuses to READY. A failure can happen at any point.
+session_lifecycle = pending_status + ready_status + completed_status
+
+# Seconds between polls while a Session is in each pending status. Host assignment can take minutes,
+# whereas a container usually starts within seconds of the host being ready.
+pending_poll_interval = {
+    "CREATED": 2,
+    "HOST_ASSIGNMENT": 15,
+    "WAITING_FOR_HOST": 10,
+    "WAITING_FOR_CONTAINER": 1,
+}
+
 
 
 def make_session_request(user_id, group_id, app_id, region, display_width, display_height, display_dpi, name, profile_id=""):
@@ -29,25 +41,37 @@ def make_session_request(user_id, group_id, app_id, region, display_width, displ
     }
 
 @api_debug
-def get_user_sessions(base_url, group_id, token, user_id):
+def get_user_sessions(base_url, group_id, token, user_id, params=None):
     """
     Get all Sessions owned by the provided user_id
+    'params': Optional query parameters, eg a page (see iter_sessions)
     Response: [403 Forbidden] Incorrect or inaccessible group_id
     Response: [404 Not Found] Incorrect user_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_user_sessions.format(user_id=user_id)
-    response = requests.get(url, headers=headers(group_id, token))
+    response = request("GET", url, route_user_sessions, headers=headers(group_id, token), params=params)
     return response
 
+def iter_sessions(base_url, group_id, token, user_id, page_size=None, prefetch=True):
+    """
+    Generator over all Sessions owned by the provided user_id, following pagination. See common.paginate.
+    """
+    return paginate(lambda params: get_user_sessions(base_url, group_id, token, user_id, params=params),
+                    "sessions", page_size, prefetch)
+
 @api_debug
 def get_session(base_url, group_id, token, session_id):
     """
     Get a single Session
     Response: [403 Forbidden] Incorrect or inaccessible group_id
     Response: [404 Not Found] Incorrect session_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_session.format(session_id=session_id)
-    response = requests.get(url, headers=headers(group_id, token))
+    response = request("GET", url, route_session, headers=headers(group_id, token))
     return response
 
 @api_debug
@@ -56,9 +80,11 @@ def start_session(base_url, group_id, token, payload):
     Start a new Session with the provided payload specification
     Response: [403 Forbidden] Incorrect or inaccessible group_id
     Response: [400 Bad Request] Malformed payload
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_sessions
-    response = requests.post(url, headers=headers(group_id, token), json=payload)
+    response = request("POST", url, route_sessions, headers=headers(group_id, token), json=payload)
     return response
 
 @api_debug
@@ -67,7 +93,119 @@ def stop_session(base_url, group_id, token, session_id):
     Stop a Session in the READY state
     Response: [403 Forbidden] Incorrect or inaccessible group_id
     Response: [404 Not Found] Incorrect session_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_session_stop.format(session_id=session_id)
-    response = requests.post(url, headers=headers(group_id, token))
+    response = request("POST", url, route_session_stop, headers=headers(group_id, token))
     return response
+
+
+# WAITING
+def check_transition(old_status, new_status):
+    """
+    True if a Session may move from old_status to new_status. Statuses only move forward through session_lifecycle,
+    except to one of failed_status which can happen at any time.
+    """
+    if old_status is None or new_status in failed_status:
+        return True
+    if old_status in failed_status:
+        return False
+    if old_status not in session_lifecycle or new_status not in session_lifecycle:
+        return True  # Unknown status, nothing to check against
+    return session_lifecycle.index(new_status) >= session_lifecycle.index(old_status)
+
+
+def make_session_watcher(base_url, group_id, token, **kwargs):
+    """
+    A watch.Watcher which stops following a Session as soon as it is READY, failed or terminated,
+    polling at the rate suited to each pending status (see pending_poll_interval).
+    """
+    from athera.api import watch  # watch depends on this module
+    kwargs.setdefault("phase_intervals", pending_poll_interval)
+    kwargs.setdefault("min_interval", min(pending_poll_interval.values()))
+    kwargs.setdefault("max_interval", max(pending_poll_interval.values()) * 2)
+    kwargs.setdefault("backoff", 1.2)
+    kwargs.setdefault("terminal", {watch.KIND_SESSION: ready_status + failed_status + completed_status})
+    return watch.Watcher(base_url, group_id, token, **kwargs)
+
+
+def _log_transition(event):
+    if not check_transition(event.old_status, event.new_status):
+        logging.getLogger("athera.api.sessions").warning(
+            "Session %s went from %s back to %s", event.id, event.old_status, event.new_status)
+
+
+def wait_for_sessions(base_url, group_id, token, session_ids, user_id=None, timeout=600, callback=None, **kwargs):
+    """
+    Wait for many Sessions to leave the pending statuses, with a single poll loop for all of them.
+
+    'user_id':  Owner of the Sessions, if they all share one. Lets every poll be a single get_user_sessions request.
+    'callback': Optional callback(event) receiving each watch.Event.
+
+    Returns {session_id: status}. A status in ready_status means the Session can be used. A status still in
+    pending_status (or None) means the timeout expired first.
+    """
+    watcher = make_session_watcher(base_url, group_id, token, **kwargs)
+    watcher.add_callback(_log_transition)
+    if callback:
+        watcher.add_callback(callback)
+    for session_id in session_ids:
+        watcher.watch_session(session_id, user_id)
+    watcher.wait(timeout)
+    return dict((s, watcher.status("session", s)) for s in session_ids)
+
+
+def wait_for_session(base_url, group_id, token, session_id, user_id=None, timeout=600, callback=None, **kwargs):
+    """
+    Wait for a single Session to leave the pending statuses. Returns its last status, see wait_for_sessions.
+    """
+    return wait_for_sessions(base_url, group_id, token, [session_id], user_id, timeout, callback, **kwargs)[session_id]
+
+
+async def async_wait_for_sessions(base_url, group_id, token, session_ids, user_id=None, timeout=600, callback=None, **kwargs):
+    """
+    Async equivalent of wait_for_sessions. Requests run in the default executor, the event loop is never blocked.
+    """
+    watcher = make_session_watcher(base_url, group_id, token, **kwargs)
+    watcher.add_callback(_log_transition)
+    if callback:
+        watcher.add_callback(callback)
+    for session_id in session_ids:
+        watcher.watch_session(session_id, user_id)
+    async for _ in watcher.async_events(timeout):
+        pass
+    return dict((s, watcher.status("session", s)) for s in session_ids)
+
+
+async def async_wait_for_session(base_url, group_id, token, session_id, user_id=None, timeout=600, callback=None, **kwargs):
+    """
+    Async equivalent of wait_for_session
+    """
+    statuses = await async_wait_for_sessions(base_url, group_id, token, [session_id], user_id, timeout, callback, **kwargs)
+    return statuses[session_id]
+
+
+def stop_sessions(base_url, group_id, token, session_ids, user_id=None, max_workers=8, rate=10, wait=False, timeout=600, **kwargs):
+    """
+    Stop many Sessions concurrently.
+
+    'user_id':             Owner of the Sessions, if they all share one, so waiting polls with a single request.
+    'max_workers', 'rate': Bounds on the stop requests, see common.bulk_stop.
+    'wait':    Then wait, up to 'timeout' seconds, for the stopped Sessions to be terminated or failed. All of them
+               are followed by a single watch.Watcher, created with any other keyword arguments.
+
+    Returns a list of common.StopResult, in the same order as 'session_ids'.
+    """
+    results = bulk_stop(lambda session_id: stop_session(base_url, group_id, token, session_id), session_ids, max_workers, rate)
+    if not wait:
+        return results
+
+    from athera.api import watch  # watch depends on this module
+    kwargs.setdefault("terminal", {watch.KIND_SESSION: ["TERMINATED"] + failed_status})
+    watcher = watch.Watcher(base_url, group_id, token, max_workers=max_workers, **kwargs)
+    for result in results:
+        if result.error is None:
+            watcher.watch_session(result.id, user_id)
+    watcher.wait(timeout)
+    return [r._replace(status=watcher.status(watch.KIND_SESSION, r.id)) if r.error is None else r for r in results]
@@ -0,0 +1,133 @@
+"""
+Request coalescing for athera.api: identical GET requests made at the same time share a single network request.
+
+While a GET is in flight, other threads asking for the same url, query parameters, active group and token wait for
+it and receive the same Response, instead of sending their own. Its json() is then parsed once and the result shared,
+so callers must treat it as read-only. Requests are only shared while in flight; combine with cache.enable() to also
+reuse recent responses.
+
+Usage:
+    from athera.api import single_flight
+    flights = single_flight.enable()
+    ...
+    flights.stats()  # {'calls': 120, 'flights': 8, 'collapsed': 112, 'routes': {...}}
+"""
+import collections
+import logging
+import threading
+from athera.api.cache import HttpCache
+
+
+class Flight(object):
+    __slots__ = ("done", "response", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+        self.waiters = 0
+
+
+def share_json(response):
+    """
+    Make response.json() parse the body once, every caller receiving the same result
+    """
+    parse = response.json
+    lock = threading.Lock()
+    parsed = []
+
+    def json(**kwargs):
+        if kwargs:
+            return parse(**kwargs)
+        with lock:
+            if not parsed:
+                parsed.append(parse())
+            return parsed[0]
+    response.json = json
+    return response
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical concurrent calls. Counts, per route, the calls made, the flights actually sent, and the
+    calls collapsed into another one's flight.
+    """
+    def __init__(self):
+        self.logger = logging.getLogger("athera.api.single_flight")
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.counts = collections.defaultdict(collections.Counter)
+
+    def do(self, key, func, route=None):
+        """
+        Return func(), or the result of the identical call already in flight under 'key'.
+        Errors are raised to every caller sharing the flight.
+        """
+        with self.lock:
+            counts = self.counts[route or ""]
+            counts["calls"] += 1
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                counts["flights"] += 1
+                leader = True
+            else:
+                flight.waiters += 1
+                counts["collapsed"] += 1
+                leader = False
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+
+        try:
+            flight.response = func()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+                waiters = flight.waiters
+            if waiters and flight.response is not None:
+                self.logger.debug("%d calls to %s shared one request", waiters + 1, route)
+                share_json(flight.response)
+            flight.done.set()
+        return flight.response
+
+    def get(self, send, url, route, headers=None, params=None, **kwargs):
+        """
+        Perform a GET through send(method, url, headers=..., params=..., **kwargs), sharing it with identical
+        concurrent GETs
+        """
+        key = HttpCache.key(url, headers, params)
+        return self.do(key, lambda: send("GET", url, headers=headers, params=params, **kwargs), route)
+
+    def stats(self):
+        with self.lock:
+            routes = dict((route, dict(counts)) for route, counts in self.counts.items())
+        totals = collections.Counter()
+        for counts in routes.values():
+            totals.update(counts)
+        return {
+            "calls": totals["calls"],
+            "flights": totals["flights"],
+            "collapsed": totals["collapsed"],
+            "routes": routes,
+        }
+
+
+def enable():
+    """
+    Start coalescing identical concurrent GET requests made through athera.api. Returns the SingleFlight.
+    """
+    from athera.api import common
+    common.single_flight = SingleFlight()
+    return common.single_flight
+
+
+def disable():
+    from athera.api import common
+    common.single_flight = None
@@ -1,5 +1,4 @@
-import requests
-from athera.api.common import headers, api_debug
+from athera.api.common import headers, api_debug, request
 
 route_driver  = "/storage/driver"
 route_drivers  = "/storage/drivers"
@@ -12,9 +11,11 @@ def get_drivers(base_url, group_id, token):
     Get all user storage drivers. It gets the drivers associated with the active-group-id and the one of its group lineage. 
     eg: If you provide a project-id, you will get as well the drivers for the org-id.
     Response: [403 Forbidden] Incorrect or inaccessible group_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_drivers
-    response = requests.get(url, headers=headers(group_id, token))
+    response = request("GET", url, route_drivers, headers=headers(group_id, token))
     return response
 
 @api_debug
@@ -22,9 +23,11 @@ def get_driver(base_url, group_id, token, driver_id):
     """
     Get storage driver from driver_id, you will get information such as on its type, its mounts and its indexing-status.
     Response: [403 Forbidden] Incorrect or inaccessible group_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_driver_id.format(driver_id=driver_id)
-    response = requests.get(url, headers=headers(group_id, token))
+    response = request("GET", url, route_driver_id, headers=headers(group_id, token))
     return response
 
 @api_debug
@@ -32,9 +35,11 @@ def delete_driver(base_url, group_id, token, driver_id):
     """
     Get storage driver from driver_id, you will get information such as on its type, its mounts and its indexing-status.
     Response: [403 Forbidden] Incorrect or inaccessible group_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_driver_id.format(driver_id=driver_id)
-    response = requests.delete(url, headers=headers(group_id, token))
+    response = request("DELETE", url, route_driver_id, headers=headers(group_id, token))
     return response
 
 def create_gcs_storage_driver_request(name, bucket_id, client_secret):
@@ -55,9 +60,11 @@ def create_driver(base_url, group_id, token, storage_driver_request):
     storage_driver_request parameter must be generated using the following function:
     - create_gcs_storage_driver_request()    
     Response: [403 Forbidden] Incorrect or inaccessible group_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     url = base_url + route_driver
-    response = requests.post(url, headers=headers(group_id, token), json=storage_driver_request)
+    response = request("POST", url, route_driver, headers=headers(group_id, token), json=storage_driver_request)
     return response
 
 
@@ -65,13 +72,15 @@ def create_driver(base_url, group_id, token, storage_driver_request):
 def rescan_driver(base_url, group_id, token, driver_id, path):
     """
     Response: [403 Forbidden] Incorrect or inaccessible group_id
+    Raises: retry.CircuitOpenError while the circuit of the route is open, if enabled (see athera.retry)
+    Raises: rate_limit.RateLimitTimeout when the rate limiter times out, if enabled (see athera.api.rate_limit)
     """
     body = {
         "type": "RESCAN",
         "path": path
     }
     url = base_url + route_driver_id.format(driver_id=driver_id)
-    response = requests.post(url, headers=headers(group_id, token), json=body)
+    response = request("POST", url, route_driver_id, headers=headers(group_id, token), json=body)
     return response
 
 @api_debug
@@ -84,7 +93,7 @@ def dropcache_driver(base_url, group_id, token, driver_id):
         "type": "DROP"
     }
     url = base_url + route_driver_id.format(driver_id=driver_id)
-    response = requests.post(url, headers=headers(group_id, token), json=body)
+    response = request("POST", url, route_driver_id, headers=headers(group_id, token), json=body)
     return response
 
 
@@ -0,0 +1,330 @@
+"""
+Track the status of many Jobs, Parts and Sessions with a single poll loop.
+
+Each poll makes as few requests as possible: one get_jobs sweep rather than a get_job per Job, one get_parts per Job
+however many of its Parts are watched, one get_user_sessions per user. The poll interval backs off while nothing
+changes and resets as soon as something does. Status changes are delivered as Events, to callbacks or by iteration.
+
+Usage:
+    watcher = Watcher(base_url, group_id, token)
+    watcher.watch_job(job_id)
+    watcher.watch_parts(job_id)
+    watcher.add_callback(lambda event: print(event))
+    watcher.wait(timeout=600)
+"""
+import asyncio
+import collections
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from athera.api import compute, sessions
+
+KIND_JOB     = "job"
+KIND_PART    = "part"
+KIND_SESSION = "session"
+
+Event = collections.namedtuple("Event", ["kind", "id", "old_status", "new_status", "data"])
+Event.__doc__ = """
+A status transition. 'old_status' is None the first time an item is seen. 'data' is the item's latest json.
+"""
+
+TERMINAL_STATUS = {
+    KIND_JOB: compute.terminal_status,
+    KIND_PART: compute.terminal_status,
+    KIND_SESSION: sessions.failed_status + sessions.completed_status,
+}
+
+# Statuses which are expected, terminal or not. Others are logged, as an item in one could be waited for forever.
+KNOWN_STATUS = {
+    KIND_JOB: compute.pending_status + compute.active_status + compute.terminal_status,
+    KIND_PART: compute.pending_status + compute.active_status + compute.terminal_status,
+    KIND_SESSION: sessions.session_lifecycle + sessions.failed_status,
+}
+
+
+class Watcher(object):
+    """
+    Polls the status of watched items, emitting an Event for each status transition.
+
+    'min_interval', 'max_interval': Bounds of the delay between polls, in seconds.
+    'backoff':         Factor applied to the delay after each poll where nothing changed.
+    'jitter':          Random fraction added or removed from each delay, so many watchers do not poll in step.
+    'sweep_threshold': Watching this many Jobs or more uses a single get_jobs call rather than get_job per Job.
+    'max_workers':     Maximum number of concurrent requests during a poll.
+    'phase_intervals': Optional {status: seconds} giving the base delay while an item is in that status. The shortest
+                       interval among the watched items applies.
+    'terminal':        Optional {kind: statuses} replacing TERMINAL_STATUS, to stop watching items earlier, or to
+                       treat statuses unknown to this module as final.
+
+    A status missing from both KNOWN_STATUS and 'terminal' is logged as a warning, once per status: the item is not
+    considered done, so wait() only returns when its timeout expires.
+    """
+    def __init__(self, base_url, group_id, token, min_interval=2.0, max_interval=60.0, backoff=1.5, jitter=0.2,
+                 sweep_threshold=3, max_workers=8, phase_intervals=None, terminal=None):
+        self.logger = logging.getLogger("athera.api.watch")
+        self.base_url = base_url
+        self.group_id = group_id
+        self.token = token
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.sweep_threshold = sweep_threshold
+        self.max_workers = max_workers
+        self.phase_intervals = phase_intervals or {}
+        self.terminal = dict(TERMINAL_STATUS, **(terminal or {}))
+        self.interval = min_interval
+        self.lock = threading.Lock()
+        self.callbacks = []
+        self.statuses = {}       # (kind, id) -> last seen status, None if not yet seen
+        self.jobs = set()        # job ids
+        self.part_jobs = set()   # job ids whose parts are watched
+        self.part_owners = {}    # part id -> job id
+        self.parts_final = set() # job ids whose parts were fetched after the job finished
+        self.sessions = {}       # session id -> user id (may be None)
+        self.request_count = 0
+        self.unrecognised = set()  # (kind, status) already warned about
+
+    # Registration
+    def watch_job(self, job_id):
+        with self.lock:
+            self.jobs.add(job_id)
+            self.statuses.setdefault((KIND_JOB, job_id), None)
+
+    def watch_parts(self, job_id):
+        """
+        Watch every Part of the Job, including those created later. The Job itself is also watched, since more Parts
+        may appear until it is finished.
+        """
+        with self.lock:
+            self.part_jobs.add(job_id)
+        self.watch_job(job_id)
+
+    def watch_session(self, session_id, user_id=None):
+        """
+        Providing the owner's user_id lets sessions of the same user be polled with one request
+        """
+        with self.lock:
+            self.sessions[session_id] = user_id
+            self.statuses.setdefault((KIND_SESSION, session_id), None)
+
+    def unwatch(self, kind, item_id):
+        with self.lock:
+            self.statuses.pop((kind, item_id), None)
+            if kind == KIND_JOB:
+                self.jobs.discard(item_id)
+                self.part_jobs.discard(item_id)
+                for part_id in [p for p, j in self.part_owners.items() if j == item_id]:
+                    del self.part_owners[part_id]
+                    self.statuses.pop((KIND_PART, part_id), None)
+            elif kind == KIND_SESSION:
+                self.sessions.pop(item_id, None)
+
+    def add_callback(self, callback):
+        """
+        callback(event) is called from the polling thread for every Event
+        """
+        self.callbacks.append(callback)
+
+    def status(self, kind, item_id):
+        return self.statuses.get((kind, item_id))
+
+    def is_done(self):
+        """
+        True once every watched item has reached a terminal status.
+        Parts left in another status once their Job has finished are not waited for.
+        """
+        with self.lock:
+            for (kind, item_id), status in self.statuses.items():
+                if kind == KIND_PART and self.part_owners.get(item_id) in self.parts_final:
+                    continue
+                if status not in self.terminal[kind]:
+                    return False
+            return True
+
+    # Polling
+    def _get(self, func, *args):
+        with self.lock:
+            self.request_count += 1
+        try:
+            response = func(self.base_url, self.group_id, self.token, *args)
+        except Exception as e:
+            self.logger.warning("%s%s failed: %s", func.__name__, args, e)
+            return None
+        if response.status_code != 200:
+            self.logger.warning("%s%s failed: [%s]", func.__name__, args, response.status_code)
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+    def _fetch_jobs(self, executor, job_ids):
+        """
+        Returns {job_id: job}
+        """
+        found = {}
+        if len(job_ids) >= self.sweep_threshold:
+            data = self._get(compute.get_jobs)
+            if data:
+                found = {j["id"]: j for j in data.get("jobs", []) if j.get("id") in job_ids}
+        # Anything not in the sweep (eg on a later page) is fetched individually
+        missing = [j for j in job_ids if j not in found]
+        for job in executor.map(lambda j: self._get(compute.get_job, j), missing):
+            if job and "id" in job:
+                found[job["id"]] = job
+        return found
+
+    def _fetch_parts(self, executor, job_ids):
+        """
+        Returns {part_id: (job_id, part)}
+        """
+        found = {}
+        job_ids = list(job_ids)
+        for job_id, data in zip(job_ids, executor.map(lambda j: self._get(compute.get_parts, j), job_ids)):
+            for part in (data or {}).get("parts", []):
+                found[part["id"]] = (job_id, part)
+        return found
+
+    def _fetch_sessions(self, executor, session_users):
+        """
+        Returns {session_id: session}
+        """
+        found = {}
+        users = set(u for u in session_users.values() if u)
+        for data in executor.map(lambda u: self._get(sessions.get_user_sessions, u), users):
+            for session in (data or {}).get("sessions", []):
+                if session.get("id") in session_users:
+                    found[session["id"]] = session
+        missing = [s for s in session_users if s not in found]
+        for session in executor.map(lambda s: self._get(sessions.get_session, s), missing):
+            if session and "id" in session:
+                found[session["id"]] = session
+        return found
+
+    def poll(self):
+        """
+        Poll once, skipping items already in a terminal status. Returns the list of Events, after calling callbacks.
+        """
+        with self.lock:
+            terminal = lambda kind, item_id: self.statuses.get((kind, item_id)) in self.terminal[kind]
+            job_ids = set(j for j in self.jobs if not terminal(KIND_JOB, j))
+            # Parts are fetched one last time once their job has finished, to catch their final statuses
+            part_job_ids = set(j for j in self.part_jobs if j not in self.parts_final)
+            session_users = dict((s, u) for s, u in self.sessions.items() if not terminal(KIND_SESSION, s))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            jobs = self._fetch_jobs(executor, job_ids) if job_ids else {}
+            parts = self._fetch_parts(executor, part_job_ids) if part_job_ids else {}
+            found_sessions = self._fetch_sessions(executor, session_users) if session_users else {}
+
+        events = []
+        with self.lock:
+            for part_id, (job_id, part) in parts.items():
+                if job_id in self.part_jobs:
+                    self.part_owners[part_id] = job_id
+                    self.statuses.setdefault((KIND_PART, part_id), None)
+            # Parts fetched after their Job finished have their final statuses
+            self.parts_final.update(j for j in part_job_ids if j in self.part_jobs and j not in job_ids)
+
+            results = (
+                (KIND_JOB, jobs),
+                (KIND_PART, dict((part_id, part) for part_id, (_, part) in parts.items())),
+                (KIND_SESSION, found_sessions),
+            )
+            for kind, items in results:
+                for item_id, data in items.items():
+                    key = (kind, item_id)
+                    if key not in self.statuses:
+                        continue  # unwatched during the poll
+                    old_status = self.statuses.get(key)
+                    new_status = data.get("status")
+                    if new_status != old_status:
+                        self.statuses[key] = new_status
+                        events.append(Event(kind, item_id, old_status, new_status, data))
+                        self.check_status(kind, item_id, new_status)
+
+        if events:
+            self.interval = self.phase_interval()
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+
+        for event in events:
+            for callback in self.callbacks:
+                try:
+                    callback(event)
+                except Exception:
+                    self.logger.exception("Watcher callback failed for %s", event)
+        return events
+
+    def check_status(self, kind, item_id, status):
+        """
+        Warn about a status which is neither known nor terminal. Called with the lock held.
+        """
+        if status in self.terminal[kind] or status in KNOWN_STATUS[kind] or (kind, status) in self.unrecognised:
+            return
+        self.unrecognised.add((kind, status))
+        self.logger.warning("Unrecognised %s status %r (%s %s): it is not treated as terminal, pass it in 'terminal' "
+                            "if it is", kind, status, kind, item_id)
+
+    def phase_interval(self):
+        """
+        Base delay for the current statuses of the watched items, see 'phase_intervals'
+        """
+        if not self.phase_intervals:
+            return self.min_interval
+        with self.lock:
+            intervals = [self.phase_intervals.get(status, self.min_interval)
+                         for (kind, _), status in self.statuses.items() if status not in self.terminal[kind]]
+        return min(min(intervals or [self.min_interval]), self.max_interval)
+
+    def next_delay(self):
+        """
+        Seconds to wait before the next poll, with jitter
+        """
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def events(self, timeout=None):
+        """
+        Generator of Events, polling until every watched item is terminal or the timeout (seconds) expires
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            for event in self.poll():
+                yield event
+            if self.is_done():
+                return
+            delay = self.next_delay()
+            if deadline is not None:
+                if time.time() >= deadline:
+                    return
+                delay = min(delay, deadline - time.time())
+            time.sleep(max(delay, 0))
+
+    async def async_events(self, timeout=None):
+        """
+        Async iterator of Events. Polls run in the default executor so the event loop is never blocked.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            for event in await loop.run_in_executor(None, self.poll):
+                yield event
+            if self.is_done():
+                return
+            delay = self.next_delay()
+            if deadline is not None:
+                if time.time() >= deadline:
+                    return
+                delay = min(delay, deadline - time.time())
+            await asyncio.sleep(max(delay, 0))
+
+    def wait(self, timeout=None):
+        """
+        Poll until every watched item is terminal. Returns True if so, False if the timeout expired first.
+        """
+        for _ in self.events(timeout):
+            pass
+        return self.is_done()
@@ -1,15 +1,18 @@
-from requests_oauthlib import OAuth2Session
 import os
 import time
-import flask
 import logging
-import multiprocessing
 import sys
+from athera.lazy import lazy_import
 if sys.version_info[0] < 3:  # pragma: no cover
     import Queue as queue
 else:  # pragma: no cover
     import queue
 
+# Only needed once an OAuth flow actually starts, so defer the (slow) imports until then
+flask = lazy_import("flask")
+multiprocessing = lazy_import("multiprocessing")
+requests_oauthlib = lazy_import("requests_oauthlib")
+
 class OAuthClient(object):
     """
     A helper class to perform OAuth2 authentication in Athera.
@@ -98,7 +101,7 @@ class OAuthClient(object):
             self.start_callback_server()
 
         self.logger.info("Creating Session")
-        oauth_session = OAuth2Session(
+        oauth_session = requests_oauthlib.OAuth2Session(
             client_id=self.auth_client_id, 
             redirect_uri=self.__callback_server_url + self.__redirect_endpoint,
             scope=u"offline_access",
@@ -122,7 +125,7 @@ class OAuthClient(object):
             'client_secret': self.auth_client_secret,
         }
 
-        oauth_session = OAuth2Session(
+        oauth_session = requests_oauthlib.OAuth2Session(
             client_id=self.auth_client_id,
             token=access_token,
         )
@@ -156,7 +159,7 @@ class OAuthClient(object):
         """
         Runs in the Flask thread
         """
-        oauth_session = OAuth2Session(
+        oauth_session = requests_oauthlib.OAuth2Session(
             client_id=self.auth_client_id, 
             redirect_uri=self.__callback_server_url + self.__token_granted_endpoint,
             token_updater=self.token_updated,
@@ -0,0 +1,545 @@
+"""
+The athera command line tool, to move data to and from Athera mounts from scripts, without prompts.
+
+    athera ls -R athera://MOUNT/shots
+    athera cp -R ./renders athera://MOUNT/shots/renders -j 16
+    athera cp athera://MOUNT/shots/plate.exr ./plates
+    athera sync ./renders athera://MOUNT/shots/renders --exclude "*.tmp" --json
+    athera cp -R athera://ORG_MOUNT/library athera://PROJECT_MOUNT/library
+
+Remote locations are written athera://MOUNT/path, MOUNT being the id or the name of a mount of the group. The token
+and the group are read from ATHERA_API_TOKEN and ATHERA_GROUP_ID, unless given with --token and --group.
+
+DEST is a directory: a file SOURCE is copied into it under its own name, and the contents of a directory SOURCE are
+copied into it, keeping their relative paths. Files are transferred in parallel by --workers. Copies between two
+mounts go through memory only, see Client.copy_remote.
+
+cp copies every file selected by the --include and --exclude globs. With --resume JOURNAL, each file copied is recorded
+in JOURNAL, and files already recorded there with the same size are skipped, so an interrupted cp can be re-run.
+sync only copies the files which are missing from DEST or differ in size, so re-running it resumes where it stopped.
+Downloads are written aside and renamed once complete, so an interrupted download never leaves a partial file.
+
+Exit status: 0 on success, 1 if any file failed, 2 on usage errors, missing dependencies or if the source cannot be
+listed.
+"""
+import argparse
+import collections
+import fnmatch
+import json
+import logging
+import os
+import posixpath
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from athera.sync.client import Client, MAX_CHUNK_SIZE
+
+REMOTE_PREFIX = "athera://"
+DEFAULT_REGION = "europe-west1"
+# Suffix of downloads in progress
+PARTIAL_SUFFIX = ".athera-part"
+
+Location = collections.namedtuple("Location", ["mount_id", "path"])
+Location.__doc__ = """
+A command line location. 'mount_id' is None for local paths. Remote paths are relative to the mount root.
+"""
+
+Transfer = collections.namedtuple("Transfer", ["path", "size"])
+Transfer.__doc__ = """
+A file to copy. 'path' is relative to the source and destination directories.
+"""
+
+
+class CliError(Exception):
+    """
+    An error stopping the whole command, eg a source which cannot be listed
+    """
+
+
+def parse_location(value):
+    """
+    'athera://mount/shots/a.exr' -> Location('mount', 'shots/a.exr'), './a.exr' -> Location(None, './a.exr')
+    """
+    if not value.startswith(REMOTE_PREFIX):
+        return Location(None, value)
+    mount_id, _, path = value[len(REMOTE_PREFIX):].partition("/")
+    if not mount_id:
+        raise CliError("Missing mount in {}".format(value))
+    return Location(mount_id, posixpath.normpath(path).strip("/") if path.strip("/") else "")
+
+
+def selected(path, include=None, exclude=None):
+    """
+    True if the relative 'path' matches one of the 'include' globs (if any) and none of the 'exclude' globs.
+    Globs are matched against the whole relative path and against the file name, so '*.exr' matches in any directory.
+    """
+    def matches(patterns):
+        name = posixpath.basename(path)
+        return any(fnmatch.fnmatch(path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+    if include and not matches(include):
+        return False
+    return not (exclude and matches(exclude))
+
+
+def format_bytes(count):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(count) < 1024:
+            return "{:.1f} {}".format(count, unit) if unit != "B" else "{} B".format(count)
+        count /= 1024.0
+    return "{:.1f} TB".format(count)
+
+
+# Listings
+def list_local(path, recursive=True):
+    """
+    (directory, [Transfer]) of a local file or directory. A file is listed alone, relative to its directory.
+    """
+    if os.path.isfile(path):
+        return os.path.dirname(path) or ".", [Transfer(os.path.basename(path), os.path.getsize(path))]
+    if not os.path.isdir(path):
+        raise CliError("No such file or directory: {}".format(path))
+    if not recursive:
+        raise CliError("{} is a directory (use -R)".format(path))
+    files = []
+    for directory, _, names in os.walk(path):
+        for name in names:
+            if name.endswith(PARTIAL_SUFFIX):
+                continue
+            local = os.path.join(directory, name)
+            relative = os.path.relpath(local, path).replace(os.sep, "/")
+            files.append(Transfer(relative, os.path.getsize(local)))
+    return path, sorted(files)
+
+
+def walk_remote(client, group_id, mount_id, path, recursive=True):
+    """
+    Generator of (relative path, size, is_directory) under the remote directory 'path'.
+    Raises CliError if a directory cannot be listed.
+    """
+    directories = collections.deque([""])
+    while directories:
+        relative = directories.popleft()
+        for response, err in client.get_files(group_id, mount_id, posixpath.join("/", path, relative).rstrip("/") or "/"):
+            if err is not None:
+                raise CliError("Could not list {}: {}".format(posixpath.join(path, relative) or "/", err))
+            name = response.file.name or posixpath.basename(response.file.path.rstrip("/"))
+            entry = posixpath.join(relative, name)
+            is_directory = response.file.type == response.file.DIRECTORY
+            yield entry, response.file.size, is_directory
+            if is_directory and recursive:
+                directories.append(entry)
+
+
+def list_remote(client, group_id, mount_id, path, recursive=True):
+    """
+    (directory, [Transfer]) of a remote file or directory. A file is listed alone, relative to its directory.
+    """
+    if path:
+        # Whether 'path' is a file or a directory is told by the listing of its parent
+        parent, name = posixpath.split(path)
+        for entry, size, is_directory in walk_remote(client, group_id, mount_id, parent, recursive=False):
+            if entry != name:
+                continue
+            if not is_directory:
+                return parent, [Transfer(name, size)]
+            break
+        else:
+            raise CliError("No such file or directory: {}{}/{}".format(REMOTE_PREFIX, mount_id, path))
+    if not recursive:
+        raise CliError("{} is a directory (use -R)".format(path or "/"))
+    return path, sorted(Transfer(p, size) for p, size, is_directory in walk_remote(
+        client, group_id, mount_id, path) if not is_directory)
+
+
+def list_destination(client, group_id, location):
+    """
+    {relative path: size} of the files already in the destination directory, empty if it does not exist yet
+    """
+    try:
+        if location.mount_id is None:
+            if not os.path.isdir(location.path):
+                return {}
+            _, files = list_local(location.path)
+        else:
+            files = [Transfer(p, size) for p, size, is_dir in walk_remote(
+                client, group_id, location.mount_id, location.path) if not is_dir]
+    except CliError:
+        return {}
+    return dict(files)
+
+
+class Journal(object):
+    """
+    Files completed by previous runs, one json object {"path", "size"} per line, appended to as files complete
+    """
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = {}
+        complete = True
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    complete = line.endswith("\n")
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:  # A line cut short by an interruption
+                        continue
+                    self.done[entry["path"]] = entry["size"]
+        self.file = None if readonly else open(path, "a")
+        if self.file is not None and not complete:
+            self.file.write("\n")
+
+    def is_done(self, transfer):
+        return self.done.get(transfer.path) == transfer.size
+
+    def record(self, transfer):
+        with self.lock:
+            self.file.write(json.dumps({"path": transfer.path, "size": transfer.size}) + "\n")
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class Progress(object):
+    """
+    Prints the files and bytes transferred so far, and the throughput, at most every 'interval' seconds.
+    On a terminal the line is rewritten in place.
+    """
+    def __init__(self, stream, files, total_bytes, enabled=True, interval=None):
+        self.stream = stream
+        self.files = files
+        self.total_bytes = total_bytes
+        self.enabled = enabled
+        self.tty = hasattr(stream, "isatty") and stream.isatty()
+        self.interval = interval if interval is not None else (0.2 if self.tty else 5.0)
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.last_shown = 0
+        self.done_files = 0
+        self.bytes = 0
+
+    def add(self, count):
+        with self.lock:
+            self.bytes += count
+        self.show()
+
+    def file_done(self):
+        with self.lock:
+            self.done_files += 1
+        self.show()
+
+    def show(self, force=False):
+        if not self.enabled:
+            return
+        with self.lock:
+            now = time.time()
+            if not force and now - self.last_shown < self.interval:
+                return
+            self.last_shown = now
+            elapsed = max(now - self.start, 1e-6)
+            line = "{}/{} files, {} / {}, {}/s".format(
+                self.done_files, self.files, format_bytes(self.bytes), format_bytes(self.total_bytes),
+                format_bytes(self.bytes / elapsed))
+            self.stream.write("\r{:<70}".format(line) if self.tty else line + "\n")
+            self.stream.flush()
+
+    def finish(self):
+        self.show(force=True)
+        if self.enabled and self.tty:
+            self.stream.write("\n")
+
+
+class TrackedFile(object):
+    """
+    A file object reporting the bytes read or written to a Progress. Seeking back, as done by retried transfers,
+    takes the bytes back off.
+    """
+    def __init__(self, file, progress):
+        self.file = file
+        self.progress = progress
+        self.name = getattr(file, "name", None)
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.progress.add(len(data))
+        return data
+
+    def write(self, data):
+        count = self.file.write(data)
+        self.progress.add(len(data))
+        return count
+
+    def seekable(self):
+        return self.file.seekable()
+
+    def tell(self):
+        return self.file.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        before = self.file.tell()
+        position = self.file.seek(offset, whence)
+        self.progress.add(self.file.tell() - before)
+        return position
+
+    def truncate(self, size=None):
+        return self.file.truncate(size)
+
+
+# Commands
+class Copier(object):
+    """
+    Copies files between a local and a remote directory, or between two remote directories, in parallel
+    """
+    def __init__(self, client, group_id, source, destination, args, progress):
+        self.client = client
+        self.group_id = group_id
+        self.source = source
+        self.destination = destination
+        self.chunk_size = args.chunk_size
+        self.progress = progress
+
+    def copy(self, transfer):
+        """
+        None once 'transfer' is copied, otherwise an error
+        """
+        try:
+            if self.source.mount_id is None:
+                return self.upload(transfer)
+            if self.destination.mount_id is None:
+                return self.download(transfer)
+            return self.copy_remote(transfer)
+        except (IOError, OSError) as e:
+            return e
+
+    def upload(self, transfer):
+        destination_path = posixpath.join(self.destination.path, transfer.path)
+        with open(os.path.join(self.source.path, *transfer.path.split("/")), "rb") as f:
+            _, err = self.client.upload_file(self.group_id, self.destination.mount_id, TrackedFile(f, self.progress),
+                                             destination_path, chunk_size=self.chunk_size)
+        return err
+
+    def copy_remote(self, transfer):
+        _, err = self.client.copy_remote(self.group_id, self.source.mount_id,
+                                         posixpath.join("/", self.source.path, transfer.path),
+                                         self.destination.mount_id, posixpath.join(self.destination.path, transfer.path),
+                                         chunk_size=self.chunk_size, callback=self.progress.add)
+        return err
+
+    def download(self, transfer):
+        local = os.path.join(self.destination.path, *transfer.path.split("/"))
+        directory = os.path.dirname(local)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:  # Created by another worker in the meantime
+                if not os.path.isdir(directory):
+                    raise
+        partial = local + PARTIAL_SUFFIX
+        err = None
+        try:
+            with open(partial, "wb") as f:
+                err = self.client.download_to_file(self.group_id, self.source.mount_id, TrackedFile(f, self.progress),
+                                                   path=posixpath.join("/", self.source.path, transfer.path),
+                                                   chunk_size=self.chunk_size)
+            if err is None:
+                os.replace(partial, local)
+        finally:
+            # Failed, or raised while writing (eg disk full)
+            if os.path.exists(partial):
+                os.remove(partial)
+        return err
+
+
+def resolve_mount(client, group_id, mount):
+    """
+    Id of the mount of the group whose id or name is 'mount'. Returned unchanged if the mounts cannot be listed.
+    """
+    mounts, err = client.get_mounts(group_id)
+    if err is not None:
+        logging.getLogger("athera.cli").debug("Could not list mounts: %s", err)
+        return mount
+    for m in mounts:
+        if mount in (m.id, m.name):
+            return m.id
+    raise CliError("No mount {} in group {}".format(mount, group_id))
+
+
+def run_ls(args, client, out):
+    location = parse_location(args.location)
+    if location.mount_id is None:
+        raise CliError("ls needs a remote location, eg athera://MOUNT/path")
+    mount_id = resolve_mount(client, args.group, location.mount_id)
+    entries = []
+    for path, size, is_directory in walk_remote(client, args.group, mount_id, location.path, args.recursive):
+        if is_directory or selected(path, args.include, args.exclude):
+            entries.append({"path": path + "/" if is_directory else path, "size": size,
+                            "type": "directory" if is_directory else "file"})
+    if args.json:
+        out.write(json.dumps(entries) + "\n")
+    else:
+        for entry in entries:
+            out.write("{:>12}  {}\n".format(entry["size"] if entry["type"] == "file" else "", entry["path"])
+                      if args.long else entry["path"] + "\n")
+    return 0
+
+
+def run_copy(args, client, out, err):
+    """
+    cp and sync. Returns the exit status.
+    """
+    start = time.time()
+    source, destination = parse_location(args.source), parse_location(args.destination)
+    if source.mount_id is None and destination.mount_id is None:
+        raise CliError("At least one of SOURCE and DEST must be remote (athera://MOUNT/path)")
+    if source.mount_id is not None:
+        source = source._replace(mount_id=resolve_mount(client, args.group, source.mount_id))
+        directory, files = list_remote(client, args.group, source.mount_id, source.path, args.recursive)
+    else:
+        directory, files = list_local(source.path, args.recursive)
+    if destination.mount_id is not None:
+        destination = destination._replace(mount_id=resolve_mount(client, args.group, destination.mount_id))
+    source = source._replace(path=directory)
+
+    files = [f for f in files if selected(f.path, args.include, args.exclude)]
+    journal = Journal(args.resume, readonly=args.dry_run) if args.resume else None
+    if args.command == "sync":
+        existing = list_destination(client, args.group, destination)
+        todo = [f for f in files if existing.get(f.path) != f.size]
+    elif journal is not None:
+        todo = [f for f in files if not journal.is_done(f)]
+    else:
+        todo = files
+
+    progress = Progress(err, len(todo), sum(f.size for f in todo), enabled=not (args.quiet or args.dry_run))
+    copier = Copier(client, args.group, source, destination, args, progress)
+    failed = []
+
+    def copy(transfer):
+        error = copier.copy(transfer)
+        if error is None and journal is not None:
+            journal.record(transfer)
+        progress.file_done()
+        return error
+
+    if args.dry_run:
+        if not args.json:
+            for transfer in todo:
+                out.write("{}\n".format(transfer.path))
+    else:
+        try:
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                for transfer, error in zip(todo, executor.map(copy, todo)):
+                    if error is not None:
+                        failed.append({"path": transfer.path, "error": str(error)})
+                        err.write("Failed {}: {}\n".format(transfer.path, error))
+        finally:
+            if journal is not None:
+                journal.close()
+        progress.finish()
+
+    seconds = time.time() - start
+    failed_paths = set(f["path"] for f in failed)
+    copied_bytes = sum(f.size for f in todo if f.path not in failed_paths)
+    summary = collections.OrderedDict([
+        ("command", args.command),
+        ("source", args.source),
+        ("destination", args.destination),
+        ("files", len(files)),
+        ("copied", len(todo) - len(failed)),
+        ("skipped", len(files) - len(todo)),
+        ("failed", len(failed)),
+        ("bytes", copied_bytes),
+        ("seconds", round(seconds, 3)),
+        ("bytes_per_second", int(copied_bytes / seconds) if seconds else None),
+        ("dry_run", args.dry_run),
+        ("errors", failed),
+    ])
+    if args.json:
+        out.write(json.dumps(summary) + "\n")
+    else:
+        out.write("{} {} files ({}) in {:.1f}s, {}/s. {} skipped, {} failed.\n".format(
+            "Would copy" if args.dry_run else "Copied", summary["copied"], format_bytes(copied_bytes), seconds,
+            format_bytes(summary["bytes_per_second"] or 0), summary["skipped"], summary["failed"]))
+    return 1 if failed else 0
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="athera", description="Move data to and from Athera mounts.",
+                                     epilog="See the docstring of athera.cli for details.")
+    parser.add_argument("--token", default=os.getenv("ATHERA_API_TOKEN"), help="Defaults to $ATHERA_API_TOKEN")
+    parser.add_argument("--group", default=os.getenv("ATHERA_GROUP_ID"), help="Defaults to $ATHERA_GROUP_ID")
+    parser.add_argument("--region", default=os.getenv("ATHERA_REGION", DEFAULT_REGION),
+                        help="Sync region to connect to. Defaults to $ATHERA_REGION or {}".format(DEFAULT_REGION))
+    parser.add_argument("-v", "--verbose", action="store_true")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    def add_filters(command):
+        command.add_argument("--include", action="append", metavar="GLOB",
+                             help="Only files matching GLOB. May be repeated.")
+        command.add_argument("--exclude", action="append", metavar="GLOB",
+                             help="Skip files matching GLOB. May be repeated.")
+        command.add_argument("--json", action="store_true", help="Print the result as json")
+
+    ls = commands.add_parser("ls", help="List a remote directory")
+    ls.add_argument("location", metavar="athera://MOUNT/path")
+    ls.add_argument("-R", "--recursive", action="store_true")
+    ls.add_argument("-l", "--long", action="store_true", help="Show sizes")
+    add_filters(ls)
+
+    for name, help in (("cp", "Copy files"), ("sync", "Copy the files missing from DEST or differing in size")):
+        command = commands.add_parser(name, help=help)
+        command.add_argument("source", metavar="SOURCE")
+        command.add_argument("destination", metavar="DEST")
+        if name == "cp":
+            command.add_argument("-R", "--recursive", action="store_true")
+        else:
+            command.set_defaults(recursive=True)
+        command.add_argument("-j", "--workers", type=int, default=8, help="Files transferred in parallel")
+        command.add_argument("--chunk-size", type=int, default=MAX_CHUNK_SIZE, help="Bytes per message, at most 1 MB")
+        command.add_argument("--resume", metavar="JOURNAL", help="Record completed files in JOURNAL, skip those it "
+                                                                 "already lists")
+        command.add_argument("-n", "--dry-run", action="store_true", help="List what would be copied")
+        command.add_argument("-q", "--quiet", action="store_true", help="No progress output")
+        add_filters(command)
+    return parser
+
+
+def main(argv=None, client=None, out=None, err=None):
+    """
+    Entry point of the athera command. 'client' is an optional sync Client to use instead of connecting to the region.
+    """
+    out, err = out or sys.stdout, err or sys.stderr
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    if not args.token:
+        parser.error("no token: set ATHERA_API_TOKEN or use --token")
+    if not args.group:
+        parser.error("no group: set ATHERA_GROUP_ID or use --group")
+    if getattr(args, "chunk_size", 1) > MAX_CHUNK_SIZE:
+        parser.error("--chunk-size is at most {}".format(MAX_CHUNK_SIZE))
+    if getattr(args, "workers", 1) < 1:
+        parser.error("--workers must be at least 1")
+
+    try:
+        if client is None:
+            client = Client(args.region, args.token)
+        if args.command == "ls":
+            return run_ls(args, client, out)
+        return run_copy(args, client, out, err)
+    except (CliError, ValueError) as e:
+        err.write("athera: {}\n".format(e))
+        return 2
+    except ImportError as e:
+        err.write("athera: missing dependency: {}\nInstall grpcio and protobuf<4 to use the athera command.\n".format(e))
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""
+Deferred module loading, so that importing athera does not pay for heavy or optional dependencies (grpc, flask,
+numpy...) until they are actually used.
+
+Before Python 3.12 a lazy module is not thread-safe: threads using it for the first time at the same moment can see
+it half executed and fail with AttributeError. Call load() on the lazy modules a pool of threads will use before
+starting them.
+"""
+import sys
+import threading
+import importlib.util
+
+_load_lock = threading.Lock()
+
+
+class MissingModule(object):
+    """
+    Stands in for a module which is not installed. The ImportError is raised when the module is first used,
+    rather than when the athera module referring to it is imported.
+    """
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attr):
+        raise ImportError("No module named '{}'. Install it to use this feature.".format(self.__name))
+
+
+def lazy_import(name):
+    """
+    Return the module 'name', registered in sys.modules but only executed on first attribute access.
+
+    If the module has already been imported the real module is returned. If it is not installed, a MissingModule
+    is returned which raises ImportError on first use.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return MissingModule(name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def load(*modules):
+    """
+    Execute the lazy modules now, one thread at a time, if they have not been already. MissingModules are skipped.
+    """
+    with _load_lock:
+        for module in modules:
+            if not isinstance(module, MissingModule):
+                module.__name__
@@ -0,0 +1,290 @@
+"""
+Retries and circuit breaking shared by the HTTP (athera.api) and gRPC (athera.sync) calls.
+
+Failed calls are retried with exponential backoff and full jitter, until max_attempts or max_elapsed seconds. Calls
+which are not idempotent (eg create_job) are only retried when the server is known not to have processed them
+([429 Too Many Requests], [503 Service Unavailable], gRPC UNAVAILABLE or RESOURCE_EXHAUSTED).
+
+Circuit breaking is off unless configured with a failure_threshold. Each endpoint (an api route or a gRPC method) then
+has a CircuitBreaker per scope, eg per active group. After failure_threshold consecutive calls fail, once their retries
+are exhausted, it opens and calls fail immediately with CircuitOpenError for reset_timeout seconds. A single trial call
+is then let through; its success closes the circuit again.
+
+Counters of attempts, retries, failures and rejections per endpoint are available from stats().
+
+Usage:
+    from athera import retry
+    retry.configure(policy=retry.RetryPolicy(max_attempts=10, max_elapsed=300))
+    retry.configure(failure_threshold=10, reset_timeout=30)  # fail fast while an endpoint is down
+    retry.configure(policy=retry.NO_RETRY)  # previous behaviour
+    retry.reset()  # back to the defaults
+"""
+import collections
+import logging
+import random
+import threading
+import time
+import requests
+from athera.lazy import lazy_import
+
+grpc = lazy_import("grpc")
+
+# HTTP statuses worth retrying. 500 is not retried as the api uses it for malformed requests.
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+# HTTP statuses meaning the request was not processed, so even non-idempotent requests can be retried
+UNPROCESSED_STATUS_CODES = (429, 503)
+# gRPC codes worth retrying, and those meaning the call was not processed
+RETRY_GRPC_CODES = ("UNAVAILABLE", "RESOURCE_EXHAUSTED", "DEADLINE_EXCEEDED", "ABORTED")
+UNPROCESSED_GRPC_CODES = ("UNAVAILABLE", "RESOURCE_EXHAUSTED")
+
+Outcome = collections.namedtuple("Outcome", ["failure", "retryable", "unprocessed", "retry_after"])
+Outcome.__doc__ = """
+Classification of a call result. 'failure' counts towards opening the circuit. 'retry_after' is a delay requested
+by the server, in seconds, or None.
+"""
+SUCCESS = Outcome(False, False, False, None)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a call while the circuit of its endpoint is open
+    """
+    def __init__(self, endpoint, retry_in):
+        super(CircuitOpenError, self).__init__(
+            "Circuit open for {} after repeated failures, retry in {:.0f}s".format(endpoint, retry_in))
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class RetryPolicy(object):
+    """
+    'max_attempts':    Total attempts, including the first.
+    'initial_backoff': Upper bound of the first delay, in seconds. Each delay is drawn uniformly below its bound.
+    'multiplier':      Growth of the bound after each attempt.
+    'max_backoff':     Cap on the bound.
+    'max_elapsed':     No attempt starts after this many seconds since the first.
+    """
+    def __init__(self, max_attempts=5, initial_backoff=0.5, multiplier=2.0, max_backoff=30.0, max_elapsed=120.0):
+        self.max_attempts = max_attempts
+        self.initial_backoff = initial_backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.max_elapsed = max_elapsed
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Seconds to wait after the given (1-based) failed attempt
+        """
+        bound = min(self.max_backoff, self.initial_backoff * self.multiplier ** (attempt - 1))
+        delay = random.uniform(0, bound)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+class CircuitBreaker(object):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=10, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        True if a call may be made now. In the half-open state only one trial call is allowed.
+        """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def retry_in(self):
+        return max(0, self.reset_timeout - (time.time() - self.opened_at))
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logging.getLogger("athera.retry").warning("Opening circuit after %d failures", self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+
+class Counters(object):
+    """
+    Thread-safe per-endpoint counters
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = collections.defaultdict(collections.Counter)
+
+    def increment(self, endpoint, name, value=1):
+        with self.lock:
+            self.counts[endpoint][name] += value
+
+    def snapshot(self):
+        with self.lock:
+            return dict((endpoint, dict(counts)) for endpoint, counts in self.counts.items())
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+
+default_policy = RetryPolicy()
+failure_threshold = None
+reset_timeout = 30.0
+breakers = {}
+counters = Counters()
+_breakers_lock = threading.Lock()
+
+
+def configure(policy=None, failure_threshold=-1, reset_timeout=None):
+    """
+    Change the defaults used by every call. failure_threshold=None disables circuit breaking.
+    Existing circuits are reset.
+    """
+    module = globals()
+    if policy is not None:
+        module["default_policy"] = policy
+    if failure_threshold != -1:
+        module["failure_threshold"] = failure_threshold
+    if reset_timeout is not None:
+        module["reset_timeout"] = reset_timeout
+    with _breakers_lock:
+        breakers.clear()
+
+
+def reset():
+    """
+    Restore the default policy, disable circuit breaking and clear the counters
+    """
+    configure(policy=RetryPolicy(), failure_threshold=None, reset_timeout=30.0)
+    counters.reset()
+
+
+def get_breaker(endpoint, scope=None):
+    if failure_threshold is None:
+        return None
+    with _breakers_lock:
+        breaker = breakers.get((endpoint, scope))
+        if breaker is None:
+            breaker = breakers[(endpoint, scope)] = CircuitBreaker(failure_threshold, reset_timeout)
+        return breaker
+
+
+def stats():
+    """
+    {endpoint: {counter: value, 'circuit': state}} for monitoring. Endpoints broken per scope give
+    'circuits': {scope: state} instead.
+    """
+    snapshot = counters.snapshot()
+    with _breakers_lock:
+        for (endpoint, scope), breaker in breakers.items():
+            if scope is None:
+                snapshot.setdefault(endpoint, {})["circuit"] = breaker.state
+            else:
+                snapshot.setdefault(endpoint, {}).setdefault("circuits", {})[scope] = breaker.state
+    return snapshot
+
+
+def parse_retry_after(value):
+    """
+    Seconds from a Retry-After header given in seconds. HTTP dates are not supported and give None.
+    """
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_http(response, error):
+    if error is not None:
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            # Nothing was sent if the connection could not be made
+            return Outcome(True, True, isinstance(error, requests.ConnectTimeout), None)
+        return Outcome(False, False, False, None)
+    if response.status_code in RETRY_STATUS_CODES:
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        return Outcome(True, True, response.status_code in UNPROCESSED_STATUS_CODES, retry_after)
+    return SUCCESS
+
+
+def classify_grpc(result, error):
+    if error is None:
+        return SUCCESS
+    if isinstance(error, grpc.RpcError) and hasattr(error, "code"):
+        code = error.code()
+        name = getattr(code, "name", str(code))
+        if name in RETRY_GRPC_CODES:
+            return Outcome(True, True, name in UNPROCESSED_GRPC_CODES, None)
+    return Outcome(False, False, False, None)
+
+
+def call(func, endpoint, idempotent, classify, policy=None, scope=None):
+    """
+    Call func() until it succeeds, fails in a way which is not retryable, or the policy gives up.
+
+    'endpoint':   Name for the circuit breaker and counters, eg a route or gRPC method.
+    'idempotent': Whether func may safely be repeated after the server processed it.
+    'classify':   classify(result, error) -> Outcome, eg classify_http or classify_grpc.
+    'scope':      Calls of the endpoint sharing a circuit, eg an active group. None shares one circuit.
+
+    Returns the last result, or raises the last error. Raises CircuitOpenError if circuit breaking is enabled and the
+    circuit is open. The call counts as one failure towards opening it, however many attempts it made.
+    """
+    policy = policy or default_policy
+    breaker = get_breaker(endpoint, scope)
+    if breaker and not breaker.allow():
+        counters.increment(endpoint, "rejected")
+        raise CircuitOpenError(endpoint, breaker.retry_in())
+    start = time.time()
+    attempt = 0
+    while True:
+        attempt += 1
+        counters.increment(endpoint, "attempts")
+        result, error = None, None
+        try:
+            result = func()
+        except Exception as e:
+            error = e
+        outcome = classify(result, error)
+        counters.increment(endpoint, "failures" if outcome.failure else "successes")
+
+        finished = not outcome.retryable or not (idempotent or outcome.unprocessed) or attempt >= policy.max_attempts
+        if not finished:
+            delay = policy.delay(attempt, outcome.retry_after)
+            finished = time.time() - start + delay > policy.max_elapsed
+        if finished:
+            if breaker:
+                if outcome.failure:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            if outcome.retryable and attempt > 1:
+                counters.increment(endpoint, "gave_up")
+            if error is not None:
+                raise error
+            return result
+
+        counters.increment(endpoint, "retries")
+        logging.getLogger("athera.retry").debug("%s attempt %d failed, retrying in %.2fs", endpoint, attempt, delay)
+        time.sleep(delay)
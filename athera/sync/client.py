@@ -1,10 +1,17 @@
 import os
 import logging
-import grpc
-from athera.sync.sirius.services import service_pb2
-from athera.sync.sirius.services import service_pb2_grpc
 import sys
 import io 
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from athera.lazy import lazy_import, load
+from athera import retry
+from athera.sync.remote_file import RemoteFileReader, RemoteFileWriter
+
+# grpc and the generated protobuf modules are loaded on first use
+grpc = lazy_import("grpc")
+service_pb2 = lazy_import("athera.sync.sirius.services.service_pb2")
+service_pb2_grpc = lazy_import("athera.sync.sirius.services.service_pb2_grpc")
 
 ONE_MB = 1024 * 1024
 MAX_CHUNK_SIZE = 1 * ONE_MB
@@ -23,20 +30,27 @@ class Client(object):
     * Check if token is expired before performing API call. If so, refresh it.
     """
 
-    def __init__(self, region, token):
+    def __init__(self, region, token, channel=None):
         """ 
         'region': The ingress point for the data. Use the region geographically closest to you.
                   Other regions may have to perform a 'rescan' on the mount_id to detect the newly uploaded file.
+                  Pass an athera.sync.visibility.Visibility to upload_file or upload_files to have it done for you.
         'token':  JSON Web Token. See athera.auth.generate_jwt.py on how to generate a JWT.
+        'channel': Optional grpc.Channel to use instead of connecting to the region, eg to an
+                  athera.sync.fake_server.FakeSiriusServer. 'region' is then only a name for the client, and
+                  'url' and 'credentials' are None.
         """
-        
-        self.url = REGION_URLS.get(region)
-        if not self.url:
-            raise ValueError("Unknown region. Please use one of the following: {}".format(REGION_URLS.keys()))
-
-        self.credentials = grpc.ssl_channel_credentials()
         self.token = token
-        channel = grpc.secure_channel(self.url, self.credentials)
+        self.region = region
+        if channel is None:
+            self.url = REGION_URLS.get(region)
+            if not self.url:
+                raise ValueError("Unknown region. Please use one of the following: {}".format(REGION_URLS.keys()))
+            self.credentials = grpc.ssl_channel_credentials()
+            channel = grpc.secure_channel(self.url, self.credentials)
+        else:
+            self.url = None
+            self.credentials = None
         self.stub = service_pb2_grpc.SiriusStub(channel)
        
 
@@ -60,11 +74,16 @@ class Client(object):
                     ('active-group', group_id)]
                 
         try:
-            mountsResponse = self.stub.Mounts(request, metadata=metadata)
+            mountsResponse = retry.call(
+                lambda: self.stub.Mounts(request, metadata=metadata),
+                "Sirius/Mounts", True, retry.classify_grpc,
+            )
             return mountsResponse.mounts, None
         except grpc.RpcError as e:
             logging.debug("grpc.RpcError %s", e)
             return [], e
+        except retry.CircuitOpenError as e:
+            return [], e
         except AttributeError as e:
             return [], e
 
@@ -98,12 +117,22 @@ class Client(object):
         request = service_pb2.FilesListRequest(mount_id=mount_id, path=path)
         metadata = [('authorization', "bearer: {}".format(self.token)),
                     ('active-group', group_id)]
-        try:
+        def start_listing():
+            # Errors usually surface with the first response, so only that part is retried
             response = self.stub.FilesList(request, metadata=metadata)
+            return next(response, None), response
+
+        try:
+            first, response = retry.call(start_listing, "Sirius/FilesList", True, retry.classify_grpc)
+            if first is None:
+                return
+            yield first, None
             for resp in response:
                 yield resp, None
         except grpc.RpcError as e:
             yield None, e
+        except retry.CircuitOpenError as e:
+            yield None, e
 
     def download_to_file(self, group_id, mount_id, destination_file, path="/", chunk_size=MAX_CHUNK_SIZE): 
         """
@@ -120,26 +149,81 @@ class Client(object):
         metadata = [('authorization', "bearer: {}".format(self.token)),
                     ('active-group', group_id)]
                     
-        total_bytes = 0
-        try:
+        # A failed download can only be restarted if what was already written can be discarded
+        start_position = self._tell(destination_file)
+
+        def download():
+            if start_position is not None:
+                destination_file.seek(start_position)
+                destination_file.truncate()
+            total_bytes = 0
             response = self.stub.FileContents(request, metadata=metadata)
             for resp in response:
                 destination_file.write(resp.bytes)
                 total_bytes += len(resp.bytes)
+            return total_bytes
 
-            logging.debug("Successfully wrote {} bytes into {}".format(total_bytes, destination_file.name))
+        try:
+            total_bytes = retry.call(
+                download, "Sirius/FileContents", True, retry.classify_grpc,
+                policy=None if start_position is not None else retry.NO_RETRY,
+            )
+            logging.debug("Successfully wrote {} bytes into {}".format(total_bytes, getattr(destination_file, "name", destination_file)))
         except grpc.RpcError as e:
             return e
+        except retry.CircuitOpenError as e:
+            return e
         except AttributeError as e:
             return e
 
-    def upload_file(self, group_id, mount_id, file_to_upload, destination_path, chunk_size=MAX_CHUNK_SIZE):
+    def open(self, group_id, mount_id, path, chunk_size=MAX_CHUNK_SIZE, read_ahead=4, cache_blocks=32):
+        """
+        Open a file of the mount for reading, without downloading all of it.
+
+        Returns (file, err). The file is a read-only, seekable io.BufferedReader fetching blocks of 'chunk_size' bytes
+        on demand, reading 'read_ahead' blocks ahead and keeping the last 'cache_blocks' blocks read. Reading a file
+        from its start is cheapest: seeking backwards past the cached blocks means streaming the file again from the
+        start. See athera.sync.remote_file.
+
+        Returns an error if 'path' is not a file.
+        """
+        if chunk_size > MAX_CHUNK_SIZE:
+            raise ValueError("chunk_size exceeds maximum value of {} bytes ({}M)".format(MAX_CHUNK_SIZE, MAX_CHUNK_SIZE / ONE_MB))
+
+        raw = RemoteFileReader(self, group_id, mount_id, path, chunk_size, read_ahead, cache_blocks)
+        try:
+            raw.read_block(0)  # Checks the file can be read, and gets its size
+        except grpc.RpcError as e:
+            raw.close()
+            return None, e
+        except retry.CircuitOpenError as e:
+            raw.close()
+            return None, e
+        return io.BufferedReader(raw), None
+
+    def open_write(self, group_id, mount_id, destination_path, chunk_size=MAX_CHUNK_SIZE, max_queue=8):
+        """
+        Open a file of the mount for writing, uploading what is written as it is written, eg output being produced.
+
+        Returns a write-only file object, see athera.sync.remote_file.RemoteFileWriter. At most 'max_queue' chunks of
+        'chunk_size' bytes wait to be sent: writes block beyond that. The upload completes on close(), which raises
+        IOError if it failed. Used as a context manager, the upload is aborted if the block raises.
+
+        Unlike upload_file, a failed upload cannot be retried as what was written is not kept.
+        """
+        if chunk_size > MAX_CHUNK_SIZE:
+            raise ValueError("chunk_size exceeds maximum value of {} bytes ({}M)".format(MAX_CHUNK_SIZE, MAX_CHUNK_SIZE / ONE_MB))
+        return RemoteFileWriter(self, group_id, mount_id, destination_path, chunk_size, max_queue)
+
+    def upload_file(self, group_id, mount_id, file_to_upload, destination_path, chunk_size=MAX_CHUNK_SIZE, visibility=None):
         """
         Upload a file by chunks of up to 1 Mb.
 
         'mount_id':         Storage Mount to upload file to.
         'file_to_upload':   The file object of the file to upload, read access is enough.
         'destination_path': The path on the mount where the file will be uploaded (relative to the mount root).
+        'visibility':       Optional athera.sync.visibility.Visibility. Once uploaded, the file is rescanned and only
+                            returned without error when the other regions can see it.
 
         An example:
         * The final location needs to be '/data/org/default-my-org/uploads/movie1.mov'
@@ -156,16 +240,158 @@ class Client(object):
             ('path', destination_path),
         ]
 
-        try:
-            response = self.stub.FileUpload(
+        # A failed upload can only be restarted if the file can be read again from the start
+        start_position = self._tell(file_to_upload)
+
+        def upload():
+            if start_position is not None:
+                file_to_upload.seek(start_position)
+            return self.stub.FileUpload(
                 self._retrieve_file_bytes(file_to_upload, chunk_size),
                 metadata=metadata
             )
-            return response, None
+
+        try:
+            response = retry.call(
+                upload, "Sirius/FileUpload", True, retry.classify_grpc,
+                policy=None if start_position is not None else retry.NO_RETRY,
+            )
         except grpc.RpcError as e:
             return None, e
+        except retry.CircuitOpenError as e:
+            return None, e
         except AttributeError as e:
             return None, e
+        if visibility is not None:
+            return response, self._ensure_visible(visibility, group_id, mount_id, [destination_path])
+        return response, None
+
+    def upload_files(self, group_id, mount_id, uploads, chunk_size=MAX_CHUNK_SIZE, max_workers=4, visibility=None):
+        """
+        Upload many files concurrently, see upload_file.
+
+        'uploads':     A list of (file_to_upload, destination_path).
+        'max_workers': Maximum number of uploads in progress.
+        'visibility':  Optional athera.sync.visibility.Visibility. Once every upload has finished, the fewest rescans
+                       covering the uploaded files are made, then the other regions are checked to see them all.
+
+        Returns ([(response, err)] in the order of 'uploads', err). The second err is a VisibilityError if some
+        uploaded files are not visible everywhere before the timeout of 'visibility'.
+        """
+        def upload(item):
+            file_to_upload, destination_path = item
+            return self.upload_file(group_id, mount_id, file_to_upload, destination_path, chunk_size)
+
+        load(grpc, service_pb2)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(upload, uploads))
+        if visibility is None:
+            return results, None
+        uploaded = [path for (_, path), (_, err) in zip(uploads, results) if err is None]
+        return results, self._ensure_visible(visibility, group_id, mount_id, uploaded) if uploaded else None
+
+    def copy_remote(self, group_id, mount_id, path, destination_mount_id, destination_path, destination=None,
+                    chunk_size=MAX_CHUNK_SIZE, max_queue=8, callback=None):
+        """
+        Copy a file between mounts without going through local disk: the chunks of the file are uploaded as they are
+        downloaded.
+
+        'mount_id', 'path':  The file to copy, read with this client.
+        'destination_mount_id', 'destination_path': Where to copy it to (relative to the mount root).
+        'destination': Optional Client uploading the copy, eg of another region. Defaults to this client.
+        'max_queue':   Number of chunks downloaded ahead of the upload, see open_write.
+        'callback':    Optional callback(byte_count), called as each chunk is passed on. When the copy is restarted or
+                       fails, it is called with minus the bytes reported so far.
+
+        The copy is restarted from the start, as configured in athera.retry, if either side fails. A source which
+        cannot be read is reported before anything is uploaded.
+
+        Returns (response, err) like upload_file.
+        """
+        if chunk_size > MAX_CHUNK_SIZE:
+            raise ValueError("chunk_size exceeds maximum value of {} bytes ({}M)".format(MAX_CHUNK_SIZE, MAX_CHUNK_SIZE / ONE_MB))
+        destination = destination or self
+        request = service_pb2.FileContentsRequest(mount_id=mount_id, path=path, chunk_size=chunk_size)
+        metadata = [('authorization', "bearer: {}".format(self.token)),
+                    ('active-group', group_id)]
+
+        reported = [0]
+
+        def rewind():
+            if callback and reported[0]:
+                callback(-reported[0])
+            reported[0] = 0
+
+        def copy():
+            rewind()  # Restarted from the start of the file
+            contents = self.stub.FileContents(request, metadata=metadata)
+            first = next(contents, None)  # Source errors surface here, before the upload starts
+            writer = destination.open_write(group_id, destination_mount_id, destination_path, chunk_size, max_queue)
+            try:
+                for resp in itertools.chain([first] if first is not None else [], contents):
+                    writer.write(resp.bytes)
+                    if callback:
+                        callback(len(resp.bytes))
+                        reported[0] += len(resp.bytes)
+                writer.close()
+            except BaseException as e:
+                upload_error = writer.error
+                writer.abort()
+                if isinstance(e, IOError) and upload_error is not None:
+                    raise upload_error  # The grpc error, for retry to classify
+                raise
+            return writer.response
+
+        try:
+            return retry.call(copy, "Sirius/CopyRemote", True, retry.classify_grpc), None
+        except grpc.RpcError as e:
+            rewind()
+            return None, e
+        except retry.CircuitOpenError as e:
+            rewind()
+            return None, e
+        except (grpc.FutureCancelledError, IOError) as e:
+            rewind()
+            return None, e
+
+    def copy_remote_files(self, group_id, copies, destination=None, chunk_size=MAX_CHUNK_SIZE, max_workers=4,
+                          max_queue=8):
+        """
+        Copy many files between mounts concurrently, see copy_remote.
+
+        'copies':      A list of (mount_id, path, destination_mount_id, destination_path).
+        'max_workers': Maximum number of copies in progress. Each holds at most max_queue + 2 chunks in memory.
+
+        Returns [(response, err)] in the order of 'copies'.
+        """
+        def copy(item):
+            mount_id, path, destination_mount_id, destination_path = item
+            return self.copy_remote(group_id, mount_id, path, destination_mount_id, destination_path, destination,
+                                    chunk_size, max_queue)
+
+        load(grpc, service_pb2)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(copy, copies))
+
+    def _ensure_visible(self, visibility, group_id, mount_id, paths):
+        """
+        None once 'paths' are visible from the regions of 'visibility', otherwise a VisibilityError
+        """
+        from athera.sync.visibility import VisibilityError
+        missing = visibility.ensure(self, group_id, mount_id, paths)
+        return VisibilityError(missing) if missing else None
+
+    @staticmethod
+    def _tell(file):
+        """
+        Current position of a seekable file object, or None
+        """
+        try:
+            if hasattr(file, "seekable") and not file.seekable():
+                return None
+            return file.tell()
+        except (AttributeError, IOError, OSError, ValueError):
+            return None
 
     def _retrieve_file_bytes(self, file, chunk_size):
         chunk = file.read(chunk_size)
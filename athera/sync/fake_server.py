@@ -0,0 +1,224 @@
+"""
+An in-process stand-in for Sirius, the sync gRPC service, backed by a local directory.
+
+It implements Mounts, FilesList, FileContents and FileUpload closely enough for the sync Client to run against it,
+so transfers can be tested and benchmarked offline. Latency, bandwidth and errors can be injected to reproduce slow or
+flaky links.
+
+Each mount is a sub-directory of the root directory, named after the mount id.
+
+Usage:
+    with FakeSiriusServer(mounts=["mount"], latency=0.01, bandwidth=50 * 1024 * 1024) as server:
+        client = server.client()
+        client.upload_file("group", "mount", open("shot.exr", "rb"), "shots/shot.exr")
+"""
+import collections
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from athera.lazy import lazy_import, load
+
+grpc = lazy_import("grpc")
+service_pb2 = lazy_import("athera.sync.sirius.services.service_pb2")
+service_pb2_grpc = lazy_import("athera.sync.sirius.services.service_pb2_grpc")
+file_pb2 = lazy_import("athera.sync.sirius.types.file_pb2")
+mount_pb2 = lazy_import("athera.sync.sirius.types.mount_pb2")
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class FakeSirius(object):
+    """
+    The servicer. Pass it to FakeSiriusServer, or add it to your own grpc server with
+    service_pb2_grpc.add_SiriusServicer_to_server.
+
+    'root':       Directory holding one sub-directory per mount.
+    'mounts':     Mount ids. Their directories are created if missing.
+    'group_id':   Group the mounts belong to.
+    'latency':    Seconds added before each call is handled.
+    'bandwidth':  Bytes per second each transfer is limited to. None for no limit.
+    'error_rate': Fraction of calls failing with 'error_code' before doing anything, so they can safely be retried.
+    'seed':       Seed of the random error injection, for reproducible runs.
+    """
+    def __init__(self, root, mounts=("mount",), group_id="group", latency=0.0, bandwidth=None, error_rate=0.0,
+                 error_code=None, seed=None):
+        self.root = root
+        self.group_id = group_id
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.forced_errors = collections.deque()
+        self.calls = collections.Counter()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.mounts = list(mounts)
+        for mount_id in self.mounts:
+            path = os.path.join(root, mount_id)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    def fail_next(self, count=1, code=None):
+        """
+        Make the next 'count' calls fail with 'code' (UNAVAILABLE by default)
+        """
+        with self.lock:
+            self.forced_errors.extend([code or grpc.StatusCode.UNAVAILABLE] * count)
+
+    # Helpers
+    def _start(self, method, context):
+        """
+        Count the call, apply latency and error injection, and check the metadata common to every call
+        """
+        with self.lock:
+            self.calls[method] += 1
+            code = self.forced_errors.popleft() if self.forced_errors else None
+            if code is None and self.error_rate and self.random.random() < self.error_rate:
+                code = self.error_code or grpc.StatusCode.UNAVAILABLE
+        if self.latency:
+            time.sleep(self.latency)
+        if code is not None:
+            context.abort(code, "Injected error")
+        metadata = dict(context.invocation_metadata())
+        if not metadata.get("authorization"):
+            context.abort(grpc.StatusCode.UNAUTHENTICATED, "Missing authorization")
+        return metadata
+
+    def _throttle(self, size):
+        if self.bandwidth:
+            time.sleep(float(size) / self.bandwidth)
+
+    def _local_path(self, mount_id, path, context):
+        if mount_id not in self.mounts:
+            context.abort(grpc.StatusCode.NOT_FOUND, "Unknown mount {}".format(mount_id))
+        mount_root = os.path.realpath(os.path.join(self.root, mount_id))
+        local = os.path.realpath(os.path.join(mount_root, (path or "").lstrip("/")))
+        if local != mount_root and not local.startswith(mount_root + os.sep):
+            context.abort(grpc.StatusCode.PERMISSION_DENIED, "Path outside of the mount")
+        return local
+
+    # Sirius
+    def Mounts(self, request, context):
+        self._start("Mounts", context)
+        return service_pb2.MountsResult(mounts=[
+            mount_pb2.Mount(id=m, name=m, mount_location="/data/{}".format(m), group_id=self.group_id)
+            for m in self.mounts
+        ])
+
+    def FilesList(self, request, context):
+        self._start("FilesList", context)
+        local = self._local_path(request.mount_id, request.path, context)
+        if not os.path.isdir(local):
+            context.abort(grpc.StatusCode.NOT_FOUND, "No such directory {}".format(request.path))
+        directory = "/" + request.path.strip("/") if request.path.strip("/") else ""
+        for name in sorted(os.listdir(local)):
+            entry = os.path.join(local, name)
+            is_dir = os.path.isdir(entry)
+            yield service_pb2.FilesListResponse(
+                mount_id=request.mount_id,
+                path=request.path,
+                file=file_pb2.File(
+                    path="{}/{}".format(directory, name),
+                    name=name,
+                    mount_id=request.mount_id,
+                    size=0 if is_dir else os.path.getsize(entry),
+                    type=file_pb2.File.DIRECTORY if is_dir else file_pb2.File.FILE,
+                ),
+            )
+
+    def FileContents(self, request, context):
+        self._start("FileContents", context)
+        local = self._local_path(request.mount_id, request.path, context)
+        if not os.path.isfile(local):
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Not a file: {}".format(request.path))
+        chunk_size = request.chunk_size or DEFAULT_CHUNK_SIZE
+        remaining = os.path.getsize(local)
+        with open(local, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                self._throttle(len(chunk))
+                with self.lock:
+                    self.bytes_sent += len(chunk)
+                yield service_pb2.FileContentsResult(bytes=chunk, bytes_remaining=max(0, remaining))
+
+    def FileUpload(self, request_iterator, context):
+        metadata = self._start("FileUpload", context)
+        if not metadata.get("path"):
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, "Missing path")
+        local = self._local_path(metadata.get("mount-id"), metadata["path"], context)
+        directory = os.path.dirname(local)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Written aside then renamed, so a failed upload leaves any previous version intact
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for request in request_iterator:
+                    self._throttle(len(request.bytes))
+                    f.write(request.bytes)
+                    with self.lock:
+                        self.bytes_received += len(request.bytes)
+            os.replace(tmp_path, local)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return service_pb2.FileUploadResponse()
+
+
+class FakeSiriusServer(object):
+    """
+    Runs a FakeSirius on a local port. Without a 'root', a temporary directory is used and removed by stop().
+    Other keyword arguments are passed to FakeSirius.
+    """
+    def __init__(self, root=None, max_workers=16, **kwargs):
+        self.temporary = root is None
+        self.root = tempfile.mkdtemp(prefix="fake-sirius-") if root is None else root
+        self.servicer = FakeSirius(self.root, **kwargs)
+        self.max_workers = max_workers
+        self.server = None
+        self.address = None
+
+    def start(self):
+        load(grpc, service_pb2, file_pb2, mount_pb2)
+        self.server = grpc.server(ThreadPoolExecutor(max_workers=self.max_workers))
+        service_pb2_grpc.add_SiriusServicer_to_server(self.servicer, self.server)
+        port = self.server.add_insecure_port("127.0.0.1:0")
+        self.server.start()
+        self.address = "127.0.0.1:{}".format(port)
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.stop(None).wait()
+            self.server = None
+        if self.temporary and os.path.isdir(self.root):
+            # Handlers of cancelled calls may still be removing their partial uploads
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def client(self, token="token"):
+        """
+        A sync Client connected to this server
+        """
+        from athera.sync.client import Client
+        return Client(self.address, token, channel=grpc.insecure_channel(self.address))
+
+    def local_path(self, mount_id, path):
+        """
+        Where a file of a mount is stored
+        """
+        return os.path.join(self.root, mount_id, path.lstrip("/"))
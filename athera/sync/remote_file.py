@@ -0,0 +1,402 @@
+"""
+File objects over the files of a mount, see Client.open and Client.open_write.
+
+FileContents streams a file from its start, in chunks: there is no way to ask for a range. RemoteFileReader splits the
+stream into blocks of 'chunk_size' bytes kept in an LRU cache, and a background thread reads 'read_ahead' blocks ahead
+of the last block asked for, so sequential reads rarely wait on the network. gRPC flow control still lets the server
+send a few MB more before the stream is held back.
+
+Seeking within the cache, or forwards, is cheap: blocks skipped over are read from the stream on the way. Seeking
+backwards past the cache restarts the stream from the start of the file, so readers jumping around a large file should
+be given a larger cache.
+
+RemoteFileWriter is the other way around: the chunks written are queued to a FileUpload call as they are produced, so
+output can be uploaded without being written to local disk first. The queue is bounded, holding back a writer faster
+than the network.
+
+Usage:
+    f, err = client.open(group_id, mount_id, "shots/shot.exr")
+    header = f.read(4096)
+    with tarfile.open(fileobj=client.open(group_id, mount_id, "renders.tar")[0]) as tar:
+        print(tar.getnames())
+
+    with client.open_write(group_id, mount_id, "renders.tar") as f:
+        with tarfile.open(fileobj=f, mode="w|") as tar:
+            tar.add("renders")
+"""
+import collections
+import io
+import logging
+import queue
+import threading
+from athera.lazy import lazy_import, load
+from athera import retry
+
+grpc = lazy_import("grpc")
+service_pb2 = lazy_import("athera.sync.sirius.services.service_pb2")
+
+
+class Stream(object):
+    """
+    One FileContents call, read by a background thread into the cache of a RemoteFileReader
+    """
+    def __init__(self, reader):
+        self.reader = reader
+        self.next_block = 0
+        self.error = None
+        self.done = False
+        self.cancelled = False
+        self.response = None
+        load(grpc, service_pb2)
+        self.thread = threading.Thread(target=self.run, name="athera-remote-file")
+        self.thread.daemon = True
+
+    def run(self):
+        reader = self.reader
+        request = service_pb2.FileContentsRequest(mount_id=reader.mount_id, path=reader.path,
+                                                  chunk_size=reader.block_size)
+        metadata = [('authorization', "bearer: {}".format(reader.client.token)),
+                    ('active-group', reader.group_id)]
+        received = 0
+        pending = b""
+        try:
+            self.response = reader.client.stub.FileContents(request, metadata=metadata)
+            for resp in self.response:
+                if reader.size is None:
+                    reader.size = received + len(resp.bytes) + resp.bytes_remaining
+                received += len(resp.bytes)
+                pending += resp.bytes
+                while len(pending) >= reader.block_size:
+                    block, pending = pending[:reader.block_size], pending[reader.block_size:]
+                    if not self.add_block(block):
+                        return
+            if pending:
+                self.add_block(pending)
+        except grpc.RpcError as e:
+            with reader.condition:
+                if not self.cancelled:
+                    self.error = e
+                reader.condition.notify_all()
+            return
+        finally:
+            # Cancelled before the call was made, the thread stops at the first block: end the call too
+            if self.cancelled and self.response is not None:
+                self.response.cancel()
+        with reader.condition:
+            if not self.cancelled:
+                reader.size = received
+            self.done = True
+            reader.condition.notify_all()
+
+    def add_block(self, block):
+        """
+        Cache the next block, then wait until it is time to read further. False once cancelled.
+        """
+        reader = self.reader
+        with reader.condition:
+            if self.cancelled:
+                return False
+            reader.cache_block(self.next_block, block)
+            self.next_block += 1
+            reader.condition.notify_all()
+            while not self.cancelled and self.next_block > reader.wanted + reader.read_ahead:
+                reader.condition.wait()
+            return not self.cancelled
+
+    def cancel(self):
+        """
+        Called with the condition of the reader held
+        """
+        self.cancelled = True
+        self.reader.condition.notify_all()
+        if self.response is not None:
+            self.response.cancel()
+
+
+class RemoteFileReader(io.RawIOBase):
+    """
+    A read-only, seekable raw file over a file of a mount. Client.open wraps it in an io.BufferedReader.
+
+    'chunk_size':   Size of the blocks read and cached, at most MAX_CHUNK_SIZE.
+    'read_ahead':   Number of blocks read ahead of the last one asked for.
+    'cache_blocks': Number of blocks kept in the LRU cache, at least read_ahead + 1.
+
+    'streams' counts the FileContents calls made, one more each time the stream had to be restarted.
+    Reads raise IOError if the file cannot be read, once retries allowed by athera.retry are exhausted.
+    """
+    def __init__(self, client, group_id, mount_id, path, chunk_size, read_ahead=4, cache_blocks=32):
+        super(RemoteFileReader, self).__init__()
+        self.logger = logging.getLogger("athera.sync.remote_file")
+        self.client = client
+        self.group_id = group_id
+        self.mount_id = mount_id
+        self.path = path
+        self.name = path
+        self.block_size = chunk_size
+        self.read_ahead = read_ahead
+        self.cache_blocks = max(cache_blocks, read_ahead + 1)
+        self.condition = threading.Condition()
+        self.cache = collections.OrderedDict()  # block index -> bytes, least recently used first
+        self.stream = None
+        self.streams = 0
+        self.wanted = 0
+        self.size = None
+        self.position = 0
+
+    # Cache
+    def cache_block(self, index, block):
+        """
+        Called with the condition held
+        """
+        self.cache[index] = block
+        self.cache.move_to_end(index)
+        while len(self.cache) > self.cache_blocks:
+            self.cache.popitem(last=False)
+
+    def cached_block(self, index):
+        """
+        Block 'index' if it is cached, otherwise None. Lets the stream read ahead of it. Called with the condition held.
+        """
+        block = self.cache.get(index)
+        if block is not None:
+            self.cache.move_to_end(index)
+            self.wanted = index
+            self.condition.notify_all()
+        return block
+
+    def _block(self, index):
+        """
+        Block 'index', waiting for the stream to reach it. Raises the grpc error of a failed stream.
+        """
+        with self.condition:
+            while True:
+                block = self.cached_block(index)
+                if block is not None:
+                    return block
+                if self.size is not None and index * self.block_size >= self.size:
+                    return b""
+                stream = self.stream
+                if stream is not None and stream.error is not None:
+                    self.stream = None
+                    raise stream.error
+                if stream is None or stream.next_block > index:
+                    # Behind the stream, and no longer cached: read again from the start
+                    if stream is not None:
+                        stream.cancel()
+                        self.logger.debug("Restarting the stream of %s for block %d", self.path, index)
+                    self.stream = stream = Stream(self)
+                    self.streams += 1
+                    stream.thread.start()
+                elif stream.done:
+                    return b""
+                self.wanted = index
+                self.condition.notify_all()
+                self.condition.wait()
+
+    def read_block(self, index):
+        """
+        Block 'index', the stream being restarted as configured in athera.retry if it fails
+        """
+        with self.condition:
+            block = self.cached_block(index)
+        if block is not None:
+            return block
+        return retry.call(lambda: self._block(index), "Sirius/FileContents", True, retry.classify_grpc)
+
+    # io.RawIOBase
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError("Invalid whence ({})".format(whence))
+        if position < 0:
+            raise ValueError("Negative seek position {}".format(position))
+        self.position = position
+        return position
+
+    def readinto(self, buffer):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        index, offset = divmod(self.position, self.block_size)
+        try:
+            block = self.read_block(index)
+        except (grpc.RpcError, retry.CircuitOpenError) as e:
+            raise IOError("Could not read {}: {}".format(self.path, e))
+        count = max(0, min(len(buffer), len(block) - offset))
+        buffer[:count] = memoryview(block)[offset:offset + count]
+        self.position += count
+        return count
+
+    def close(self):
+        with self.condition:
+            if self.stream is not None:
+                self.stream.cancel()
+                self.stream = None
+            self.cache.clear()
+        super(RemoteFileReader, self).close()
+
+
+# Queued by RemoteFileWriter.abort
+ABORT = object()
+
+
+class RemoteFileWriter(io.RawIOBase):
+    """
+    A write-only, non-seekable file uploading what is written to 'destination_path' of the mount. See Client.open_write.
+
+    'chunk_size': Size of the messages sent, at most MAX_CHUNK_SIZE.
+    'max_queue':  Number of chunks waiting to be sent before write() blocks. At most (max_queue + 2) * chunk_size
+                  bytes are held in memory, besides what gRPC flow control lets be buffered in flight.
+
+    The upload completes on close(), which raises IOError if it failed. Leaving a with block on an exception aborts
+    the upload instead. A stream cannot be replayed, so failed uploads are not retried. 'response' holds the
+    FileUploadResponse once closed.
+    """
+    def __init__(self, client, group_id, mount_id, destination_path, chunk_size, max_queue=8):
+        super(RemoteFileWriter, self).__init__()
+        self.client = client
+        self.group_id = group_id
+        self.mount_id = mount_id
+        self.name = destination_path
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.pending = bytearray()
+        self.position = 0
+        self.call = None
+        self.response = None
+        self.error = None
+        self.aborted = False
+        self.started = threading.Event()
+        self.finished = threading.Event()
+        load(grpc, service_pb2)
+        self.thread = threading.Thread(target=self.run, name="athera-remote-upload")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def requests(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                return
+            if chunk is ABORT:
+                # Ending the requests would complete the upload: cancel the call first
+                self.started.wait()
+                self.call.cancel()
+                return
+            yield service_pb2.FileUploadRequest(chunk_size=self.chunk_size, bytes=chunk)
+
+    def run(self):
+        metadata = [
+            ('authorization', "bearer: {}".format(self.client.token)),
+            ('active-group', self.group_id),
+            ('mount-id', self.mount_id),
+            ('path', self.name),
+        ]
+
+        def upload():
+            self.call = self.client.stub.FileUpload.future(self.requests(), metadata=metadata)
+            self.started.set()
+            return self.call.result()
+
+        try:
+            self.response = retry.call(upload, "Sirius/FileUpload", True, retry.classify_grpc, policy=retry.NO_RETRY)
+        except (grpc.RpcError, grpc.FutureCancelledError, retry.CircuitOpenError) as e:
+            self.error = e
+        finally:
+            self.finished.set()
+
+    def put(self, chunk):
+        """
+        Queue a chunk, or the end of the file (None). Raises IOError if the upload has stopped.
+        """
+        while not self.finished.is_set():
+            try:
+                self.queue.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        self.check()
+        raise IOError("Upload of {} stopped before the end of the file".format(self.name))
+
+    def check(self):
+        if self.error is not None:
+            raise IOError("Could not upload {}: {}".format(self.name, self.error))
+
+    # io.RawIOBase
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        """
+        Queue all of 'data', blocking while the queue is full. Raises IOError if the upload failed.
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        self.check()
+        count = memoryview(data).nbytes
+        self.pending += data
+        while len(self.pending) >= self.chunk_size:
+            self.put(bytes(self.pending[:self.chunk_size]))
+            del self.pending[:self.chunk_size]
+        self.position += count
+        return count
+
+    def close(self):
+        """
+        Send what remains and wait for the upload to complete. Raises IOError if it failed.
+        """
+        if self.closed:
+            return
+        try:
+            if not self.aborted:
+                if self.pending:
+                    self.put(bytes(self.pending))
+                    self.pending = bytearray()
+                self.put(None)
+                self.thread.join()
+                self.check()
+        finally:
+            super(RemoteFileWriter, self).close()
+
+    def abort(self):
+        """
+        Cancel the upload rather than completing it, leaving the destination file as it was
+        """
+        if self.closed:
+            return
+        self.aborted = True
+        if self.started.is_set():
+            self.call.cancel()
+        # Otherwise the request iterator cancels the call once it is made
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.queue.put(ABORT)
+        self.thread.join()
+        super(RemoteFileWriter, self).close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
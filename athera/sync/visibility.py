@@ -0,0 +1,139 @@
+"""
+Make sure uploaded files are visible from other regions before relying on them, eg as inputs of compute Jobs.
+
+An upload lands in the region of the Client which made it. Other regions only see it after the storage driver of the
+mount has been rescanned. Visibility triggers the fewest rescans covering the uploaded files (see
+athera.api.rescan), waits for indexing, then lists the files from a Client of each other region until they all
+appear.
+
+Usage:
+    visibility = Visibility(base_url, ["us-west1"])
+    results, err = client.upload_files(group_id, mount_id, uploads, visibility=visibility)
+    if err:
+        print(err.missing)
+"""
+import collections
+import logging
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from athera import retry
+from athera.api import rate_limit, rescan, storage
+
+
+class VisibilityError(Exception):
+    """
+    Uploaded files which could not be seen from some regions before the timeout
+    """
+    def __init__(self, missing):
+        super(VisibilityError, self).__init__("Files not visible: {}".format(
+            "; ".join("{}: {}".format(region, ", ".join(paths)) for region, paths in sorted(missing.items()))))
+        self.missing = missing
+
+
+class Visibility(object):
+    """
+    'base_url':  Athera api url, used to find and rescan the storage driver of the mount.
+    'regions':   Regions which must see the uploads, as region names or sync Clients.
+    'driver_id': Storage driver of the mount, found from get_drivers if not given. Upload paths are assumed to be
+                 relative to the root of the driver, as they are for the default mount of a driver.
+    'timeout':   Seconds to wait for rescans and listings altogether.
+    'poll_interval': Seconds between indexing polls and between listings.
+    'max_workers':   Maximum number of concurrent rescan, polling and listing requests.
+    """
+    def __init__(self, base_url, regions, driver_id=None, timeout=600, poll_interval=5.0, max_workers=8):
+        self.logger = logging.getLogger("athera.sync.visibility")
+        self.base_url = base_url
+        self.regions = regions
+        self.driver_id = driver_id
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.max_workers = max_workers
+        self.clients = {}
+
+    def get_clients(self, token):
+        """
+        {region name: Client} for the regions to check
+        """
+        from athera.sync.client import Client  # client calls this module
+        clients = {}
+        for region in self.regions:
+            if isinstance(region, str):
+                if region not in self.clients:
+                    self.clients[region] = Client(region, token)
+                clients[region] = self.clients[region]
+            else:
+                clients[region.region] = region
+        return clients
+
+    def find_driver(self, group_id, token, mount_id):
+        """
+        Id of the storage driver providing the mount, or None
+        """
+        try:
+            response = storage.get_drivers(self.base_url, group_id, token)
+        except (requests.RequestException, retry.CircuitOpenError, rate_limit.RateLimitTimeout) as e:
+            self.logger.warning("Could not get drivers: %s", e)
+            return None
+        if response.status_code != requests.codes.ok:
+            return None
+        for driver in response.json().get("drivers", []):
+            if any(mount.get("id") == mount_id for mount in driver.get("mounts") or []):
+                return driver["id"]
+        return None
+
+    def ensure(self, client, group_id, mount_id, paths):
+        """
+        Rescan the directories of 'paths', uploaded by 'client' to the mount, then wait until every region lists them.
+        Returns {region: [paths not visible]}, empty once every path is visible everywhere.
+        """
+        deadline = time.time() + self.timeout
+        paths = [rescan.normalize_path(p) for p in paths]
+        driver_id = self.driver_id or self.find_driver(group_id, client.token, mount_id)
+        if driver_id:
+            scheduler = rescan.RescanScheduler(self.base_url, group_id, client.token, debounce=None,
+                                               max_workers=self.max_workers, poll_interval=self.poll_interval)
+            for path in paths:
+                scheduler.add_file(driver_id, path)
+            if not scheduler.wait(self.timeout):
+                self.logger.warning("Indexing of driver %s has not finished", driver_id)
+        else:
+            self.logger.warning("No storage driver found for mount %s, not rescanning", mount_id)
+        return self.verify(client.token, group_id, mount_id, paths, deadline)
+
+    def verify(self, token, group_id, mount_id, paths, deadline):
+        """
+        List the directories of 'paths' from every region, in parallel, until each file appears or the deadline passes
+        """
+        names = collections.defaultdict(set)
+        for path in paths:
+            names[posixpath.dirname(path)].add(posixpath.basename(path))
+        clients = self.get_clients(token)
+        pending = dict(((region, directory), set(files)) for region in clients for directory, files in names.items())
+
+        def listed(key):
+            region, directory = key
+            found = set()
+            for response, err in clients[region].get_files(group_id, mount_id, directory):
+                if err is not None:
+                    self.logger.debug("Listing %s from %s failed: %s", directory, region, err)
+                    break
+                found.add(response.file.name or posixpath.basename(response.file.path))
+            return found
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                keys = list(pending)
+                for key, found in zip(keys, executor.map(listed, keys)):
+                    pending[key] -= found
+                    if not pending[key]:
+                        del pending[key]
+                if not pending or time.time() + self.poll_interval > deadline:
+                    break
+                time.sleep(self.poll_interval)
+
+        missing = collections.defaultdict(list)
+        for (region, directory), files in pending.items():
+            missing[region].extend(sorted(posixpath.join(directory, f) for f in files))
+        return dict(missing)
@@ -0,0 +1,80 @@
+"""
+Comparison report between two benchmark runs, eg of the last release and of a change:
+
+    python -m pytest benchmarks --benchmark-json=before.json
+    ... change or check out another version ...
+    python -m pytest benchmarks --benchmark-json=after.json
+    python benchmarks/compare.py before.json after.json --threshold 10
+
+For each benchmark of both runs, prints the mean time and the numbers of its extra_info (MB/s, calls/s, peak memory...)
+before and after, with the change in percent. Exits with status 1 if any mean time got slower by more than
+'threshold' percent.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    """
+    {benchmark fullname: benchmark} of a --benchmark-json file
+    """
+    with open(path, "r") as f:
+        return dict((b["fullname"], b) for b in json.load(f)["benchmarks"])
+
+
+def change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) * 100.0 / before
+
+
+def format_change(value):
+    return "" if value is None else "{:+.1f}%".format(value)
+
+
+def compare(before, after):
+    """
+    Rows of (name, metric, before, after, change in percent) for the benchmarks of both runs
+    """
+    rows = []
+    for name in sorted(set(before) & set(after)):
+        b, a = before[name], after[name]
+        rows.append((name, "mean_s", b["stats"]["mean"], a["stats"]["mean"], change(b["stats"]["mean"], a["stats"]["mean"])))
+        extra = b.get("extra_info") or {}
+        for key in sorted(extra):
+            old, new = extra[key], (a.get("extra_info") or {}).get(key)
+            if isinstance(old, (int, float)) and isinstance(new, (int, float)) and not isinstance(old, bool):
+                rows.append((name, key, old, new, change(old, new)))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two pytest-benchmark json files")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent of slowdown failing the comparison")
+    args = parser.parse_args(argv)
+
+    before, after = load(args.before), load(args.after)
+    rows = compare(before, after)
+    width = max([len(r[0]) for r in rows] + [9])
+    print("{:<{w}}  {:<20} {:>14} {:>14} {:>9}".format("benchmark", "metric", "before", "after", "change", w=width))
+    regressions = []
+    for name, metric, old, new, percent in rows:
+        flag = ""
+        if metric == "mean_s" and percent is not None and percent > args.threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("{:<{w}}  {:<20} {:>14.6g} {:>14.6g} {:>9}{}".format(name, metric, old, new, format_change(percent), flag, w=width))
+    for name in sorted(set(before) ^ set(after)):
+        print("{:<{w}}  only in {}".format(name, "before" if name in before else "after", w=width))
+
+    if regressions:
+        print("\n{} benchmarks slower by more than {}%".format(len(regressions), args.threshold))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
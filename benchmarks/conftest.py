@@ -0,0 +1,106 @@
+"""
+Shared fixtures of the benchmarks. See the Benchmarks section of the README for how to run them.
+"""
+import multiprocessing
+import os
+import sys
+
+# Allow imports from project root
+root_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+
+import pytest
+
+# Sizes above this are skipped unless raised, eg ATHERA_BENCHMARK_MAX_BYTES=10737418240 for the 10 GB runs
+MAX_BYTES = int(os.getenv("ATHERA_BENCHMARK_MAX_BYTES", 64 * 1024 * 1024))
+
+
+def make_job(i):
+    """
+    A Job shaped like the ones listed by the api
+    """
+    return {
+        "id": "job-{}".format(i),
+        "name": "Render shot {}".format(i),
+        "status": "COMPLETE" if i % 3 else "ACTIVE",
+        "partCount": 10,
+        "nodeCount": 2,
+        "computeData": {
+            "userID": "user",
+            "groupID": "group",
+            "appID": "app",
+            "profileID": "profile",
+            "filePath": "/data/project/shot_{}.nk".format(i),
+            "frameRange": {"start": 1, "finish": 240, "increment": 1},
+            "region": "europe-west1",
+            "arguments": {"script": "--help"},
+        },
+    }
+
+
+def serve_api(connection, options, job_count):
+    from athera.api.fake_server import FakeApiServer
+    server = FakeApiServer(**options).start()
+    for i in range(job_count):
+        server.api.add_job(make_job(i))
+    connection.send(server.base_url)
+    connection.recv()
+    server.stop()
+
+
+def serve_sirius(connection, root, options):
+    from athera.sync.fake_server import FakeSiriusServer
+    server = FakeSiriusServer(root, **options).start()
+    connection.send(server.address)
+    connection.recv()  # Until the benchmarks are done
+    server.stop()
+
+
+def run_server(target, *args):
+    """
+    Run target(connection, *args) in its own process, so that the CPU time measured is only the client's.
+    Yields what it sends back over the connection once it is serving.
+    """
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=target, args=(child,) + args)
+    process.start()
+    try:
+        yield parent.recv()
+    finally:
+        parent.send("stop")
+        process.join(10)
+
+
+# Jobs held by the api stand-in
+API_JOB_COUNT = 10000
+
+
+@pytest.fixture(scope="session")
+def api_url():
+    """
+    Base url of a FakeApiServer holding API_JOB_COUNT jobs, with 1 ms of latency per request
+    """
+    for url in run_server(serve_api, {"latency": 0.001}, API_JOB_COUNT):
+        yield url
+
+
+@pytest.fixture(scope="session")
+def sirius(tmp_path_factory):
+    """
+    A FakeSiriusServer running in its own process. Yields (address, root directory).
+    """
+    root = str(tmp_path_factory.mktemp("sirius"))
+    for address in run_server(serve_sirius, root, {"mounts": ["mount"], "max_workers": 32}):
+        yield address, root
+
+
+@pytest.fixture
+def sync_client(sirius):
+    import grpc
+    from athera.sync.client import Client
+    address, _ = sirius
+    return Client(address, "token", channel=grpc.insecure_channel(address, options=[
+        ("grpc.max_receive_message_length", 64 * 1024 * 1024),
+    ]))
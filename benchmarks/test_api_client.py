@@ -0,0 +1,157 @@
+"""
+Overhead and concurrency of the athera.api client against a FakeApiServer running in its own process:
+
+ - per call overhead of the client, with the network taken out (headers, request pipeline, json decoding)
+ - calls per second, opening a connection per call (what requests.request does) or reusing a pooled Session
+ - fan-out of get_job over 1k ids: sequential, thread pool, and asyncio with requests run in an executor
+ - peak client memory while listing 10k jobs
+
+Calls per second and memory are reported in each benchmark's extra_info. Compare two runs with benchmarks/compare.py.
+
+    python -m pytest benchmarks/test_api_client.py --benchmark-json=benchmarks/results/api.json
+"""
+import asyncio
+import json
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import requests
+from athera.api import common, compute, models
+from conftest import make_job, API_JOB_COUNT
+
+CALL_COUNT = 200
+FAN_OUT_COUNT = 1000
+FAN_OUT_WORKERS = 16
+LISTING_PAGE_SIZE = 1000
+
+
+def canned_response(data):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps(data).encode("utf-8")
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+@pytest.fixture
+def reuse_connections(monkeypatch):
+    """
+    Send every request through one Session, with a pool large enough for the fan-out
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=FAN_OUT_WORKERS)
+    session.mount("http://", adapter)
+    monkeypatch.setattr(common, "send", lambda method, url, **kwargs: session.request(method, url, **kwargs))
+    yield session
+    session.close()
+
+
+def calls_per_second(benchmark, count):
+    mean = benchmark.stats.stats.mean
+    benchmark.extra_info["calls"] = count
+    benchmark.extra_info["calls_per_s"] = count / mean if mean else None
+
+
+# Per call overhead
+def test_headers(benchmark):
+    benchmark(common.headers, "group", "token")
+
+
+def test_call_overhead(benchmark, monkeypatch):
+    """ get_job and json() with send() answering immediately """
+    response = canned_response(make_job(0))
+    monkeypatch.setattr(common, "send", lambda method, url, **kwargs: response)
+    benchmark(lambda: compute.get_job("http://api", "group", "token", "job-0").json())
+
+
+def test_decode_json(benchmark):
+    content = json.dumps(make_job(0)).encode("utf-8")
+    benchmark(lambda: json.loads(content.decode("utf-8")))
+
+
+@pytest.mark.skipif(not models.use_orjson, reason="orjson is not installed")
+def test_decode_orjson(benchmark):
+    content = json.dumps(make_job(0)).encode("utf-8")
+    benchmark(models.loads, content)
+
+
+# Connection reuse
+def get_jobs_sequentially(base_url, count):
+    for i in range(count):
+        assert compute.get_job(base_url, "group", "token", "job-{}".format(i)).status_code == 200
+
+
+def test_calls_new_connection(benchmark, api_url):
+    benchmark.pedantic(get_jobs_sequentially, (api_url, CALL_COUNT), rounds=5)
+    calls_per_second(benchmark, CALL_COUNT)
+
+
+def test_calls_reused_connection(benchmark, api_url, reuse_connections):
+    benchmark.pedantic(get_jobs_sequentially, (api_url, CALL_COUNT), rounds=5)
+    calls_per_second(benchmark, CALL_COUNT)
+
+
+# Fan-out
+def fan_out_sequential(base_url, ids):
+    return [compute.get_job(base_url, "group", "token", i).status_code for i in ids]
+
+
+def fan_out_threads(base_url, ids):
+    with ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS) as executor:
+        return list(executor.map(lambda i: compute.get_job(base_url, "group", "token", i).status_code, ids))
+
+
+def fan_out_asyncio(base_url, ids):
+    async def fan_out():
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS) as executor:
+            responses = await asyncio.gather(*[
+                loop.run_in_executor(executor, compute.get_job, base_url, "group", "token", i) for i in ids
+            ])
+        return [r.status_code for r in responses]
+    return asyncio.run(fan_out())
+
+
+@pytest.mark.parametrize("fan_out", [fan_out_sequential, fan_out_threads, fan_out_asyncio],
+                         ids=["sequential", "threads", "asyncio"])
+def test_fan_out(benchmark, api_url, reuse_connections, fan_out):
+    ids = ["job-{}".format(i) for i in range(FAN_OUT_COUNT)]
+    statuses = benchmark.pedantic(fan_out, (api_url, ids), rounds=3)
+    assert statuses == [200] * FAN_OUT_COUNT
+    calls_per_second(benchmark, FAN_OUT_COUNT)
+
+
+# Memory
+def count_streamed(base_url):
+    return sum(1 for _ in compute.iter_jobs(base_url, "group", "token", page_size=LISTING_PAGE_SIZE))
+
+
+def count_listed(base_url):
+    return len(list(compute.iter_jobs(base_url, "group", "token", page_size=LISTING_PAGE_SIZE)))
+
+
+def count_single_page(base_url):
+    return len(compute.get_jobs(base_url, "group", "token", params={"limit": API_JOB_COUNT}).json()["jobs"])
+
+
+@pytest.mark.parametrize("listing", [count_streamed, count_listed, count_single_page],
+                         ids=["streamed", "list", "single-page"])
+def test_listing_memory(benchmark, api_url, reuse_connections, listing):
+    """ Timings include the overhead of tracemalloc """
+    peaks = []
+
+    def traced():
+        tracemalloc.start()
+        try:
+            assert listing(api_url) == API_JOB_COUNT
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    benchmark.pedantic(traced, rounds=3)
+    benchmark.extra_info["items"] = API_JOB_COUNT
+    benchmark.extra_info["peak_bytes"] = max(peaks)
+    benchmark.extra_info["peak_bytes_per_item"] = float(max(peaks)) / API_JOB_COUNT
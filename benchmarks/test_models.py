@@ -0,0 +1,54 @@
+"""
+Decoding a listing of 10k jobs: response.json() and dict lookups against models, with json and orjson.
+
+    python -m pytest benchmarks/test_models.py --benchmark-json=benchmarks/results/models.json
+"""
+import json
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from athera.api import models
+from athera.api.compute import terminal_status
+from conftest import make_job
+
+JOB_COUNT = 10000
+
+
+@pytest.fixture(scope="module")
+def content():
+    return json.dumps({"jobs": [make_job(i) for i in range(JOB_COUNT)]}).encode("utf-8")
+
+
+def count_running_dicts(content):
+    jobs = json.loads(content.decode("utf-8"))["jobs"]
+    return sum(1 for job in jobs if job["status"] not in terminal_status)
+
+
+def count_running_models(content):
+    jobs = models.ModelList(models.loads(content)["jobs"], models.Job)
+    return sum(1 for job in jobs if not job.is_terminal)
+
+
+def test_dicts(benchmark, content):
+    assert benchmark(count_running_dicts, content) == JOB_COUNT // 3 + 1
+
+
+def test_models_json(benchmark, content, monkeypatch):
+    monkeypatch.setattr(models, "use_orjson", False)
+    assert benchmark(count_running_models, content) == JOB_COUNT // 3 + 1
+
+
+@pytest.mark.skipif(not models.use_orjson, reason="orjson is not installed")
+def test_models_orjson(benchmark, content):
+    assert benchmark(count_running_models, content) == JOB_COUNT // 3 + 1
+
+
+def first_page_names(content):
+    jobs = models.ModelList(models.loads(content)["jobs"], models.Job)
+    return [job.name for job in jobs[:50]]
+
+
+def test_models_first_page(benchmark, content):
+    """ Only the first 50 jobs are looked at, as by a paged view """
+    assert len(benchmark(first_page_names, content)) == 50
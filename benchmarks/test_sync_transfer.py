@@ -0,0 +1,137 @@
+"""
+Throughput of sync transfers against a local FakeSiriusServer: upload_file and download_to_file across file and
+chunk sizes, and upload_files across file counts and concurrency.
+
+Each benchmark reports, in its extra_info, the MB/s reached and the client CPU seconds spent per GB transferred.
+
+    python -m pytest benchmarks/test_sync_transfer.py --benchmark-json=benchmarks/results/sync.json
+"""
+import io
+import os
+import time
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from conftest import MAX_BYTES
+
+KB = 1024
+MB = 1024 * KB
+GB = 1024 * MB
+
+FILE_SIZES = [KB, MB, 16 * MB, 64 * MB, GB, 10 * GB]
+CHUNK_SIZES = [64 * KB, 256 * KB, MB]
+FILE_COUNTS = [10, 100]
+CONCURRENCY = [1, 4, 16]
+
+
+class ZeroFile(io.RawIOBase):
+    """
+    A seekable file of 'size' zero bytes which uses no memory or disk, to upload large sizes
+    """
+    def __init__(self, size):
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self.position = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence] + offset
+        return self.position
+
+    def read(self, count=-1):
+        count = self.size - self.position if count < 0 else min(count, self.size - self.position)
+        self.position += count
+        return b"\0" * count
+
+
+class NullFile(io.RawIOBase):
+    """
+    A writable file discarding what it is given, to download large sizes
+    """
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return len(data)
+
+
+def size_id(size):
+    for unit, name in ((GB, "GB"), (MB, "MB"), (KB, "KB")):
+        if size >= unit:
+            return "{}{}".format(size // unit, name)
+    return "{}B".format(size)
+
+
+def run(benchmark, func, total_bytes, rounds):
+    """
+    Benchmark func(), recording throughput and client CPU per GB in extra_info
+    """
+    cpu = []
+
+    def measured():
+        start = time.process_time()
+        func()
+        cpu.append(time.process_time() - start)
+
+    benchmark.pedantic(measured, rounds=rounds, iterations=1, warmup_rounds=0)
+    mean = benchmark.stats.stats.mean
+    benchmark.extra_info["bytes"] = total_bytes
+    benchmark.extra_info["mb_per_s"] = total_bytes / MB / mean if mean else None
+    benchmark.extra_info["cpu_s_per_gb"] = sum(cpu) / len(cpu) * GB / total_bytes
+
+
+def rounds_for(size):
+    return max(1, min(20, (256 * MB) // max(size, 1)))
+
+
+def skip_large(size):
+    if size > MAX_BYTES:
+        pytest.skip("Larger than ATHERA_BENCHMARK_MAX_BYTES")
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES, ids=size_id)
+@pytest.mark.parametrize("size", FILE_SIZES, ids=size_id)
+def test_upload(benchmark, sync_client, size, chunk_size):
+    skip_large(size)
+
+    def upload():
+        _, err = sync_client.upload_file("group", "mount", ZeroFile(size), "upload.bin", chunk_size=chunk_size)
+        assert err is None, err
+    run(benchmark, upload, size, rounds_for(size))
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES, ids=size_id)
+@pytest.mark.parametrize("size", FILE_SIZES, ids=size_id)
+def test_download(benchmark, sirius, sync_client, size, chunk_size):
+    skip_large(size)
+    _, root = sirius
+    path = "download-{}.bin".format(size)
+    local_path = os.path.join(root, "mount", path)
+    if not os.path.exists(local_path):
+        with open(local_path, "wb") as f:
+            f.truncate(size)
+
+    def download():
+        err = sync_client.download_to_file("group", "mount", NullFile(), path=path, chunk_size=chunk_size)
+        assert err is None, err
+    run(benchmark, download, size, rounds_for(size))
+
+
+@pytest.mark.parametrize("max_workers", CONCURRENCY)
+@pytest.mark.parametrize("count", FILE_COUNTS)
+def test_upload_many(benchmark, sync_client, count, max_workers):
+    size = 64 * KB
+
+    def upload():
+        uploads = [(ZeroFile(size), "many/{}.bin".format(i)) for i in range(count)]
+        results, _ = sync_client.upload_files("group", "mount", uploads, max_workers=max_workers)
+        assert all(err is None for _, err in results)
+    run(benchmark, upload, count * size, 5)
@@ -23,22 +23,22 @@ class AppSearcher(object):
         self.base_url = base_url
         self.group_id = group_id
         self.token = token
+        self.catalog = None
 
 
     def search_families(self, target):
         self.logger.info("Searching families for {}".format(target))
 
-        apps_response = apps.get_app_families(self.base_url, self.group_id, self.token)
-        apps_dict = common.convert_response(apps_response)
-        if not apps_dict or 'families' not in apps_dict:
-            return None
+        # The catalog downloads the families once, then searches its local index
+        if not self.catalog:
+            try:
+                self.catalog = apps.AppCatalog(self.base_url, self.group_id, self.token)
+            except Exception as e:
+                self.logger.error("Failed getting app families: {}".format(e))
+                return None
 
-        # response contains one field:
-        # 'families'
-
-        apps_list = apps_dict['families']
-        # Filter the whole list with the supplied search term, case-insensitive
-        return list(filter(lambda x:target.lower() in x['name'].lower(), apps_list))
+        # Search the family names with the supplied search term, case-insensitive
+        return self.catalog.search(target)
 
 
 def main():
@@ -12,5 +12,13 @@ setup(
     long_description=open('README.md').read(),
     install_requires=[
         "requests",
+        "grpcio",
+        # The generated Sirius modules predate protobuf 4
+        "protobuf<4",
     ],
+    entry_points={
+        "console_scripts": [
+            "athera = athera.cli:main",
+        ],
+    },
 )
@@ -5,6 +5,11 @@ import unittest
 import uuid
 from requests import codes
 import os
+import time
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
 
 class AppsTest(unittest.TestCase):
     @classmethod
@@ -69,4 +74,55 @@ class AppsTest(unittest.TestCase):
             str(uuid.uuid4()),
         )
         self.assertEqual(response.status_code, codes.not_found)
-        
\ No newline at end of file
+
+
+class AppCatalogTest(unittest.TestCase):
+    """ Local catalog search, against a mocked family listing. These do not need a token. """
+    families = [
+        {"id": "nuke", "name": "Nuke", "apps": {
+            "interactive": {"11.2v3": "nuke-i-11.2v3", "11.2v10": "nuke-i-11.2v10", "9.0v9": "nuke-i-9.0v9"},
+            "compute": {"11.2v10": "nuke-c-11.2v10"},
+        }},
+        {"id": "nukex", "name": "NukeX", "apps": {"interactive": {"11.2v10": "nukex-i-11.2v10"}}},
+        {"id": "houdini", "name": "Houdini FX", "apps": {"compute": {"17.5": "houdini-c-17.5"}}},
+    ]
+
+    def setUp(self):
+        response = mock.Mock(status_code=codes.ok)
+        response.json.return_value = {"families": self.families}
+        patcher = mock.patch.object(apps, "get_app_families", return_value=response)
+        self.get_app_families = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_search(self):
+        """ Positive test - substring search is case-insensitive, for short and long terms """
+        catalog = apps.AppCatalog("url", "group", "token")
+        self.assertEqual([f["id"] for f in catalog.search("NUKE")], ["nuke", "nukex"])
+        self.assertEqual([f["id"] for f in catalog.search("x")], ["houdini", "nukex"])
+        self.assertEqual([f["id"] for f in catalog.search("dini f")], ["houdini"])
+        self.assertEqual(catalog.search("maya"), [])
+        self.assertEqual(len(catalog.search("")), 3)
+        self.assertEqual(self.get_app_families.call_count, 1)
+
+    def test_get_app(self):
+        """ Positive test - app ids resolve to their family, type and version """
+        catalog = apps.AppCatalog("url", "group", "token")
+        app = catalog.get_app("nuke-c-11.2v10")
+        self.assertEqual((app["family_id"], app["type"], app["version"]), ("nuke", "compute", "11.2v10"))
+        self.assertIsNone(catalog.get_app("missing"))
+
+    def test_versions(self):
+        """ Positive test - versions are sorted naturally, newest first """
+        catalog = apps.AppCatalog("url", "group", "token")
+        self.assertEqual([v for v, _ in catalog.versions("nuke", "interactive")], ["11.2v10", "11.2v3", "9.0v9"])
+        self.assertEqual(catalog.latest("nuke", "interactive"), "nuke-i-11.2v10")
+
+    def test_background_refresh(self):
+        """ Positive test - the catalog refreshes itself """
+        catalog = apps.AppCatalog("url", "group", "token", refresh_interval=0.01)
+        self.addCleanup(catalog.stop)
+        deadline = time.time() + 5
+        while self.get_app_families.call_count < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertGreaterEqual(self.get_app_families.call_count, 3)
+
@@ -0,0 +1,127 @@
+import settings
+from athera.api import apps, cache, common, compute
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+import requests
+from requests import codes
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
+
+
+def make_response(status_code=codes.ok, content=b'{"families": []}', headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    response.url = "url"
+    response.request = requests.Request("GET", "http://url").prepare()
+    return response
+
+
+class HttpCacheTest(unittest.TestCase):
+    """ Caching behaviour against a mocked transport. These do not need a token. """
+    def setUp(self):
+        self.responses = []
+        self.sent = []
+        patcher = mock.patch.object(common, "send", side_effect=self.send)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(cache.disable)
+
+    def send(self, method, url, **kwargs):
+        self.sent.append(kwargs.get("headers", {}))
+        return self.responses.pop(0)
+
+    def test_parse_cache_control(self):
+        """ Positive test - directives are understood """
+        self.assertEqual(cache.parse_cache_control("public, max-age=60"), (True, 60))
+        self.assertEqual(cache.parse_cache_control("no-cache"), (True, 0))
+        self.assertEqual(cache.parse_cache_control("no-store"), (False, None))
+        self.assertEqual(cache.parse_cache_control(None), (True, None))
+
+    def test_endpoint_ttl(self):
+        """ Positive test - endpoints with a ttl are served from memory """
+        http_cache = cache.enable()
+        self.responses = [make_response()]
+        first = apps.get_app_families("http://base", "group", "token")
+        second = apps.get_app_families("http://base", "group", "token")
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(http_cache.stats()["hits"], 1)
+
+    def test_key_includes_group_and_token(self):
+        """ Negative test - other groups and users do not share entries """
+        cache.enable()
+        self.responses = [make_response() for _ in range(3)]
+        apps.get_app_families("http://base", "group", "token")
+        apps.get_app_families("http://base", "other_group", "token")
+        apps.get_app_families("http://base", "group", "other_token")
+        self.assertEqual(len(self.sent), 3)
+
+    def test_no_store(self):
+        """ Negative test - Cache-Control: no-store wins over the endpoint ttl """
+        cache.enable()
+        self.responses = [make_response(headers={"Cache-Control": "no-store"}) for _ in range(2)]
+        apps.get_app_families("http://base", "group", "token")
+        apps.get_app_families("http://base", "group", "token")
+        self.assertEqual(len(self.sent), 2)
+
+    def test_etag_revalidation(self):
+        """ Positive test - a stale entry with an ETag is revalidated and reused on 304 """
+        http_cache = cache.enable()
+        self.responses = [
+            make_response(content=b'{"id": "job"}', headers={"ETag": '"v1"'}),
+            make_response(status_code=codes.not_modified, content=b""),
+        ]
+        compute.get_job("http://base", "group", "token", "job")
+        response = compute.get_job("http://base", "group", "token", "job")
+        self.assertEqual(self.sent[1]["If-None-Match"], '"v1"')
+        self.assertEqual(response.status_code, codes.ok)
+        self.assertEqual(response.json(), {"id": "job"})
+        self.assertEqual(http_cache.stats()["revalidations"], 1)
+
+    def test_uncacheable_endpoint(self):
+        """ Negative test - endpoints without ttl, Cache-Control or ETag are not cached """
+        cache.enable()
+        self.responses = [make_response(content=b'{"id": "job"}') for _ in range(2)]
+        compute.get_job("http://base", "group", "token", "job")
+        compute.get_job("http://base", "group", "token", "job")
+        self.assertEqual(len(self.sent), 2)
+
+    def test_disk_store(self):
+        """ Positive test - a new cache using the same directory is served from disk """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache.enable(directory=directory)
+        self.responses = [make_response()]
+        apps.get_app_families("http://base", "group", "token")
+        cache.enable(directory=directory)
+        response = apps.get_app_families("http://base", "group", "token")
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(response.json(), {"families": []})
+
+    def test_disk_files(self):
+        """ Positive test - files are private, capped, and clear() leaves other files of the directory alone """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        os.makedirs(os.path.join(directory, "other"))
+        with open(os.path.join(directory, "notes.txt"), "w") as f:
+            f.write("not a cache file")
+        http_cache = cache.enable(directory=directory, max_disk_entries=2)
+        self.responses = [make_response() for _ in range(3)]
+        for app_id in ("a", "b", "c"):
+            apps.get_app("http://base", "group", "token", app_id)
+        files = [name for name in os.listdir(directory) if cache.file_name_pattern.match(name)]
+        self.assertEqual(len(files), 2)
+        if os.name == "posix":
+            for name in files:
+                self.assertEqual(stat.S_IMODE(os.stat(os.path.join(directory, name)).st_mode), 0o600)
+
+        http_cache.clear()
+        self.assertEqual(sorted(os.listdir(directory)), ["notes.txt", "other"])
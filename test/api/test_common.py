@@ -0,0 +1,70 @@
+import settings
+from athera.api import common, compute
+
+import unittest
+from requests import codes
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
+
+
+class PaginationTest(unittest.TestCase):
+    """ Pagination helpers, against a mocked listing. These do not need a token. """
+    def setUp(self):
+        self.jobs = [{"id": "job{}".format(i)} for i in range(25)]
+        self.requested_pages = []
+
+    def get_jobs(self, base_url, group_id, token, params=None):
+        page, limit = params[common.page_param], params.get(common.page_size_param, 10)
+        self.requested_pages.append(page)
+        response = mock.Mock(status_code=codes.ok)
+        response.json.return_value = {
+            "jobs": self.jobs[(page - 1) * limit:page * limit],
+            "pagination": {"page": page, "limit": limit, "total": len(self.jobs)},
+        }
+        return response
+
+    def test_next_page(self):
+        """ Positive test - the different pagination descriptions are understood """
+        self.assertEqual(common.next_page({"page": 1, "totalPages": 2}, 1, 10, 10), 2)
+        self.assertIsNone(common.next_page({"page": 2, "totalPages": 2}, 2, 10, 10))
+        self.assertEqual(common.next_page({"total": 25, "limit": 10}, 2, 10, 10), 3)
+        self.assertIsNone(common.next_page({"next": None}, 1, 10, 10))
+        self.assertEqual(common.next_page({}, 1, 10, 10), 2)
+        self.assertIsNone(common.next_page({}, 1, 5, 10))
+        self.assertIsNone(common.next_page(None, 1, 10, 10))
+        self.assertIsNone(common.next_page({"cursor": "abc"}, 1, 10, None))
+
+    def test_unrecognised_pagination(self):
+        """ Positive test - a listing whose pagination has no known keys is fetched once """
+        response = mock.Mock(status_code=codes.ok)
+        response.json.return_value = {"jobs": self.jobs, "pagination": {"cursor": "abc"}}
+        with mock.patch.object(compute, "get_jobs", return_value=response) as get_jobs:
+            jobs = list(compute.iter_jobs("url", "group", "token", prefetch=False))
+        self.assertEqual(jobs, self.jobs)
+        self.assertEqual(get_jobs.call_count, 1)
+
+    def test_iter_jobs(self):
+        """ Positive test - all pages are followed, in order """
+        with mock.patch.object(compute, "get_jobs", side_effect=self.get_jobs):
+            jobs = list(compute.iter_jobs("url", "group", "token"))
+        self.assertEqual(jobs, self.jobs)
+        self.assertEqual(self.requested_pages, [1, 2, 3])
+
+    def test_iter_jobs_stop_early(self):
+        """ Positive test - stopping early does not fetch the remaining pages """
+        with mock.patch.object(compute, "get_jobs", side_effect=self.get_jobs):
+            iterator = compute.iter_jobs("url", "group", "token", page_size=5, prefetch=False)
+            first = [next(iterator) for _ in range(3)]
+            iterator.close()
+        self.assertEqual(first, self.jobs[:3])
+        self.assertEqual(self.requested_pages, [1])
+
+    def test_iter_jobs_error(self):
+        """ Negative test - a failing page raises """
+        response = mock.Mock(status_code=codes.forbidden)
+        response.raise_for_status.side_effect = common.requests.HTTPError("403")
+        with mock.patch.object(compute, "get_jobs", return_value=response):
+            with self.assertRaises(common.requests.HTTPError):
+                list(compute.iter_jobs("url", "group", "token"))
@@ -1,11 +1,15 @@
 from settings import environment, compute_arguments
-from athera.api import compute
+from athera.api import compute, rate_limit
 
 import unittest
 import uuid
 import time
 from requests import codes
 import os
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
 
 
 class ComputeTest(unittest.TestCase):
@@ -326,4 +330,113 @@ class ComputeTest(unittest.TestCase):
             time.sleep(wait_period)
 
         return "Waited 100 seconds for job to reach status {}, but job has status {}".format(desired_status, job_status)
-        
\ No newline at end of file
+
+
+class SubmitJobsTest(unittest.TestCase):
+    """ Batch submission helpers. These do not need a token or network access. """
+    def make_payload(self, name="batch", start=1, finish=100, increment=1, part_count=1, node_count=1):
+        return compute.make_job_request(
+            "user", "group", "app", "/data/shot.nk", name,
+            start, finish, increment, "europe-west1", compute_arguments,
+            part_count=part_count, node_count=node_count,
+        )
+
+    def test_split_frame_range(self):
+        """ Positive test - ranges cover every frame once, honouring the increment """
+        self.assertEqual(compute.split_frame_range(1, 10, 1, 4), [(1, 4), (5, 8), (9, 10)])
+        self.assertEqual(compute.split_frame_range(1, 10, 2, 2), [(1, 3), (5, 7), (9, 9)])
+        self.assertEqual(compute.split_frame_range(5, 4, 1, 2), [])
+
+    def test_split_job_request_parts(self):
+        """ Positive test - a range which fits in one job only gets a part count """
+        payloads = compute.split_job_request(self.make_payload(node_count=4), 10)
+        self.assertEqual(len(payloads), 1)
+        self.assertEqual(payloads[0]["partCount"], 10)
+        self.assertEqual(payloads[0]["nodeCount"], 4)
+
+    def test_split_job_request_jobs(self):
+        """ Positive test - a range too big for one job is divided into several """
+        payloads = compute.split_job_request(self.make_payload(finish=1000), 10, max_parts_per_job=30)
+        self.assertEqual(len(payloads), 4)
+        self.assertEqual([p["partCount"] for p in payloads], [30, 30, 30, 10])
+        self.assertEqual(payloads[-1]["computeData"]["frameRange"]["start"], 901)
+        self.assertEqual(payloads[-1]["computeData"]["name"], "batch_4")
+
+    def test_validate_job_request(self):
+        """ Negative test - invalid payloads are reported """
+        self.assertEqual(compute.validate_job_request(self.make_payload()), [])
+        self.assertNotEqual(compute.validate_job_request({}), [])
+        self.assertNotEqual(compute.validate_job_request(self.make_payload(start=10, finish=1)), [])
+        self.assertNotEqual(compute.validate_job_request(self.make_payload(finish=2, part_count=3)), [])
+
+    def test_submit_jobs(self):
+        """ Positive test - results are returned in input order, invalid payloads are not sent """
+        def create_job(base_url, group_id, token, payload):
+            response = mock.Mock(status_code=codes.ok)
+            response.json.return_value = {"id": "id-" + payload["computeData"]["name"]}
+            return response
+
+        payloads = [self.make_payload(name=str(i)) for i in range(20)]
+        payloads.append(self.make_payload(name="bad", part_count=0))
+        with mock.patch.object(compute, "create_job", side_effect=create_job) as create:
+            results = compute.submit_jobs("url", "group", "token", payloads, rate=None)
+
+        self.assertEqual(create.call_count, 20)
+        self.assertEqual([r.job_id for r in results[:20]], ["id-{}".format(i) for i in range(20)])
+        self.assertIsNone(results[20].job_id)
+        self.assertIn("partCount", results[20].error)
+
+
+    def test_submit_jobs_rate_limit_timeout(self):
+        """ Negative test - a rate limit timeout is reported as the error of its job """
+        def create_job(base_url, group_id, token, payload):
+            if payload["computeData"]["name"] == "late":
+                raise rate_limit.RateLimitTimeout("Rate limit: no token available within 1s")
+            response = mock.Mock(status_code=codes.ok)
+            response.json.return_value = {"id": "id"}
+            return response
+
+        payloads = [self.make_payload(name="early"), self.make_payload(name="late")]
+        with mock.patch.object(compute, "create_job", side_effect=create_job):
+            results = compute.submit_jobs("url", "group", "token", payloads, rate=None)
+
+        self.assertEqual(results[0].job_id, "id")
+        self.assertIsNone(results[1].job_id)
+        self.assertIn("no token available", results[1].error)
+
+
+class StopJobsTest(unittest.TestCase):
+    """ Bulk stop helpers. These do not need a token or network access. """
+    def test_stop_jobs(self):
+        """ Positive test - jobs are stopped concurrently, then waited on with one get_jobs per poll """
+        stopped = set()
+
+        def stop_job(base_url, group_id, token, job_id):
+            if job_id == "missing":
+                return mock.Mock(status_code=codes.not_found, text="Not found")
+            stopped.add(job_id)
+            return mock.Mock(status_code=codes.ok)
+
+        def get_jobs(base_url, group_id, token):
+            response = mock.Mock(status_code=codes.ok)
+            response.json.return_value = {"jobs": [{"id": j, "status": "CANCELED"} for j in stopped]}
+            return response
+
+        job_ids = ["job{}".format(i) for i in range(50)] + ["missing"]
+        with mock.patch.object(compute, "stop_job", side_effect=stop_job) as stop, \
+                mock.patch.object(compute, "get_jobs", side_effect=get_jobs) as sweep:
+            results = compute.stop_jobs("url", "group", "token", job_ids, rate=None, wait=True, timeout=10,
+                                        min_interval=0, max_interval=0, jitter=0)
+
+        self.assertEqual(stop.call_count, 51)
+        self.assertEqual(sweep.call_count, 1)
+        self.assertEqual([r.id for r in results], job_ids)
+        self.assertTrue(all(r.error is None and r.status == "CANCELED" for r in results[:50]))
+        self.assertEqual((results[50].status_code, results[50].status), (codes.not_found, None))
+
+    def test_stop_jobs_rate_limit_timeout(self):
+        """ Negative test - a rate limit timeout is reported as the error of its job """
+        error = rate_limit.RateLimitTimeout("Rate limit: no token available within 1s")
+        with mock.patch.object(compute, "stop_job", side_effect=error):
+            results = compute.stop_jobs("url", "group", "token", ["job"], rate=None)
+        self.assertEqual((results[0].status_code, results[0].error), (None, str(error)))
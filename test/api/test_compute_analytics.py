@@ -0,0 +1,132 @@
+import settings
+from athera.api import compute, compute_analytics
+
+import os
+import shutil
+import tempfile
+import unittest
+from requests import codes
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
+
+
+def make_part(part_id, status="COMPLETE", frames=10, seconds=600):
+    return {
+        "id": part_id,
+        "status": status,
+        "frameRange": {"start": 1, "finish": frames, "increment": 1},
+        "startedAt": 1000,
+        "completedAt": 1000 + seconds,
+    }
+
+
+def make_job(job_id, status="COMPLETE", app_id="nuke", profile_id="small"):
+    return {"id": job_id, "status": status, "computeData": {"appID": app_id, "profileID": profile_id}}
+
+
+class PartHistoryTest(unittest.TestCase):
+    """ Analytics over canned parts. These do not need a token. """
+    def setUp(self):
+        self.parts = {
+            "job1": [make_part("a", seconds=600), make_part("b", seconds=1200), make_part("c", status="FAILED")],
+            "job2": [make_part("d", seconds=300, frames=30), make_part("e", status="RUNNING")],
+            "job3": [make_part("f", seconds=60)],
+        }
+        self.jobs = [make_job("job1"), make_job("job2", status="RUNNING"), make_job("job3", profile_id="large")]
+        patcher = mock.patch.object(compute, "get_parts", side_effect=self.get_parts)
+        self.get_parts_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_parts(self, base_url, group_id, token, job_id):
+        response = mock.Mock(status_code=codes.ok)
+        response.json.return_value = {"parts": self.parts[job_id]}
+        return response
+
+    def test_summary(self):
+        """ Positive test - throughput, percentiles and failure rates are grouped by app and profile """
+        history = compute_analytics.PartHistory()
+        self.assertEqual(history.update("url", "group", "token", jobs=self.jobs), 3)
+        self.assertEqual(len(history), 5)
+
+        summary = history.summary()
+        small = summary[("nuke", "small")]
+        self.assertEqual((small.parts, small.failed_parts), (4, 1))
+        self.assertAlmostEqual(small.failure_rate, 0.25)
+        self.assertEqual((small.frames, small.seconds), (50, 2100))
+        self.assertAlmostEqual(small.seconds_per_frame, 42)
+        self.assertEqual(small.p50_seconds, 600)
+        self.assertEqual(summary[("nuke", "large")].frames_per_hour, 600)
+
+        by_app = history.summary(by=("app",))
+        self.assertEqual(list(by_app), [("nuke",)])
+        self.assertEqual(by_app[("nuke",)].parts, 5)
+
+    def test_canceled_parts(self):
+        """ Positive test - canceled parts are counted apart, neither timed nor failed """
+        self.parts["job5"] = [make_part("g", seconds=600), make_part("h", status="CANCELED", seconds=6000),
+                              make_part("i", status="FAILED")]
+        history = compute_analytics.PartHistory()
+        history.update("url", "group", "token", jobs=[make_job("job5")])
+
+        stats = history.summary(by=())[()]
+        self.assertEqual((stats.parts, stats.failed_parts, stats.canceled_parts), (3, 1, 1))
+        self.assertAlmostEqual(stats.failure_rate, 0.5)
+        self.assertEqual((stats.frames, stats.seconds), (10, 600))
+        self.assertEqual(stats.p99_seconds, 600)
+
+    @unittest.skipIf(not compute_analytics.use_numpy(), "NumPy is not installed")
+    def test_summary_numpy(self):
+        """ Positive test - the NumPy columns give the same summary as the pure Python ones """
+        history = compute_analytics.PartHistory()
+        history.update("url", "group", "token", jobs=self.jobs)
+        self.assertTrue(all(isinstance(c, compute_analytics.numpy.ndarray) for c in history.columns().values()))
+        summary = history.summary()
+        self.assertEqual(set(summary), set([("nuke", "small"), ("nuke", "large")]))
+        small = summary[("nuke", "small")]
+        self.assertEqual((small.parts, small.failed_parts, small.frames, small.seconds), (4, 1, 50, 2100))
+        self.assertEqual(small.p50_seconds, 600)
+        self.assertEqual(history.summary(by=())[()].parts, 5)
+
+        with mock.patch.object(compute_analytics, "use_numpy", return_value=False):
+            python = compute_analytics.PartHistory()
+            python.update("url", "group", "token", jobs=self.jobs)
+            for group, stats in python.summary().items():
+                self.assertEqual(stats[:6], summary[group][:6])
+
+    def test_incremental_update(self):
+        """ Positive test - only new and unfinished jobs are fetched again """
+        history = compute_analytics.PartHistory()
+        history.update("url", "group", "token", jobs=self.jobs)
+        self.get_parts_mock.reset_mock()
+
+        self.parts["job2"][1] = make_part("e", seconds=300, frames=30)
+        self.parts["job4"] = [make_part("g")]
+        jobs = [make_job("job1"), make_job("job2"), make_job("job3", profile_id="large"), make_job("job4")]
+        self.assertEqual(history.update("url", "group", "token", jobs=jobs), 2)
+        self.assertEqual(sorted(c[0][3] for c in self.get_parts_mock.call_args_list), ["job2", "job4"])
+        self.assertEqual(history.summary(by=())[()].parts, 7)
+
+    def test_save_and_load(self):
+        """ Positive test - a saved history is not fetched again """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "parts.json")
+        history = compute_analytics.PartHistory.load(path)
+        history.update("url", "group", "token", jobs=self.jobs)
+        history.save(path)
+
+        loaded = compute_analytics.PartHistory.load(path)
+        self.assertEqual(loaded.summary(), history.summary())
+        self.get_parts_mock.reset_mock()
+        loaded.update("url", "group", "token", jobs=[make_job("job1"), make_job("job3", profile_id="large")])
+        self.assertEqual(self.get_parts_mock.call_count, 0)
+
+    def test_fetch_errors(self):
+        """ Negative test - jobs which cannot be fetched are retried by the next update """
+        history = compute_analytics.PartHistory()
+        with mock.patch.object(compute, "get_parts", return_value=mock.Mock(status_code=codes.forbidden)):
+            self.assertEqual(history.update("url", "group", "token", jobs=self.jobs), 0)
+        self.assertEqual(history.summary(), {})
+        self.assertEqual(history.update("url", "group", "token", jobs=self.jobs), 3)
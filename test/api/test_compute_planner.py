@@ -0,0 +1,76 @@
+import settings
+from athera.api import compute, compute_planner
+from athera.api.compute_planner import PartTiming, ProfileOption
+
+import unittest
+from requests import codes
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
+
+
+class ComputePlannerTest(unittest.TestCase):
+    """ The planner works from part timings only, so these tests need no token """
+
+    def test_get_part_timing(self):
+        """ Positive test - duration and frame count are read from a finished part """
+        part = {
+            "id": "part",
+            "frameRange": {"start": 1, "finish": 10, "increment": 1},
+            "startedAt": "2019-01-01T12:00:00.5Z",
+            "completedAt": "2019-01-01T12:10:00.5Z",
+        }
+        self.assertEqual(compute_planner.get_part_timing(part), PartTiming(10, 600))
+
+    def test_get_part_timing_unfinished(self):
+        """ Negative test - unfinished parts have no timing """
+        part = {"frameRange": {"start": 1, "finish": 10, "increment": 1}, "startedAt": "2019-01-01T12:00:00Z"}
+        self.assertIsNone(compute_planner.get_part_timing(part))
+
+    def test_fetch_part_timings_completed_only(self):
+        """ Negative test - failed and canceled parts are not used as timings """
+        def part(status, minutes):
+            return {
+                "status": status,
+                "frameRange": {"start": 1, "finish": 10, "increment": 1},
+                "startedAt": "2019-01-01T12:00:00Z",
+                "completedAt": "2019-01-01T12:{:02d}:00Z".format(minutes),
+            }
+        response = mock.Mock(status_code=codes.ok)
+        response.json.return_value = {"parts": [part("COMPLETE", 10), part("FAILED", 1), part("CANCELED", 2)]}
+        with mock.patch.object(compute, "get_parts", return_value=response):
+            timings = compute_planner.fetch_part_timings("url", "group", "token", ["job"])
+        self.assertEqual(timings, [PartTiming(10, 600)])
+
+    def test_estimate_frame_cost_fits_overhead(self):
+        """ Positive test - the fixed part overhead is recovered when part sizes vary """
+        timings = [PartTiming(f, 30 + 10 * f) for f in (5, 10, 20)]
+        seconds_per_frame, overhead = compute_planner.estimate_frame_cost(timings)
+        self.assertAlmostEqual(seconds_per_frame, 10)
+        self.assertAlmostEqual(overhead, 30)
+
+    def test_plan_job_meets_deadline(self):
+        """ Positive test - 100 frames at 60s each needs several nodes to finish in 30 minutes """
+        timings = [PartTiming(10, 60 + 600)]
+        plan = compute_planner.plan_job(1, 100, 1, timings, deadline_seconds=1800)
+        self.assertTrue(plan.meets_deadline)
+        self.assertLessEqual(plan.duration_seconds, 1800)
+        self.assertEqual(plan.part_count % plan.node_count, 0)
+        self.assertGreaterEqual(plan.part_count * plan.frames_per_part, 100)
+
+    def test_plan_job_prefers_cheaper_profile(self):
+        """ Positive test - a faster profile is only chosen when it is needed or cheaper """
+        timings = [PartTiming(10, 60 + 600)]
+        profiles = [ProfileOption("standard", 1.0, 1.0), ProfileOption("fast", 2.0, 4.0)]
+        plan = compute_planner.plan_job(1, 100, 1, timings, 7200, profiles)
+        self.assertEqual(plan.profile_id, "standard")
+        plan = compute_planner.plan_job(1, 100, 1, timings, 150, profiles, max_nodes=50)
+        self.assertEqual(plan.profile_id, "fast")
+
+    def test_plan_job_impossible_deadline(self):
+        """ Negative test - the fastest plan is returned when the deadline cannot be met """
+        timings = [PartTiming(1, 600)]
+        plan = compute_planner.plan_job(1, 10, 1, timings, 10, max_nodes=5)
+        self.assertFalse(plan.meets_deadline)
+        self.assertEqual(plan.node_count, 5)
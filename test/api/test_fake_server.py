@@ -0,0 +1,84 @@
+import settings
+from athera import retry
+from athera.api import compute, groups, sessions, storage
+from athera.api.fake_server import FakeApiServer
+
+import time
+import unittest
+from requests import codes
+
+
+class FakeApiServerTest(unittest.TestCase):
+    """ The api client against the in-process stand-in api. These do not need a token or network access. """
+    def setUp(self):
+        retry.configure(policy=retry.RetryPolicy(max_attempts=4, initial_backoff=0))
+        self.addCleanup(retry.reset)
+        self.server = FakeApiServer().start()
+        self.addCleanup(self.server.stop)
+        self.api = self.server.api
+        self.base_url = self.server.base_url
+
+    def test_job_lifecycle(self):
+        """ Positive test - a created job can be fetched, listed and stopped """
+        payload = compute.make_job_request("user", "group", "app", "/data/shot.nk", "shot", 1, 10, 1,
+                                           "europe-west1", {}, part_count=2)
+        response = compute.create_job(self.base_url, "group", "token", payload)
+        self.assertEqual(response.status_code, codes.ok)
+        job_id = response.json()["id"]
+
+        self.assertEqual(compute.get_job(self.base_url, "group", "token", job_id).json()["status"], "CREATED")
+        self.assertEqual(len(compute.get_parts(self.base_url, "group", "token", job_id).json()["parts"]), 2)
+        results = compute.stop_jobs(self.base_url, "group", "token", [job_id], wait=True, timeout=5, min_interval=0.01)
+        self.assertEqual(results[0].status, "CANCELED")
+
+    def test_pagination(self):
+        """ Positive test - listings are paged, and followed by the iterators """
+        for _ in range(25):
+            self.api.add_job()
+        self.api.page_size = 10
+        data = compute.get_jobs(self.base_url, "group", "token").json()
+        self.assertEqual(len(data["jobs"]), 10)
+        self.assertEqual(len(list(compute.iter_jobs(self.base_url, "group", "token"))), 25)
+        self.assertEqual(len(list(compute.iter_jobs(self.base_url, "group", "token", page_size=7))), 25)
+        self.assertEqual(self.api.requests[("GET", compute.route_jobs)], 1 + 3 + 4)
+
+    def test_groups_and_storage(self):
+        """ Positive test - groups, sessions and drivers are served like the real api """
+        org = self.api.add_group({"name": "org"})
+        self.api.add_group({"name": "project"}, parent_id=org["id"], users=[{"id": "user"}])
+        self.assertEqual(groups.get_orgs(self.base_url, "token").json()["groups"], [org])
+        tree = groups.load_tree(self.base_url, org["id"], "token", refresh=True)
+        self.assertEqual(len(tree.descendants(org["id"])), 1)
+
+        payload = sessions.make_session_request("user", "group", "app", "europe-west1", 1920, 1080, 72, "session")
+        response = sessions.start_session(self.base_url, "group", "token", payload)
+        self.assertEqual(response.status_code, codes.created)
+        session = response.json()
+        sessions.stop_session(self.base_url, "group", "token", session["id"])
+        self.assertEqual(sessions.get_session(self.base_url, "group", "token", session["id"]).json()["status"],
+                         "TERMINATED")
+
+        driver = self.api.add_driver()
+        self.api.indexing_seconds = 0.2
+        self.assertEqual(storage.rescan_driver(self.base_url, "group", "token", driver["id"], "/shots").status_code,
+                         codes.ok)
+        status = storage.get_driver(self.base_url, "group", "token", driver["id"]).json()["statuses"][0]
+        self.assertEqual(status, {"path": "/shots", "indexingInProgress": True})
+
+    def test_errors(self):
+        """ Negative test - injected errors are retried, bad requests are rejected """
+        job = self.api.add_job()
+        self.api.fail_next(2)
+        self.assertEqual(compute.get_job(self.base_url, "group", "token", job["id"]).status_code, codes.ok)
+        self.assertEqual(self.api.requests[("GET", compute.route_job)], 3)
+
+        self.assertEqual(compute.create_job(self.base_url, "group", "token", {}).status_code, codes.bad_request)
+        self.assertEqual(compute.get_job(self.base_url, "group", "token", "missing").status_code, codes.not_found)
+        self.assertEqual(compute.get_job(self.base_url, "", "token", job["id"]).status_code, codes.forbidden)
+
+    def test_latency(self):
+        """ Positive test - responses are delayed as configured """
+        self.api.latency = 0.1
+        start = time.time()
+        groups.get_orgs(self.base_url, "token")
+        self.assertGreaterEqual(time.time() - start, 0.1)
@@ -1,10 +1,17 @@
 from settings import *
 from athera.api import groups
 
+import threading
+import time
 import unittest
 import uuid
+import requests
 from requests import codes
 import os
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
 
 class GroupsTest(unittest.TestCase):
     @classmethod
@@ -144,3 +151,89 @@ class GroupsTest(unittest.TestCase):
             environment.ATHERA_API_TEST_OTHER_GROUP_ID,
         )
         self.assertEqual(response.status_code, codes.not_found)
+
+
+class GroupTreeTest(unittest.TestCase):
+    """ Tree crawling against a mocked hierarchy. These do not need a token. """
+    def setUp(self):
+        # org -> 3 departments -> 10 projects each
+        self.hierarchy = {"org": ["dept{}".format(d) for d in range(3)]}
+        for d in range(3):
+            self.hierarchy["dept{}".format(d)] = ["dept{}-project{}".format(d, p) for p in range(10)]
+        groups.clear_tree_cache()
+        for name, func in (("get_group", self.get_group), ("get_group_children", self.get_group_children)):
+            patcher = mock.patch.object(groups, name, side_effect=func)
+            setattr(self, name + "_mock", patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def make_response(self, data):
+        response = mock.Mock(status_code=codes.ok)
+        response.json.return_value = data
+        return response
+
+    def get_group(self, base_url, group_id, token, target_group_id=None):
+        return self.make_response({"id": group_id, "name": group_id.upper()})
+
+    def get_group_children(self, base_url, group_id, token, target_group_id=None, params=None):
+        children = self.hierarchy.get(target_group_id, [])
+        return self.make_response({"groups": [{"id": c, "name": c.upper()} for c in children]})
+
+    def test_load_tree(self):
+        """ Positive test - every group is indexed by id, parent and name """
+        tree = groups.load_tree("url", "org", "token")
+        self.assertEqual(len(tree), 34)
+        self.assertEqual(self.get_group_children_mock.call_count, 34)
+        self.assertEqual(tree.path("dept1-project2"), ["org", "dept1", "dept1-project2"])
+        self.assertEqual(tree.get_parent("dept1")["id"], "org")
+        self.assertEqual(len(tree.get_children("dept2")), 10)
+        self.assertEqual(tree.find("dept0-PROJECT9")[0]["id"], "dept0-project9")
+        self.assertEqual(len(tree.leaves()), 30)
+
+    def test_load_tree_cached(self):
+        """ Positive test - a second load within the ttl makes no requests """
+        first = groups.load_tree("url", "org", "token")
+        second = groups.load_tree("url", "org", "token")
+        self.assertIs(first, second)
+        self.assertEqual(self.get_group_mock.call_count, 1)
+        third = groups.load_tree("url", "org", "token", ttl=0)
+        self.assertIsNot(first, third)
+
+    def test_refresh_subtree(self):
+        """ Positive test - only the refreshed subtree is crawled again """
+        tree = groups.load_tree("url", "org", "token")
+        self.hierarchy["dept0"] = ["dept0-new"]
+        calls = self.get_group_children_mock.call_count
+        groups.refresh_subtree("url", "dept0", "token", tree)
+        self.assertEqual(self.get_group_children_mock.call_count - calls, 2)
+        self.assertEqual(tree.children["dept0"], ["dept0-new"])
+        self.assertNotIn("dept0-project1", tree)
+        self.assertEqual(tree.find("dept0-project1"), [])
+        self.assertEqual(len(tree), 25)
+
+    def test_refresh_subtree_failure(self):
+        """ Negative test - a failed refresh leaves the subtree as it was """
+        tree = groups.load_tree("url", "org", "token")
+        failed = mock.Mock(status_code=codes.internal_server_error)
+        failed.raise_for_status.side_effect = requests.HTTPError("500")
+        self.get_group_children_mock.side_effect = lambda *args, **kwargs: failed
+        with self.assertRaises(requests.HTTPError):
+            groups.refresh_subtree("url", "dept0", "token", tree)
+        self.assertEqual(len(tree.get_children("dept0")), 10)
+        self.assertEqual(len(tree), 34)
+
+    def test_load_tree_single_crawl(self):
+        """ Positive test - concurrent loads of the same tree share one crawl """
+        def slow_get_group(*args, **kwargs):
+            time.sleep(0.05)
+            return self.get_group(*args, **kwargs)
+        self.get_group_mock.side_effect = slow_get_group
+        trees = []
+        threads = [threading.Thread(target=lambda: trees.append(groups.load_tree("url", "org", "token")))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.get_group_mock.call_count, 1)
+        self.assertEqual(len(set(id(tree) for tree in trees)), 1)
+
@@ -0,0 +1,88 @@
+import settings
+from athera.api import models
+
+import json
+import unittest
+import requests
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
+
+
+def make_response(body):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps(body).encode("utf-8")
+    return response
+
+
+class ModelsTest(unittest.TestCase):
+    """ Models are built from canned responses, so these tests need no token """
+
+    def test_job_listing(self):
+        """ Positive test - fields of a job listing are exposed as attributes """
+        body = {"jobs": [{
+            "id": "job",
+            "status": "COMPLETE",
+            "partCount": 2,
+            "computeData": {"appID": "app", "frameRange": {"start": 1, "finish": 10}},
+        }]}
+        jobs = models.Job.list_from_response(make_response(body))
+        self.assertEqual(len(jobs), 1)
+        job = jobs[0]
+        self.assertEqual((job.id, job.status, job.part_count, job.app_id), ("job", "COMPLETE", 2, "app"))
+        self.assertEqual((job.frame_range.start, job.frame_range.increment), (1, 1))
+        self.assertTrue(job.is_terminal)
+        self.assertEqual(job["computeData"]["appID"], "app")
+        self.assertIsNone(job.name)
+
+    def test_lazy_parsing(self):
+        """ Positive test - models and converted fields are only created when used, then cached """
+        jobs = models.ModelList([{"id": str(i)} for i in range(100)], models.Job)
+        self.assertEqual(jobs._models.count(None), 100)
+        self.assertIs(jobs[5], jobs[5])
+        self.assertEqual(jobs._models.count(None), 99)
+
+        convert = mock.Mock(return_value="converted")
+        field = models.Field("id", convert)
+        job = jobs[5]
+        self.assertEqual(field.__get__(job, models.Job), "converted")
+        self.assertEqual(field.__get__(job, models.Job), "converted")
+        self.assertEqual(convert.call_count, 1)
+
+    def test_slots(self):
+        """ Negative test - models have no per-instance __dict__ """
+        job = models.Job({"id": "job"})
+        with self.assertRaises(AttributeError):
+            job.other = 1
+
+    def test_part_timing(self):
+        """ Positive test - part timings are derived as in compute_planner """
+        part = models.Part({
+            "frameRange": {"start": 1, "finish": 10, "increment": 1},
+            "startedAt": "2019-01-01T12:00:00Z",
+            "completedAt": "2019-01-01T12:10:00Z",
+        })
+        self.assertEqual((part.frames, part.seconds), (10, 600))
+        self.assertEqual(part.finished - part.started, 600)
+
+    def test_driver(self):
+        """ Positive test - nested mounts and statuses are models too """
+        driver = models.Driver({
+            "id": "driver",
+            "mounts": [{"id": "mount", "mountLocation": "/data/project"}],
+            "statuses": [{"path": "/", "indexingInProgress": True}],
+        })
+        self.assertEqual(driver.mounts[0].mount_location, "/data/project")
+        self.assertTrue(driver.indexing_in_progress)
+        self.assertEqual(len(models.Driver({"id": "other"}).mounts), 0)
+
+    def test_json_fallback(self):
+        """ Positive test - the json module gives the same result as orjson """
+        content = b'{"families": [{"id": "family", "apps": {"compute": {"1.0": "app"}}}]}'
+        with mock.patch.object(models, "use_orjson", False):
+            family = models.AppFamily.list_from_response(mock.Mock(content=content))[0]
+        self.assertEqual(family.compute, {"1.0": "app"})
+        self.assertIsNone(family.interactive)
+        self.assertEqual(models.loads(content), json.loads(content.decode("utf-8")))
@@ -0,0 +1,113 @@
+import settings
+from athera.api import common, compute, rate_limit
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from requests import codes
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
+
+
+def make_response(status_code=codes.ok, headers=None):
+    response = mock.Mock(status_code=status_code)
+    response.headers = headers or {}
+    return response
+
+
+def take_tokens(path, count):
+    bucket = rate_limit.FileTokenBucket(path, rate=0.001, burst=1000)
+    for _ in range(count):
+        bucket.acquire()
+
+
+class RateLimitTest(unittest.TestCase):
+    """ Token buckets and their adaptation. These do not need a token. """
+    def setUp(self):
+        self.addCleanup(rate_limit.disable)
+
+    def test_endpoint_family(self):
+        """ Positive test - routes are grouped by their first segment """
+        self.assertEqual(rate_limit.endpoint_family(compute.route_part), "compute")
+        self.assertEqual(rate_limit.endpoint_family("/sessions"), "sessions")
+
+    def test_bucket_smooths_bursts(self):
+        """ Positive test - callers beyond the burst are delayed, not rejected """
+        bucket = rate_limit.TokenBucket(rate=100, burst=5)
+        start = time.time()
+        threads = [threading.Thread(target=bucket.acquire) for _ in range(25)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - start
+        self.assertGreaterEqual(elapsed, 0.15)
+        self.assertLess(elapsed, 2)
+
+    def test_bucket_timeout(self):
+        """ Negative test - a timeout bounds the wait """
+        bucket = rate_limit.TokenBucket(rate=0.1, burst=1)
+        bucket.acquire()
+        with self.assertRaises(rate_limit.RateLimitTimeout):
+            bucket.acquire(timeout=0.1)
+
+    def test_throttled_and_recovery(self):
+        """ Positive test - 429s halve the rate, successes bring it back """
+        limiter = rate_limit.RateLimiter(rates={"compute": 8})
+        limiter.feedback(compute.route_jobs, "group", make_response(codes.too_many_requests))
+        self.assertEqual(limiter.bucket(compute.route_jobs, "group").rate, 4)
+        # Other groups and families are not affected
+        self.assertEqual(limiter.bucket(compute.route_jobs, "other").rate, 8)
+        for _ in range(100):
+            limiter.feedback(compute.route_job, "group", make_response())
+        self.assertEqual(limiter.bucket(compute.route_jobs, "group").rate, 8)
+
+    def test_retry_after_pauses_bucket(self):
+        """ Positive test - Retry-After and exhausted quota headers pause every caller """
+        limiter = rate_limit.RateLimiter()
+        limiter.feedback("/sessions", "group", make_response(codes.too_many_requests, {"Retry-After": "0.2"}))
+        start = time.time()
+        limiter.acquire("/sessions", "group")
+        self.assertGreaterEqual(time.time() - start, 0.15)
+
+        limiter.feedback("/orgs", None, make_response(headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "0.2"}))
+        start = time.time()
+        limiter.acquire("/orgs", None)
+        self.assertGreaterEqual(time.time() - start, 0.15)
+
+    def test_enabled_for_requests(self):
+        """ Positive test - api calls go through the limiter once enabled """
+        limiter = rate_limit.enable(rates={"compute": 1000})
+        with mock.patch.object(common, "send", return_value=make_response()):
+            compute.get_job("url", "group", "token", "job")
+        self.assertIn(("compute", "group"), limiter.buckets)
+
+    def test_batch_limiter(self):
+        """ Positive test - batches only get their own bucket while no limiter is enabled """
+        self.assertIsInstance(common.batch_limiter(10), rate_limit.TokenBucket)
+        self.assertIsNone(common.batch_limiter(None))
+        rate_limit.enable()
+        self.assertIsNone(common.batch_limiter(10))
+
+    @unittest.skipIf(rate_limit.fcntl is None, "flock not available")
+    def test_shared_between_processes(self):
+        """ Positive test - processes using the same file share the tokens """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "bucket")
+        processes = [multiprocessing.Process(target=take_tokens, args=(path, 100)) for _ in range(3)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+        bucket = rate_limit.FileTokenBucket(path, rate=0.001, burst=1000)
+        tokens = bucket.transaction(lambda state, now: state.tokens)
+        # 300 tokens were taken from the shared 1000, the refill is negligible
+        self.assertAlmostEqual(tokens, 700, delta=1)
+        self.assertTrue(all(p.exitcode == 0 for p in processes))
@@ -0,0 +1,84 @@
+import settings
+from athera.api import rescan, storage
+
+import threading
+import time
+import unittest
+from requests import codes
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
+
+
+class RescanSchedulerTest(unittest.TestCase):
+    """ Rescan batching against mocked drivers. These do not need a token. """
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.rescans = []
+        self.indexing_polls = {}
+        patchers = [
+            mock.patch.object(storage, "rescan_driver", side_effect=self.rescan_driver),
+            mock.patch.object(storage, "get_driver", side_effect=self.get_driver),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def rescan_driver(self, base_url, group_id, token, driver_id, path):
+        with self.lock:
+            self.rescans.append((driver_id, path))
+        if path.startswith("/broken"):
+            return mock.Mock(status_code=codes.bad_request, text="Bad path")
+        return mock.Mock(status_code=codes.ok)
+
+    def get_driver(self, base_url, group_id, token, driver_id):
+        """ Each driver reports indexing for as many polls as given in indexing_polls """
+        with self.lock:
+            polls = self.indexing_polls.get(driver_id, 0)
+            self.indexing_polls[driver_id] = polls - 1
+        response = mock.Mock(status_code=codes.ok)
+        response.json.return_value = {"id": driver_id, "statuses": [{"path": "/", "indexingInProgress": polls > 0}]}
+        return response
+
+    def test_collapse_paths(self):
+        """ Positive test - nested paths are covered by their ancestors """
+        paths = ["/shots/a/comp", "/shots/a", "shots/ab/", "/renders//x", "/renders/x/y"]
+        self.assertEqual(rescan.collapse_paths(paths), ["/renders/x", "/shots/a", "/shots/ab"])
+        self.assertEqual(rescan.collapse_paths(["/", "/shots"]), ["/"])
+
+    def test_collapse_paths_max(self):
+        """ Positive test - too many paths are merged into their parents """
+        paths = ["/shots/{}/frame{}".format(s, f) for s in range(10) for f in range(500)]
+        self.assertEqual(len(rescan.collapse_paths(paths)), 5000)
+        self.assertEqual(len(rescan.collapse_paths(paths, max_paths=20)), 10)
+        self.assertEqual(rescan.collapse_paths(paths, max_paths=5), ["/shots"])
+
+    def test_debounced_batch(self):
+        """ Positive test - paths added in quick succession are submitted together, once """
+        scheduler = rescan.RescanScheduler("url", "group", "token", debounce=0.2, max_paths=10)
+        for s in range(10):
+            for f in range(100):
+                scheduler.add_file("driver", "/shots/{}/frame{}/image.exr".format(s, f))
+        scheduler.add_file("other", "/data/file.txt")
+        self.assertEqual(self.rescans, [])
+        time.sleep(0.5)
+        self.assertEqual(len([r for r in self.rescans if r[0] == "driver"]), 10)
+        self.assertIn(("other", "/data"), self.rescans)
+
+    def test_wait_for_indexing(self):
+        """ Positive test - wait() submits pending paths and polls until indexing is done """
+        scheduler = rescan.RescanScheduler("url", "group", "token", debounce=None, poll_interval=0.01)
+        self.indexing_polls = {"driver": 3}
+        scheduler.add("driver", "/shots")
+        scheduler.add("unused", "/broken")
+        self.assertTrue(scheduler.wait(timeout=5))
+        self.assertEqual(sorted(self.rescans), [("driver", "/shots"), ("unused", "/broken")])
+        # The driver whose rescan failed is not polled
+        self.assertNotIn("unused", self.indexing_polls)
+        self.assertEqual([r.error for r in scheduler.results if r.driver_id == "unused"], ["Bad path"])
+
+    def test_wait_timeout(self):
+        """ Negative test - a driver which keeps indexing times out """
+        self.indexing_polls = {"driver": 1000}
+        self.assertFalse(rescan.wait_for_indexing("url", "group", "token", ["driver"], poll_interval=0.01, timeout=0.2))
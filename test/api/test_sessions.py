@@ -4,8 +4,13 @@ from athera.api import sessions
 import unittest
 import uuid
 import time
+import requests
 from requests import codes
 import os
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
 
 class SessionsTest(unittest.TestCase):
     @classmethod
@@ -187,3 +192,86 @@ class SessionsTest(unittest.TestCase):
             payload,
         )
         self.assertEqual(response.status_code, codes.bad_request)
+
+
+class WaitForSessionTest(unittest.TestCase):
+    """ Waiting logic, against a mocked get_user_sessions. These do not need a token. """
+    def setUp(self):
+        self.progress = {}
+        patcher = mock.patch.object(sessions, "get_user_sessions", side_effect=self.get_user_sessions)
+        self.get_user_sessions_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_user_sessions(self, base_url, group_id, token, user_id):
+        """ Every session moves one status further through its list on each request """
+        data = []
+        for session_id, statuses in self.progress.items():
+            index = min(self.get_user_sessions_mock.call_count - 1, len(statuses) - 1)
+            data.append({"id": session_id, "status": statuses[index]})
+        response = mock.Mock(status_code=codes.ok)
+        response.json.return_value = {"sessions": data}
+        return response
+
+    def test_check_transition(self):
+        """ Positive and negative tests of the session state machine """
+        self.assertTrue(sessions.check_transition("CREATED", "WAITING_FOR_CONTAINER"))
+        self.assertTrue(sessions.check_transition("HOST_ASSIGNMENT", "HOST_FAILURE"))
+        self.assertFalse(sessions.check_transition("READY", "HOST_ASSIGNMENT"))
+        self.assertFalse(sessions.check_transition("CONTAINER_FAILURE", "READY"))
+
+    def test_wait_for_sessions_shared_poll(self):
+        """ Positive test - many sessions are waited on with one request per poll """
+        lifecycle = ["CREATED", "HOST_ASSIGNMENT", "WAITING_FOR_CONTAINER", "READY"]
+        for i in range(100):
+            self.progress["session{}".format(i)] = lifecycle
+        self.progress["broken"] = ["CREATED", "CONTAINER_FAILURE"]
+
+        statuses = sessions.wait_for_sessions("url", "group", "token", list(self.progress), user_id="user",
+                                              timeout=10, phase_intervals={}, min_interval=0, max_interval=0, jitter=0)
+        self.assertEqual(self.get_user_sessions_mock.call_count, len(lifecycle))
+        self.assertEqual(statuses["session0"], "READY")
+        self.assertEqual(statuses["broken"], "CONTAINER_FAILURE")
+
+    def test_stop_sessions(self):
+        """ Positive test - sessions are stopped concurrently and waited on until terminated """
+        for i in range(10):
+            self.progress["session{}".format(i)] = ["READY", "TERMINATING", "TERMINATED"]
+        with mock.patch.object(sessions, "stop_session", return_value=mock.Mock(status_code=codes.ok)) as stop:
+            results = sessions.stop_sessions("url", "group", "token", list(self.progress), user_id="user",
+                                             rate=None, wait=True, timeout=10, min_interval=0, max_interval=0, jitter=0)
+        self.assertEqual(stop.call_count, 10)
+        self.assertEqual(self.get_user_sessions_mock.call_count, 3)
+        self.assertTrue(all(r.error is None and r.status == "TERMINATED" for r in results))
+
+    def test_stop_sessions_error(self):
+        """ Negative test - failed stop requests are reported and not waited on """
+        error = requests.ConnectionError("refused")
+        with mock.patch.object(sessions, "stop_session", side_effect=error):
+            results = sessions.stop_sessions("url", "group", "token", ["session"], rate=None, wait=True, timeout=10)
+        self.assertEqual(results[0].error, "refused")
+        self.assertIsNone(results[0].status)
+        self.assertEqual(self.get_user_sessions_mock.call_count, 0)
+
+    def test_session_watcher_terminal(self):
+        """ Positive test - the terminal statuses of the session watcher can be overridden """
+        watcher = sessions.make_session_watcher("url", "group", "token", terminal={"session": ["TERMINATED"]})
+        self.assertEqual(watcher.terminal["session"], ["TERMINATED"])
+        self.assertIn("READY", sessions.make_session_watcher("url", "group", "token").terminal["session"])
+
+    def test_wait_for_session_timeout(self):
+        """ Negative test - a session stuck pending is reported with its pending status """
+        self.progress["stuck"] = ["CREATED", "HOST_ASSIGNMENT"]
+        status = sessions.wait_for_session("url", "group", "token", "stuck", user_id="user",
+                                           timeout=0.2, min_interval=0.01, max_interval=0.01, phase_intervals={})
+        self.assertIn(status, sessions.pending_status)
+
+    def test_phase_intervals(self):
+        """ Positive test - polling is slower during host assignment than waiting for the container """
+        watcher = sessions.make_session_watcher("url", "group", "token")
+        watcher.watch_session("session", "user")
+        self.progress["session"] = ["HOST_ASSIGNMENT", "WAITING_FOR_CONTAINER"]
+        watcher.poll()
+        self.assertEqual(watcher.interval, sessions.pending_poll_interval["HOST_ASSIGNMENT"])
+        watcher.poll()
+        self.assertEqual(watcher.interval, sessions.pending_poll_interval["WAITING_FOR_CONTAINER"])
+
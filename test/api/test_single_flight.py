@@ -0,0 +1,106 @@
+import settings
+from athera.api import common, compute, groups, single_flight
+
+import threading
+import time
+import unittest
+import requests
+from requests import codes
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
+
+
+def make_response(content=b'{"id": "job"}'):
+    response = requests.Response()
+    response.status_code = codes.ok
+    response._content = content
+    return response
+
+
+class SingleFlightTest(unittest.TestCase):
+    """ Coalescing against a mocked, slow transport. These do not need a token. """
+    def setUp(self):
+        self.sent = []
+        self.release = threading.Event()
+        patcher = mock.patch.object(common, "send", side_effect=self.send)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(single_flight.disable)
+
+    def send(self, method, url, **kwargs):
+        self.sent.append(url)
+        self.release.wait(5)
+        return make_response()
+
+    def run_concurrently(self, func, count):
+        results = [None] * count
+
+        def run(i):
+            results[i] = func()
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for t in threads:
+            t.start()
+        # Let every thread join the flight before the response arrives
+        time.sleep(0.2)
+        self.release.set()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_identical_requests_share_one(self):
+        """ Positive test - concurrent identical GETs send one request and share its parsed json """
+        flights = single_flight.enable()
+        responses = self.run_concurrently(lambda: compute.get_job("http://base", "group", "token", "job"), 10)
+        self.assertEqual(len(self.sent), 1)
+        self.assertIs(responses[0].json(), responses[9].json())
+        stats = flights.stats()
+        self.assertEqual((stats["calls"], stats["flights"], stats["collapsed"]), (10, 1, 9))
+        self.assertEqual(stats["routes"][compute.route_job]["collapsed"], 9)
+
+    def test_different_requests_not_shared(self):
+        """ Negative test - other groups and tokens send their own requests """
+        single_flight.enable()
+        arguments = [("group", "token"), ("other_group", "token"), ("group", "other_token")]
+        calls = iter(arguments * 2)
+        lock = threading.Lock()
+
+        def get():
+            with lock:
+                group_id, token = next(calls)
+            return groups.get_group("http://base", group_id, token, "group")
+        self.run_concurrently(get, 6)
+        self.assertEqual(len(self.sent), 3)
+
+    def test_disabled(self):
+        """ Negative test - without enable() every call is sent """
+        self.run_concurrently(lambda: compute.get_job("http://base", "group", "token", "job"), 3)
+        self.assertEqual(len(self.sent), 3)
+
+    def test_errors_shared(self):
+        """ Negative test - an error is raised to every caller of the flight """
+        flights = single_flight.SingleFlight()
+        started = threading.Event()
+        errors = []
+
+        def fail():
+            started.set()
+            time.sleep(0.2)
+            raise ValueError("failed")
+
+        def call():
+            try:
+                flights.do("key", fail)
+            except ValueError as e:
+                errors.append(e)
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call)
+        follower.start()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(flights.stats()["collapsed"], 1)
+        self.assertEqual(flights.flights, {})
@@ -0,0 +1,136 @@
+import settings
+from athera.api import compute, sessions, watch
+
+import asyncio
+import unittest
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
+
+
+def make_response(data, status_code=200):
+    response = mock.Mock(status_code=status_code)
+    response.json.return_value = data
+    return response
+
+
+class FakeApi(object):
+    """ Serves job, part and session statuses which advance one step on every poll """
+    def __init__(self, job_statuses, part_statuses=None, session_statuses=None):
+        self.job_statuses = job_statuses
+        self.part_statuses = part_statuses or {}
+        self.session_statuses = session_statuses or {}
+        self.step = 0
+        self.calls = []
+
+    def current(self, statuses):
+        return statuses[min(self.step, len(statuses) - 1)]
+
+    def get_jobs(self, base_url, group_id, token):
+        self.calls.append("get_jobs")
+        return make_response({"jobs": [{"id": j, "status": self.current(s)} for j, s in self.job_statuses.items()]})
+
+    def get_job(self, base_url, group_id, token, job_id):
+        self.calls.append("get_job")
+        return make_response({"id": job_id, "status": self.current(self.job_statuses[job_id])})
+
+    def get_parts(self, base_url, group_id, token, job_id):
+        self.calls.append("get_parts")
+        parts = self.part_statuses.get(job_id, {})
+        return make_response({"parts": [{"id": p, "status": self.current(s)} for p, s in parts.items()]})
+
+    def get_session(self, base_url, group_id, token, session_id):
+        self.calls.append("get_session")
+        return make_response({"id": session_id, "status": self.current(self.session_statuses[session_id])})
+
+    def patch(self):
+        patches = [
+            mock.patch.object(compute, "get_jobs", side_effect=self.get_jobs),
+            mock.patch.object(compute, "get_job", side_effect=self.get_job),
+            mock.patch.object(compute, "get_parts", side_effect=self.get_parts),
+            mock.patch.object(sessions, "get_session", side_effect=self.get_session),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+
+class WatcherTest(unittest.TestCase):
+    def make_watcher(self, api):
+        api.addCleanup = self.addCleanup
+        api.patch()
+        w = watch.Watcher("url", "group", "token", min_interval=0, max_interval=0, jitter=0)
+        w.add_callback(lambda event: setattr(api, "step", api.step + 1) if event.kind == watch.KIND_JOB else None)
+        return w
+
+    def test_sweep_deduplicates_requests(self):
+        """ Positive test - many jobs are polled with one get_jobs call """
+        statuses = dict(("job{}".format(i), ["CREATED", "COMPLETE"]) for i in range(10))
+        api = FakeApi(statuses)
+        w = self.make_watcher(api)
+        for job_id in statuses:
+            w.watch_job(job_id)
+
+        events = list(w.events(timeout=5))
+        self.assertEqual(len(events), 20)
+        self.assertEqual(api.calls, ["get_jobs", "get_jobs"])
+        self.assertTrue(w.is_done())
+
+    def test_transitions_and_parts(self):
+        """ Positive test - each status change of a job and its parts is reported once """
+        api = FakeApi(
+            {"job": ["CREATED", "ACTIVE", "COMPLETE"]},
+            {"job": {"part1": ["CREATED", "ACTIVE", "COMPLETE"], "part2": ["CREATED", "CREATED", "FAILED"]}},
+        )
+        w = self.make_watcher(api)
+        w.watch_parts("job")
+        events = list(w.events(timeout=5))
+
+        job_events = [(e.old_status, e.new_status) for e in events if e.kind == watch.KIND_JOB]
+        self.assertEqual(job_events, [(None, "CREATED"), ("CREATED", "ACTIVE"), ("ACTIVE", "COMPLETE")])
+        self.assertEqual(w.status(watch.KIND_PART, "part2"), "FAILED")
+        self.assertEqual(len([e for e in events if e.id == "part2"]), 2)
+
+    def test_unrecognised_status(self):
+        """ Negative test - a status which is neither known nor terminal is warned about once """
+        api = FakeApi({"job": ["CREATED", "ARCHIVED"]})
+        w = self.make_watcher(api)
+        w.watch_job("job")
+        with self.assertLogs("athera.api.watch", "WARNING") as logs:
+            self.assertFalse(w.wait(timeout=0.2))
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("'ARCHIVED'", logs.output[0])
+
+        w = watch.Watcher("url", "group", "token", min_interval=0, jitter=0, terminal={watch.KIND_JOB: ["ARCHIVED"]})
+        w.watch_job("job")
+        self.assertTrue(w.wait(timeout=5))
+
+    def test_async_events(self):
+        """ Positive test - the async iterator yields the same events """
+        api = FakeApi({}, session_statuses={"session": ["CREATED", "READY", "TERMINATED"]})
+        w = self.make_watcher(api)
+        w.add_callback(lambda event: setattr(api, "step", api.step + 1))
+        w.watch_session("session")
+
+        async def collect():
+            return [e.new_status async for e in w.async_events(timeout=5)]
+
+        self.assertEqual(asyncio.run(collect()), ["CREATED", "READY", "TERMINATED"])
+
+    def test_backoff(self):
+        """ Positive test - the interval grows while nothing changes and resets on a change """
+        api = FakeApi({"job": ["CREATED"]})
+        api.addCleanup = self.addCleanup
+        api.patch()
+        w = watch.Watcher("url", "group", "token", min_interval=1, max_interval=4, backoff=2, jitter=0)
+        w.watch_job("job")
+        w.poll()
+        self.assertEqual(w.interval, 1)
+        w.poll()
+        w.poll()
+        w.poll()
+        self.assertEqual(w.interval, 4)
+        api.job_statuses["job"] = ["COMPLETE"]
+        w.poll()
+        self.assertEqual(w.interval, 1)
@@ -0,0 +1,77 @@
+import settings
+from athera import retry
+from athera.sync.fake_server import FakeSiriusServer
+
+import grpc
+import io
+import os
+import time
+import unittest
+
+
+class FakeSiriusTest(unittest.TestCase):
+    """ The sync client against the in-process Sirius stand-in. These do not need a token or network access. """
+    def setUp(self):
+        retry.configure(policy=retry.RetryPolicy(max_attempts=4, initial_backoff=0))
+        self.addCleanup(retry.reset)
+        self.server = FakeSiriusServer(mounts=["mount", "other"]).start()
+        self.addCleanup(self.server.stop)
+        self.client = self.server.client()
+
+    def test_mounts(self):
+        """ Positive test - every mount is listed """
+        mounts, err = self.client.get_mounts("group")
+        self.assertIsNone(err)
+        self.assertEqual([m.id for m in mounts], ["mount", "other"])
+        self.assertEqual(mounts[0].mount_location, "/data/mount")
+
+    def test_client_attributes(self):
+        """ Positive test - a client given a channel has no url or credentials of its own """
+        self.assertEqual(self.client.region, self.server.address)
+        self.assertIsNone(self.client.url)
+        self.assertIsNone(self.client.credentials)
+
+    def test_upload_list_download(self):
+        """ Positive test - an uploaded file is listed and downloaded back intact """
+        data = os.urandom(3 * 1024 * 1024 + 17)
+        _, err = self.client.upload_file("group", "mount", io.BytesIO(data), "uploads/file.bin", chunk_size=1024 * 1024)
+        self.assertIsNone(err)
+
+        files = [(r.file.path, r.file.size) for r, err in self.client.get_files("group", "mount", "uploads")]
+        self.assertEqual(files, [("/uploads/file.bin", len(data))])
+
+        destination = io.BytesIO()
+        err = self.client.download_to_file("group", "mount", destination, path="uploads/file.bin")
+        self.assertIsNone(err)
+        self.assertEqual(destination.getvalue(), data)
+
+    def test_download_directory(self):
+        """ Negative test - downloading a directory is an error """
+        os.makedirs(self.server.local_path("mount", "folder"))
+        err = self.client.download_to_file("group", "mount", io.BytesIO(), path="folder")
+        self.assertIsNotNone(err)
+
+    def test_path_outside_mount(self):
+        """ Negative test - paths cannot escape their mount """
+        _, err = self.client.upload_file("group", "mount", io.BytesIO(b"data"), "../other/file.bin")
+        self.assertEqual(err.code(), grpc.StatusCode.PERMISSION_DENIED)
+
+    def test_injected_errors_are_retried(self):
+        """ Positive test - injected UNAVAILABLE errors are retried by the client """
+        self.server.servicer.fail_next(2)
+        _, err = self.client.upload_file("group", "mount", io.BytesIO(b"data"), "file.bin")
+        self.assertIsNone(err)
+        self.assertEqual(self.server.servicer.calls["FileUpload"], 3)
+
+        self.server.servicer.fail_next(1, grpc.StatusCode.NOT_FOUND)
+        mounts, err = self.client.get_mounts("group")
+        self.assertEqual(err.code(), grpc.StatusCode.NOT_FOUND)
+
+    def test_latency_and_bandwidth(self):
+        """ Positive test - transfers are slowed down as configured """
+        self.server.servicer.latency = 0.1
+        self.server.servicer.bandwidth = 1024 * 1024
+        start = time.time()
+        _, err = self.client.upload_file("group", "mount", io.BytesIO(b"x" * 512 * 1024), "file.bin")
+        self.assertIsNone(err)
+        self.assertGreaterEqual(time.time() - start, 0.55)
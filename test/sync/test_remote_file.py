@@ -0,0 +1,287 @@
+import settings
+from athera import retry
+from athera.sync.fake_server import FakeSiriusServer
+
+import grpc
+import io
+import os
+import tarfile
+import time
+import unittest
+
+KB = 1024
+
+
+class RemoteFileReaderTest(unittest.TestCase):
+    """ Client.open against the in-process Sirius stand-in. These do not need a token or network access. """
+    def setUp(self):
+        retry.configure(policy=retry.RetryPolicy(max_attempts=4, initial_backoff=0))
+        self.addCleanup(retry.reset)
+        self.server = FakeSiriusServer(mounts=["mount"]).start()
+        self.addCleanup(self.server.stop)
+        self.client = self.server.client()
+        self.data = os.urandom(100 * KB + 123)
+        self.write("shots/shot.bin", self.data)
+
+    def write(self, path, data):
+        local = self.server.local_path("mount", path)
+        if not os.path.isdir(os.path.dirname(local)):
+            os.makedirs(os.path.dirname(local))
+        with open(local, "wb") as f:
+            f.write(data)
+
+    def open(self, path="shots/shot.bin", **kwargs):
+        kwargs.setdefault("chunk_size", 4 * KB)
+        f, err = self.client.open("group", "mount", path, **kwargs)
+        self.assertIsNone(err)
+        self.addCleanup(f.close)
+        return f
+
+    def test_read_all(self):
+        """ Positive test - the whole file is read back intact, in one or many reads """
+        self.assertEqual(self.open().read(), self.data)
+        f = self.open()
+        chunks = iter(lambda: f.read(1000), b"")
+        self.assertEqual(b"".join(chunks), self.data)
+
+    def test_header_only(self):
+        """ Positive test - reading a header does not stream the whole file """
+        size = 32 * 1024 * KB
+        self.write("big.bin", b"\0" * size)
+        f = self.open("big.bin", chunk_size=64 * KB, read_ahead=2)
+        self.assertEqual(f.read(100), b"\0" * 100)
+        time.sleep(0.2)
+        # gRPC flow control lets the server send a few MB more than the blocks read ahead
+        self.assertLess(self.server.servicer.bytes_sent, size // 2)
+
+    def test_seek(self):
+        """ Positive test - seeking forwards and within the cache reuses the stream """
+        f = self.open(cache_blocks=64)
+        f.seek(50 * KB)
+        self.assertEqual(f.read(10), self.data[50 * KB:50 * KB + 10])
+        f.seek(-10, io.SEEK_END)
+        self.assertEqual(f.read(), self.data[-10:])
+        self.assertEqual(f.tell(), len(self.data))
+        f.seek(10)
+        self.assertEqual(f.read(10), self.data[10:20])
+        self.assertEqual(f.raw.streams, 1)
+        self.assertEqual(self.server.servicer.calls["FileContents"], 1)
+
+    def test_seek_past_cache(self):
+        """ Positive test - seeking back past the cache restarts the stream """
+        f = self.open(read_ahead=1, cache_blocks=2)
+        f.seek(90 * KB)
+        self.assertEqual(f.read(10), self.data[90 * KB:90 * KB + 10])
+        f.seek(0)
+        self.assertEqual(f.read(10), self.data[:10])
+        self.assertEqual(f.raw.streams, 2)
+
+    def test_empty_file(self):
+        """ Positive test - an empty file reads as empty """
+        self.write("empty.bin", b"")
+        f = self.open("empty.bin")
+        self.assertEqual(f.read(), b"")
+        self.assertEqual(f.seek(0, io.SEEK_END), 0)
+
+    def test_tarfile(self):
+        """ Positive test - tarfile reads a member without the rest of the archive """
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            for name, data in (("a.txt", b"first"), ("b.bin", os.urandom(200 * KB)), ("c.txt", b"last")):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        self.write("archive.tar", archive.getvalue())
+
+        with tarfile.open(fileobj=self.open("archive.tar"), mode="r:") as tar:
+            self.assertEqual(tar.extractfile("a.txt").read(), b"first")
+            self.assertEqual(tar.getnames(), ["a.txt", "b.bin", "c.txt"])
+
+    def test_retry(self):
+        """ Positive test - a failed stream is restarted as configured in athera.retry """
+        self.server.servicer.fail_next(2)
+        f = self.open()
+        self.assertEqual(f.read(), self.data)
+        self.assertEqual(self.server.servicer.calls["FileContents"], 3)
+
+    def test_missing_file(self):
+        """ Negative test - opening a missing file is an error """
+        f, err = self.client.open("group", "mount", "missing.bin")
+        self.assertIsNone(f)
+        self.assertEqual(err.code(), grpc.StatusCode.INVALID_ARGUMENT)
+
+    def test_closed(self):
+        """ Negative test - a closed file cannot be read """
+        f = self.open()
+        f.close()
+        self.assertRaises(ValueError, f.read)
+
+    def test_chunk_size(self):
+        """ Negative test - chunks are at most 1 MB """
+        self.assertRaises(ValueError, self.client.open, "group", "mount", "shots/shot.bin", chunk_size=2 * 1024 * 1024)
+
+
+class RemoteFileWriterTest(unittest.TestCase):
+    """ Client.open_write against the in-process Sirius stand-in. These do not need a token or network access. """
+    def setUp(self):
+        retry.configure(policy=retry.RetryPolicy(max_attempts=4, initial_backoff=0))
+        self.addCleanup(retry.reset)
+        self.server = FakeSiriusServer(mounts=["mount"]).start()
+        self.addCleanup(self.server.stop)
+        self.client = self.server.client()
+
+    def read(self, path):
+        with open(self.server.local_path("mount", path), "rb") as f:
+            return f.read()
+
+    def test_write(self):
+        """ Positive test - what is written, in writes of any size, is uploaded on close """
+        data = os.urandom(50 * KB + 7)
+        f = self.client.open_write("group", "mount", "out/data.bin", chunk_size=4 * KB, max_queue=2)
+        for start in range(0, len(data), 3000):
+            self.assertEqual(f.write(data[start:start + 3000]), len(data[start:start + 3000]))
+        self.assertEqual(f.tell(), len(data))
+        f.close()
+        self.assertEqual(self.read("out/data.bin"), data)
+        self.assertEqual(self.server.servicer.bytes_received, len(data))
+        self.assertRaises(ValueError, f.write, b"more")
+
+    def test_empty(self):
+        """ Positive test - closing without writing uploads an empty file """
+        with self.client.open_write("group", "mount", "empty.bin"):
+            pass
+        self.assertEqual(self.read("empty.bin"), b"")
+
+    def test_tarfile(self):
+        """ Positive test - a tar archive is streamed to the mount and read back """
+        with self.client.open_write("group", "mount", "archive.tar", chunk_size=16 * KB) as f:
+            with tarfile.open(fileobj=f, mode="w|") as tar:
+                info = tarfile.TarInfo("shot.bin")
+                info.size = 100 * KB
+                tar.addfile(info, io.BytesIO(b"\1" * info.size))
+
+        f, err = self.client.open("group", "mount", "archive.tar")
+        self.assertIsNone(err)
+        with tarfile.open(fileobj=f, mode="r:") as tar:
+            self.assertEqual(tar.extractfile("shot.bin").read(), b"\1" * 100 * KB)
+
+    def test_abort(self):
+        """ Negative test - an exception in the with block cancels the upload rather than completing it """
+        def fail():
+            with self.client.open_write("group", "mount", "data.bin", chunk_size=KB) as f:
+                f.write(b"x" * 10 * KB)
+                raise RuntimeError("Encoder crashed")
+            return f
+        try:
+            fail()
+        except RuntimeError:
+            pass
+        else:
+            self.fail("The exception was not raised")
+
+        f = self.client.open_write("group", "mount", "data.bin", chunk_size=KB)
+        f.write(b"x" * 10 * KB)
+        f.abort()
+        self.assertTrue(f.closed)
+        self.assertTrue(f.call.cancelled())
+        self.assertIsNotNone(f.error)
+
+    def test_failed_upload(self):
+        """ Negative test - a failed upload is not retried, and raises IOError on write and close """
+        self.server.servicer.fail_next(1)
+        f = self.client.open_write("group", "mount", "data.bin")
+        self.assertTrue(f.finished.wait(5))
+        self.assertRaises(IOError, f.write, b"data")
+        self.assertRaises(IOError, f.close)
+        self.assertTrue(f.closed)
+        self.assertEqual(self.server.servicer.calls["FileUpload"], 1)
+        self.assertFalse(os.path.exists(self.server.local_path("mount", "data.bin")))
+
+    def test_chunk_size(self):
+        """ Negative test - chunks are at most 1 MB """
+        self.assertRaises(ValueError, self.client.open_write, "group", "mount", "data.bin", chunk_size=2 * 1024 * 1024)
+
+
+class RemoteCopyTest(unittest.TestCase):
+    """ Client.copy_remote between in-process Sirius stand-ins. These do not need a token or network access. """
+    def setUp(self):
+        retry.configure(policy=retry.RetryPolicy(max_attempts=4, initial_backoff=0))
+        self.addCleanup(retry.reset)
+        self.server = FakeSiriusServer(mounts=["org", "project"]).start()
+        self.addCleanup(self.server.stop)
+        self.other_region = FakeSiriusServer(mounts=["project"]).start()
+        self.addCleanup(self.other_region.stop)
+        self.client = self.server.client()
+        self.data = os.urandom(50 * KB + 3)
+        with open(self.server.local_path("org", "shot.bin"), "wb") as f:
+            f.write(self.data)
+
+    def read(self, server, mount_id, path):
+        with open(server.local_path(mount_id, path), "rb") as f:
+            return f.read()
+
+    def test_copy_between_mounts(self):
+        """ Positive test - a file is copied to another mount, reporting the bytes copied """
+        copied = []
+        _, err = self.client.copy_remote("group", "org", "shot.bin", "project", "shots/shot.bin", chunk_size=4 * KB,
+                                         callback=copied.append)
+        self.assertIsNone(err)
+        self.assertEqual(self.read(self.server, "project", "shots/shot.bin"), self.data)
+        self.assertEqual(sum(copied), len(self.data))
+
+    def test_copy_across_regions(self):
+        """ Positive test - a file is copied through a client of another region """
+        _, err = self.client.copy_remote("group", "org", "shot.bin", "project", "shot.bin",
+                                         destination=self.other_region.client(), chunk_size=4 * KB, max_queue=1)
+        self.assertIsNone(err)
+        self.assertEqual(self.read(self.other_region, "project", "shot.bin"), self.data)
+        self.assertEqual(self.server.servicer.calls["FileUpload"], 0)
+
+    def test_copy_empty(self):
+        """ Positive test - an empty file is copied """
+        open(self.server.local_path("org", "empty.bin"), "wb").close()
+        _, err = self.client.copy_remote("group", "org", "empty.bin", "project", "empty.bin")
+        self.assertIsNone(err)
+        self.assertEqual(self.read(self.server, "project", "empty.bin"), b"")
+
+    def test_retry(self):
+        """ Positive test - the copy is restarted when either side fails """
+        self.server.servicer.fail_next(1)
+        self.other_region.servicer.fail_next(1)
+        copied = []
+        _, err = self.client.copy_remote("group", "org", "shot.bin", "project", "shot.bin",
+                                         destination=self.other_region.client(), callback=copied.append)
+        self.assertIsNone(err)
+        self.assertEqual(self.read(self.other_region, "project", "shot.bin"), self.data)
+        self.assertEqual(self.other_region.servicer.calls["FileUpload"], 2)
+        # Bytes reported by the failed attempt are taken back
+        self.assertIn(-len(self.data), copied)
+        self.assertEqual(sum(copied), len(self.data))
+
+    def test_failed_copy(self):
+        """ Negative test - once retries are exhausted, no bytes are left reported """
+        self.other_region.servicer.fail_next(4)
+        copied = []
+        _, err = self.client.copy_remote("group", "org", "shot.bin", "project", "shot.bin",
+                                         destination=self.other_region.client(), callback=copied.append)
+        self.assertIsNotNone(err)
+        self.assertEqual(sum(copied), 0)
+
+    def test_missing_source(self):
+        """ Negative test - a missing source is an error, and nothing is uploaded """
+        _, err = self.client.copy_remote("group", "org", "missing.bin", "project", "missing.bin")
+        self.assertEqual(err.code(), grpc.StatusCode.INVALID_ARGUMENT)
+        self.assertEqual(self.server.servicer.calls["FileUpload"], 0)
+
+    def test_copy_many(self):
+        """ Positive test - many files are copied concurrently, with a result each """
+        copies = [("org", "shot.bin", "project", "copies/{}.bin".format(i)) for i in range(8)]
+        copies.append(("org", "missing.bin", "project", "copies/missing.bin"))
+        results = self.client.copy_remote_files("group", copies, chunk_size=8 * KB, max_workers=4)
+        self.assertEqual([err is None for _, err in results], [True] * 8 + [False])
+        for i in range(8):
+            self.assertEqual(self.read(self.server, "project", "copies/{}.bin".format(i)), self.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import settings
+from athera.api import storage
+from athera.sync import client as sync_client
+from athera.sync.visibility import Visibility, VisibilityError
+
+import collections
+import io
+import threading
+import unittest
+from types import SimpleNamespace
+from requests import codes
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
+
+
+class FakeRegion(object):
+    """ A sync Client of another region, which sees the files of a directory once it has been listed 'delay' times """
+    def __init__(self, region, visible, delay=0):
+        self.region = region
+        self.token = "token"
+        self.visible = visible
+        self.delay = delay
+        self.listings = collections.Counter()
+        self.lock = threading.Lock()
+
+    def get_files(self, group_id, mount_id, path="/"):
+        with self.lock:
+            self.listings[path] += 1
+            ready = self.listings[path] > self.delay
+        for name in sorted(self.visible):
+            if ready and name.startswith(path + "/"):
+                yield SimpleNamespace(file=SimpleNamespace(path=name, name=name.rsplit("/", 1)[1])), None
+
+
+class VisibilityTest(unittest.TestCase):
+    """ Cross-region checks against mocked drivers and clients. These do not need a token. """
+    def setUp(self):
+        self.rescans = []
+        drivers = mock.Mock(status_code=codes.ok)
+        drivers.json.return_value = {"drivers": [{"id": "driver", "mounts": [{"id": "mount"}]}]}
+        driver = mock.Mock(status_code=codes.ok)
+        driver.json.return_value = {"id": "driver", "statuses": [{"path": "/", "indexingInProgress": False}]}
+        patchers = [
+            mock.patch.object(storage, "get_drivers", return_value=drivers),
+            mock.patch.object(storage, "get_driver", return_value=driver),
+            mock.patch.object(storage, "rescan_driver", side_effect=self.rescan_driver),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def rescan_driver(self, base_url, group_id, token, driver_id, path):
+        self.rescans.append((driver_id, path))
+        return mock.Mock(status_code=codes.ok)
+
+    def make_client(self):
+        client = sync_client.Client.__new__(sync_client.Client)
+        client.token = "token"
+        client.upload_file = mock.Mock(return_value=(object(), None))
+        return client
+
+    def test_upload_files_visible(self):
+        """ Positive test - uploads are rescanned once per directory and checked in every region """
+        paths = ["shots/a/{}.exr".format(i) for i in range(20)] + ["shots/b/0.exr"]
+        region = FakeRegion("us-west1", ["/" + p for p in paths], delay=1)
+        visibility = Visibility("url", [region], poll_interval=0.01, timeout=5)
+        client = self.make_client()
+        uploads = [(io.BytesIO(b"data"), p) for p in paths]
+
+        results, err = sync_client.Client.upload_files(client, "group", "mount", uploads, visibility=visibility)
+        self.assertIsNone(err)
+        self.assertEqual(len(results), 21)
+        self.assertEqual(sorted(self.rescans), [("driver", "/shots/a"), ("driver", "/shots/b")])
+        # Each directory is listed once before the files are visible, and once after
+        self.assertEqual(region.listings, {"/shots/a": 2, "/shots/b": 2})
+
+    def test_not_visible(self):
+        """ Negative test - files missing from a region are reported once the timeout expires """
+        region = FakeRegion("australia-southeast1", ["/shots/a/0.exr"])
+        visibility = Visibility("url", [region], poll_interval=0.01, timeout=0.1)
+        client = self.make_client()
+        uploads = [(io.BytesIO(b"data"), "shots/a/0.exr"), (io.BytesIO(b"data"), "shots/a/1.exr")]
+
+        _, err = sync_client.Client.upload_files(client, "group", "mount", uploads, visibility=visibility)
+        self.assertIsInstance(err, VisibilityError)
+        self.assertEqual(err.missing, {"australia-southeast1": ["/shots/a/1.exr"]})
@@ -0,0 +1,197 @@
+import settings
+from athera import cli, retry
+from athera.sync.fake_server import FakeSiriusServer
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
+
+
+class CliTest(unittest.TestCase):
+    """ The athera command against the in-process Sirius stand-in. These do not need a token or network access. """
+    def setUp(self):
+        retry.configure(policy=retry.RetryPolicy(max_attempts=4, initial_backoff=0))
+        self.addCleanup(retry.reset)
+        self.server = FakeSiriusServer(mounts=["mount"]).start()
+        self.addCleanup(self.server.stop)
+        self.local = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.local)
+
+    def write(self, root, path, data):
+        path = os.path.join(root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def read(self, root, path):
+        with open(os.path.join(root, path), "rb") as f:
+            return f.read()
+
+    def athera(self, *argv, **kwargs):
+        """ (exit status, stdout, stderr) of the command """
+        out, err = io.StringIO(), io.StringIO()
+        client = kwargs.get("client") or self.server.client()
+        status = cli.main(["--token", "token", "--group", "group"] + list(argv), client, out, err)
+        return status, out.getvalue(), err.getvalue()
+
+    def test_parse_location(self):
+        """ Positive test - remote locations are split into mount and path """
+        self.assertEqual(cli.parse_location("athera://mount/shots//a.exr"), ("mount", "shots/a.exr"))
+        self.assertEqual(cli.parse_location("athera://mount"), ("mount", ""))
+        self.assertEqual(cli.parse_location("./shots"), (None, "./shots"))
+
+    def test_selected(self):
+        """ Positive test - globs match relative paths and file names """
+        self.assertTrue(cli.selected("shots/a.exr", include=["*.exr"]))
+        self.assertFalse(cli.selected("shots/a.tmp", include=["*.exr"]))
+        self.assertFalse(cli.selected("shots/a.exr", exclude=["shots/*"]))
+        self.assertTrue(cli.selected("shots/a.exr"))
+
+    def test_upload_download(self):
+        """ Positive test - a directory is uploaded and downloaded back, with its json summary """
+        source = os.path.join(self.local, "source")
+        self.write(source, "a.exr", b"a" * 1000)
+        self.write(source, "sub/b.exr", b"b" * 2000)
+        self.write(source, "sub/c.tmp", b"c")
+
+        status, out, _ = self.athera("cp", "-R", source, "athera://mount/shots", "--exclude", "*.tmp", "--json", "-q")
+        self.assertEqual(status, 0)
+        summary = json.loads(out)
+        self.assertEqual((summary["files"], summary["copied"], summary["failed"], summary["bytes"]), (2, 2, 0, 3000))
+        self.assertEqual(self.read(self.server.root, "mount/shots/sub/b.exr"), b"b" * 2000)
+        self.assertFalse(os.path.exists(self.server.local_path("mount", "shots/sub/c.tmp")))
+
+        destination = os.path.join(self.local, "destination")
+        status, _, _ = self.athera("cp", "-R", "athera://mount/shots", destination, "-q", "-j", "2")
+        self.assertEqual(status, 0)
+        self.assertEqual(self.read(destination, "a.exr"), b"a" * 1000)
+        self.assertEqual(self.read(destination, "sub/b.exr"), b"b" * 2000)
+
+    def test_single_file(self):
+        """ Positive test - a single file is copied into the destination directory """
+        self.write(self.server.root, "mount/shots/plate.exr", b"plate")
+        status, out, _ = self.athera("cp", "athera://mount/shots/plate.exr", self.local, "-q")
+        self.assertEqual(status, 0)
+        self.assertIn("Copied 1 files", out)
+        self.assertEqual(self.read(self.local, "plate.exr"), b"plate")
+
+    def test_directory_needs_recursive(self):
+        """ Negative test - copying a directory without -R is an error """
+        self.write(self.server.root, "mount/shots/plate.exr", b"plate")
+        status, _, err = self.athera("cp", "athera://mount/shots", self.local)
+        self.assertEqual(status, 2)
+        self.assertIn("use -R", err)
+
+    def test_missing_source(self):
+        """ Negative test - a missing remote source is an error """
+        status, _, err = self.athera("cp", "athera://mount/missing.exr", self.local)
+        self.assertEqual(status, 2)
+        self.assertIn("No such file", err)
+
+    def test_sync_skips_existing(self):
+        """ Positive test - sync only copies the files missing from the destination or differing in size """
+        source = os.path.join(self.local, "source")
+        self.write(source, "a.exr", b"a")
+        self.write(source, "b.exr", b"b")
+        self.write(self.server.root, "mount/shots/a.exr", b"a")
+        self.write(self.server.root, "mount/shots/b.exr", b"old b")
+
+        status, out, _ = self.athera("sync", source, "athera://mount/shots", "--json", "-q")
+        self.assertEqual(status, 0)
+        summary = json.loads(out)
+        self.assertEqual((summary["copied"], summary["skipped"]), (1, 1))
+        self.assertEqual(self.read(self.server.root, "mount/shots/b.exr"), b"b")
+        self.assertEqual(self.server.servicer.calls["FileUpload"], 1)
+
+    def test_dry_run(self):
+        """ Positive test - a dry run lists the files it would copy, without copying them """
+        source = os.path.join(self.local, "source")
+        self.write(source, "a.exr", b"a")
+        status, out, _ = self.athera("cp", "-R", source, "athera://mount", "--dry-run")
+        self.assertEqual(status, 0)
+        self.assertTrue(out.startswith("a.exr\nWould copy 1 files"))
+        self.assertEqual(self.server.servicer.calls["FileUpload"], 0)
+
+    def test_resume(self):
+        """ Positive test - files recorded in the journal are not copied again """
+        source = os.path.join(self.local, "source")
+        self.write(source, "a.exr", b"a")
+        self.write(source, "b.exr", b"b")
+        journal = os.path.join(self.local, "journal")
+        with open(journal, "w") as f:
+            f.write(json.dumps({"path": "a.exr", "size": 1}) + "\n" + '{"path": "b.e')
+
+        status, out, _ = self.athera("cp", "-R", source, "athera://mount", "--resume", journal, "--json", "-q")
+        self.assertEqual(status, 0)
+        self.assertEqual(json.loads(out)["copied"], 1)
+        self.assertEqual(self.server.servicer.calls["FileUpload"], 1)
+
+        status, out, _ = self.athera("cp", "-R", source, "athera://mount", "--resume", journal, "--json", "-q")
+        self.assertEqual(json.loads(out)["copied"], 0)
+
+    def test_failed_download(self):
+        """ Negative test - a failed download is reported and leaves no partial file """
+        self.write(self.server.root, "mount/plate.exr", b"plate")
+        client = self.server.client()
+        with mock.patch.object(client, "download_to_file", return_value=IOError("Connection lost")):
+            status, out, err = self.athera("cp", "athera://mount/plate.exr", self.local, "--json", "-q", client=client)
+        self.assertEqual(status, 1)
+        self.assertEqual(json.loads(out)["failed"], 1)
+        self.assertIn("Failed plate.exr", err)
+        self.assertEqual(os.listdir(self.local), [])
+
+    def test_failed_write(self):
+        """ Negative test - an error writing a download, eg a full disk, leaves no partial file """
+        self.write(self.server.root, "mount/plate.exr", b"plate")
+        client = self.server.client()
+        with mock.patch.object(client, "download_to_file", side_effect=OSError(28, "No space left on device")):
+            status, _, err = self.athera("cp", "athera://mount/plate.exr", self.local, "-q", client=client)
+        self.assertEqual(status, 1)
+        self.assertIn("No space left", err)
+        self.assertEqual(os.listdir(self.local), [])
+
+    def test_missing_dependency(self):
+        """ Negative test - a missing dependency is reported as a usage error """
+        client = self.server.client()
+        with mock.patch.object(client, "get_mounts", side_effect=ImportError("No module named 'grpc'")):
+            status, _, err = self.athera("ls", "athera://mount", client=client)
+        self.assertEqual(status, 2)
+        self.assertIn("missing dependency", err)
+
+    def test_ls(self):
+        """ Positive test - ls -R lists every file and directory """
+        self.write(self.server.root, "mount/shots/a.exr", b"a")
+        self.write(self.server.root, "mount/shots/sub/b.exr", b"bb")
+        status, out, _ = self.athera("ls", "-R", "athera://mount/shots")
+        self.assertEqual(status, 0)
+        self.assertEqual(out.split(), ["a.exr", "sub/", "sub/b.exr"])
+
+        status, out, _ = self.athera("ls", "athera://mount/shots", "--json")
+        self.assertEqual([e["path"] for e in json.loads(out)], ["a.exr", "sub/"])
+
+    def test_remote_to_remote(self):
+        """ Positive test - files are copied between mounts without local files """
+        self.write(self.server.root, "mount/library/a.exr", b"a" * 100)
+        self.write(self.server.root, "mount/library/sub/b.exr", b"b" * 200)
+        status, out, _ = self.athera("cp", "-R", "athera://mount/library", "athera://mount/project", "--json", "-q")
+        self.assertEqual(status, 0)
+        self.assertEqual(json.loads(out)["bytes"], 300)
+        self.assertEqual(self.read(self.server.root, "mount/project/sub/b.exr"), b"b" * 200)
+        self.assertEqual(os.listdir(self.local), [])
+
+    def test_local_to_local(self):
+        """ Negative test - one side must be remote """
+        status, _, err = self.athera("cp", self.local, self.local)
+        self.assertEqual(status, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
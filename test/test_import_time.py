@@ -0,0 +1,105 @@
+import os
+import sys
+import subprocess
+import unittest
+
+# Allow imports from project root
+current_dir = os.path.dirname(os.path.realpath(__file__))
+root_dir = os.path.abspath(os.path.join(current_dir, ".."))
+
+# Modules which must not be loaded just by importing athera
+HEAVY_MODULES = ("grpc", "flask", "requests_oauthlib", "multiprocessing", "google.protobuf")
+
+# Cumulative import time allowed for the athera modules below, in microseconds, requests included as it is needed by
+# every api call. Override for slow CI machines.
+IMPORT_TIME_BUDGET_US = int(os.getenv("ATHERA_IMPORT_TIME_BUDGET_US", 250000))
+
+IMPORT_STATEMENT = "import athera.api.groups, athera.api.compute, athera.auth.generate_jwt, athera.sync.client"
+
+# Concurrent calls as the very first use of the package, each run in a fresh interpreter
+SUBMIT_JOBS_SCRIPT = """
+from athera.api import compute
+from athera.api.fake_server import FakeApiServer
+with FakeApiServer() as server:
+    payloads = [compute.make_job_request("user", "group", "app", "/data/scene", "job{}".format(i),
+                                         1, 10, 1, "europe-west1", {}) for i in range(16)]
+    results = compute.submit_jobs(server.base_url, "group", "token", payloads, max_workers=16, rate=None)
+    assert all(result.job_id and not result.error for result in results), results
+"""
+
+UPLOAD_FILES_SCRIPT = """
+import io
+from athera.sync.fake_server import FakeSiriusServer
+server = FakeSiriusServer(mounts=["mount"]).start()
+try:
+    uploads = [(io.BytesIO(b"data"), "uploads/{}.bin".format(i)) for i in range(16)]
+    results, err = server.client().upload_files("group", "mount", uploads, max_workers=16)
+    assert err is None and all(e is None for _, e in results), results
+finally:
+    server.stop()
+"""
+
+
+def run_script(script):
+    """
+    Run the script in a fresh interpreter, returning the CompletedProcess.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root_dir, env.get("PYTHONPATH")]))
+    return subprocess.run(
+        [sys.executable, "-c", script],
+        stderr=subprocess.PIPE, stdout=subprocess.PIPE, env=env, universal_newlines=True,
+    )
+
+
+def measure_import_time(statement):
+    """
+    Run the import statement in a fresh interpreter with -X importtime.
+    Returns a dict of module name -> (self us, cumulative us).
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root_dir, env.get("PYTHONPATH")]))
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        stderr=subprocess.PIPE, stdout=subprocess.PIPE, env=env, universal_newlines=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError("Import failed: {}".format(process.stderr))
+
+    timings = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "-X importtime requires Python 3.7")
+class ImportTimeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.timings = measure_import_time(IMPORT_STATEMENT)
+
+    def test_heavy_modules_not_imported(self):
+        """ Importing athera should defer heavy dependencies until first use """
+        for name in HEAVY_MODULES:
+            self.assertNotIn(name, self.timings, "{} was imported eagerly".format(name))
+
+    def test_import_time_budget(self):
+        """ Cumulative time of the top-level athera imports stays within budget """
+        total = sum(cumulative for name, (self_us, cumulative) in self.timings.items()
+                    if name in IMPORT_STATEMENT[len("import "):].split(", "))
+        self.assertLess(total, IMPORT_TIME_BUDGET_US, "athera import took {}us".format(total))
+
+
+class FirstUseTest(unittest.TestCase):
+    def test_concurrent_submit_jobs(self):
+        """ Positive test - submit_jobs with many workers as the first use of athera """
+        process = run_script(SUBMIT_JOBS_SCRIPT)
+        self.assertEqual(process.returncode, 0, process.stderr)
+
+    def test_concurrent_upload_files(self):
+        """ Positive test - upload_files with many workers as the first use of athera """
+        process = run_script(UPLOAD_FILES_SCRIPT)
+        self.assertEqual(process.returncode, 0, process.stderr)
@@ -0,0 +1,156 @@
+import settings
+from athera import retry
+from athera.api import common, compute
+
+import unittest
+import grpc
+import requests
+from requests import codes
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    import mock
+
+FAST = retry.RetryPolicy(max_attempts=4, initial_backoff=0, max_elapsed=10)
+
+
+def make_response(status_code, headers=None):
+    response = mock.Mock(status_code=status_code)
+    response.headers = headers or {}
+    return response
+
+
+class FakeRpcError(grpc.RpcError):
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+
+class RetryTest(unittest.TestCase):
+    """ Retry and circuit breaker logic. These do not need a token. """
+    def setUp(self):
+        retry.configure(policy=FAST, failure_threshold=10, reset_timeout=60)
+        retry.counters.reset()
+        self.addCleanup(retry.reset)
+
+    def test_delay_bounds(self):
+        """ Positive test - delays grow exponentially up to the cap, and honour Retry-After """
+        policy = retry.RetryPolicy(initial_backoff=1, multiplier=2, max_backoff=5)
+        for _ in range(100):
+            self.assertLessEqual(policy.delay(1), 1)
+            self.assertLessEqual(policy.delay(10), 5)
+        self.assertGreaterEqual(policy.delay(1, retry_after=7), 7)
+
+    def test_http_retry_then_success(self):
+        """ Positive test - 503s are retried until the call succeeds """
+        responses = [make_response(503), make_response(502), make_response(codes.ok)]
+        with mock.patch.object(common, "send", side_effect=responses):
+            response = compute.get_job("url", "group", "token", "job")
+        self.assertEqual(response.status_code, codes.ok)
+        stats = retry.stats()[compute.route_job]
+        self.assertEqual((stats["attempts"], stats["retries"]), (3, 2))
+
+    def test_http_client_errors_not_retried(self):
+        """ Negative test - 4xx and 500 responses are returned straight away """
+        for status_code in (codes.not_found, codes.internal_server_error):
+            with mock.patch.object(common, "send", return_value=make_response(status_code)) as send:
+                response = compute.get_job("url", "group", "token", "job")
+            self.assertEqual(response.status_code, status_code)
+            self.assertEqual(send.call_count, 1)
+
+    def test_non_idempotent(self):
+        """ Negative test - create_job is retried on 503 (not processed) but not on 502 """
+        with mock.patch.object(common, "send", side_effect=[make_response(503), make_response(codes.ok)]) as send:
+            compute.create_job("url", "group", "token", {})
+        self.assertEqual(send.call_count, 2)
+        with mock.patch.object(common, "send", side_effect=[make_response(502), make_response(codes.ok)]) as send:
+            response = compute.create_job("url", "group", "token", {})
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(response.status_code, 502)
+
+    def test_stop_job_is_idempotent(self):
+        """ Positive test - stop_job is retried on 502 """
+        with mock.patch.object(common, "send", side_effect=[make_response(502), make_response(codes.ok)]) as send:
+            compute.stop_job("url", "group", "token", "job")
+        self.assertEqual(send.call_count, 2)
+
+    def test_connection_error(self):
+        """ Positive test - connection errors are retried, then raised """
+        error = requests.ConnectionError("refused")
+        with mock.patch.object(common, "send", side_effect=error) as send:
+            with self.assertRaises(requests.ConnectionError):
+                compute.get_job("url", "group", "token", "job")
+        self.assertEqual(send.call_count, FAST.max_attempts)
+
+    def test_circuit_breaker(self):
+        """ Negative test - repeated failures open the circuit, which fails fast until it resets """
+        retry.configure(policy=retry.NO_RETRY, failure_threshold=3, reset_timeout=60)
+        with mock.patch.object(common, "send", return_value=make_response(503)) as send:
+            for _ in range(3):
+                compute.get_parts("url", "group", "token", "job")
+            with self.assertRaises(retry.CircuitOpenError):
+                compute.get_parts("url", "group", "token", "job")
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual(retry.stats()[compute.route_parts]["circuits"], {"group": retry.CircuitBreaker.OPEN})
+
+        # Other groups have their own circuit
+        with mock.patch.object(common, "send", return_value=make_response(codes.ok)):
+            self.assertEqual(compute.get_parts("url", "other group", "token", "job").status_code, codes.ok)
+
+        # After the timeout a trial call is let through, and its success closes the circuit
+        breaker = retry.get_breaker(compute.route_parts, "group")
+        breaker.opened_at -= 60
+        with mock.patch.object(common, "send", return_value=make_response(codes.ok)):
+            compute.get_parts("url", "group", "token", "job")
+        self.assertEqual(breaker.state, retry.CircuitBreaker.CLOSED)
+
+    def test_circuit_breaker_counts_calls(self):
+        """ Positive test - a call counts as one failure however many attempts it made """
+        retry.configure(failure_threshold=2)
+        with mock.patch.object(common, "send", return_value=make_response(503)) as send:
+            compute.get_job("url", "group", "token", "job")
+            self.assertEqual(send.call_count, FAST.max_attempts)
+            self.assertEqual(retry.get_breaker(compute.route_job, "group").state, retry.CircuitBreaker.CLOSED)
+            compute.get_job("url", "group", "token", "job")
+            with self.assertRaises(retry.CircuitOpenError):
+                compute.get_job("url", "group", "token", "job")
+
+    def test_circuit_breaking_off_by_default(self):
+        """ Positive test - without a failure_threshold, failures never stop later calls """
+        retry.reset()
+        retry.configure(policy=FAST)
+        with mock.patch.object(common, "send", return_value=make_response(503)):
+            for _ in range(20):
+                compute.get_job("url", "group", "token", "job")
+        self.assertIsNone(retry.get_breaker(compute.route_job, "group"))
+        with mock.patch.object(common, "send", return_value=make_response(codes.ok)):
+            self.assertEqual(compute.get_job("url", "group", "token", "job").status_code, codes.ok)
+
+    def test_reset(self):
+        """ Positive test - reset restores the defaults and clears the counters """
+        with mock.patch.object(common, "send", return_value=make_response(codes.ok)):
+            compute.get_job("url", "group", "token", "job")
+        retry.reset()
+        self.assertIsNone(retry.failure_threshold)
+        self.assertEqual(retry.default_policy.max_attempts, retry.RetryPolicy().max_attempts)
+        self.assertEqual(retry.stats(), {})
+
+    def test_grpc_classification(self):
+        """ Positive test - gRPC codes are classified like their HTTP equivalents """
+        self.assertEqual(retry.classify_grpc(None, FakeRpcError(grpc.StatusCode.UNAVAILABLE)),
+                         retry.Outcome(True, True, True, None))
+        self.assertEqual(retry.classify_grpc(None, FakeRpcError(grpc.StatusCode.DEADLINE_EXCEEDED)),
+                         retry.Outcome(True, True, False, None))
+        self.assertFalse(retry.classify_grpc(None, FakeRpcError(grpc.StatusCode.NOT_FOUND)).retryable)
+
+    def test_grpc_call(self):
+        """ Positive test - the sync client retries unavailable calls """
+        from athera.sync.client import Client
+        client = Client("europe-west1", "token")
+        client.stub = mock.Mock()
+        client.stub.Mounts.side_effect = [FakeRpcError(grpc.StatusCode.UNAVAILABLE), mock.Mock(mounts=["mount"])]
+        mounts, err = client.get_mounts("group")
+        self.assertIsNone(err)
+        self.assertEqual(mounts, ["mount"])